@@ -18,25 +18,70 @@
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
 import os
-import tempfile
-from flask import Flask, Blueprint, redirect, render_template, url_for
-from flask_bootstrap import Bootstrap
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_login import LoginManager
-from flask_httpauth import HTTPTokenAuth
-from jinja2 import Template, contextfilter
-from epydemicarchive.metadata import AnalyserChain
-
-
-# Instanciate all the extensions
-bootstrap = Bootstrap()
-db = SQLAlchemy()
-migrate = Migrate()
-login = LoginManager()
-login.login_view='auth.login'
-tokenauth = HTTPTokenAuth()
-analyser = AnalyserChain()
+import threading
+
+
+# The extensions are created on first use, so that importing the
+# package (for example to reach the API client) doesn't import Flask
+# and the rest of the server
+def _bootstrap():
+    from flask_bootstrap import Bootstrap
+    return Bootstrap()
+
+
+def _db():
+    from flask_sqlalchemy import SQLAlchemy
+    return SQLAlchemy()
+
+
+def _migrate():
+    from flask_migrate import Migrate
+    return Migrate()
+
+
+def _login():
+    from flask_login import LoginManager
+    login = LoginManager()
+    login.login_view = 'auth.login'
+    return login
+
+
+def _tokenauth():
+    from flask_httpauth import HTTPTokenAuth
+    return HTTPTokenAuth()
+
+
+def _analyser():
+    from epydemicarchive.metadata import AnalyserChain
+    return AnalyserChain()
+
+
+def _storage():
+    from epydemicarchive.storage import NetworkStore
+    return NetworkStore()
+
+
+_extensions = dict(bootstrap=_bootstrap,
+                   db=_db,
+                   migrate=_migrate,
+                   login=_login,
+                   tokenauth=_tokenauth,
+                   analyser=_analyser,
+                   storage=_storage)
+_extensions_lock = threading.RLock()
+
+
+def __getattr__(name):
+    '''Instanciate extensions when first accessed.
+
+    :param name: the extension
+    :returns: the extension'''
+    if name not in _extensions:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
+    with _extensions_lock:
+        if name not in globals():
+            globals()[name] = _extensions[name]()
+    return globals()[name]
 
 
 # Load configuration from environment
@@ -48,37 +93,119 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URI') or 'sqlite:///:memory:'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    # Directory for storing networks
-    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or tempfile.mkdtemp()
+    # Database tuning profile ('default' or 'concurrent'), and explicit
+    # settings that override it (see epydemicarchive.database)
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'default'
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS')
+    SQLITE_BUSY_TIMEOUT = os.environ.get('SQLITE_BUSY_TIMEOUT')
+    SQLITE_MMAP_SIZE = os.environ.get('SQLITE_MMAP_SIZE')
+    DATABASE_POOL_SIZE = os.environ.get('DATABASE_POOL_SIZE')
+    DATABASE_MAX_OVERFLOW = os.environ.get('DATABASE_MAX_OVERFLOW')
+    DATABASE_POOL_TIMEOUT = os.environ.get('DATABASE_POOL_TIMEOUT')
+    DATABASE_POOL_RECYCLE = os.environ.get('DATABASE_POOL_RECYCLE')
+    DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING')
+
+    # Directory for storing networks (defaults to a temporary directory)
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')
+
+    # Accuracy and time budget (in seconds) for sampled analysers
+    ANALYSIS_ERROR = float(os.environ.get('ANALYSIS_ERROR') or 0.01)
+    ANALYSIS_BUDGET = float(os.environ.get('ANALYSIS_BUDGET') or 1.0)
+
+    # Sandboxing of analysers, with memory (in bytes) and CPU time
+    # (in seconds) limits for each analysis
+    ANALYSIS_SANDBOX = (os.environ.get('ANALYSIS_SANDBOX') or 'yes').lower() in ['yes', 'true', '1']
+    ANALYSIS_MEMORY_LIMIT = int(os.environ.get('ANALYSIS_MEMORY_LIMIT') or 8 * 1024 * 1024 * 1024)
+    ANALYSIS_CPU_LIMIT = int(os.environ.get('ANALYSIS_CPU_LIMIT') or 3600)
+
+    # Storage backend for networks, either 'local' (in ARCHIVE_DIR)
+    # or 's3' (in an S3-compatible bucket)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or ''
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_URL_EXPIRY = int(os.environ.get('S3_URL_EXPIRY') or 3600)
+
+    # Compression for stored networks, and the id of the trained zstd
+    # dictionary (if any) to compress them with
+    STORAGE_COMPRESSION = os.environ.get('STORAGE_COMPRESSION') or 'zst'
+    STORAGE_DICTIONARY = int(os.environ.get('STORAGE_DICTIONARY') or 0) or None
+
+    # Directory for trained zstd dictionaries (defaults to within the archive directory)
+    DICTIONARY_DIR = os.environ.get('DICTIONARY_DIR')
+
+    # Whether to record performance metrics and serve them at /metrics
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'yes').lower() in ['yes', 'true', '1']
+
+    # Profiling: requests carrying PROFILING_KEY in their X-Profile header
+    # are profiled, as are runs of the (comma-separated) analysers in
+    # PROFILE_ANALYSERS ('all' for all of them), keeping the most recent
+    # PROFILE_KEEP profiles (by default within the archive directory)
+    PROFILING_KEY = os.environ.get('PROFILING_KEY')
+    PROFILE_ANALYSERS = os.environ.get('PROFILE_ANALYSERS')
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP') or 100)
 
+    # Number of networks on each page of search results, by default
+    # and at most
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE') or 25)
+    SEARCH_MAX_PAGE_SIZE = int(os.environ.get('SEARCH_MAX_PAGE_SIZE') or 1000)
 
-# Make sure the archive directory exists
-dir = Config.ARCHIVE_DIR
-if not os.path.exists(dir):
-    try:
-        os.makedirs(dir)
-    except OSError as e:
-        # failed to create, log and re-raise
-        raise e
+    # Cache of search facets, with its size and the time in seconds
+    # before changes made by other server processes appear
+    FACET_CACHE_SIZE = int(os.environ.get('FACET_CACHE_SIZE') or 256)
+    FACET_CACHE_TTL = int(os.environ.get('FACET_CACHE_TTL') or 60)
+
+    # Largest Matrix Market matrix (in nodes) accepted for upload
+    UPLOAD_MAX_MATRIX_SIZE = int(os.environ.get('UPLOAD_MAX_MATRIX_SIZE') or 10 ** 7)
+
+    # Cache of networks converted to other formats for download, and
+    # its maximum size in bytes (defaults to within the archive directory)
+    CACHE_DIR = os.environ.get('CACHE_DIR')
+    CACHE_SIZE = int(os.environ.get('CACHE_SIZE') or 1024 * 1024 * 1024)
 
 
 # Applicationn factory
 def create(config=Config):
+    from flask import Flask, render_template
+    from jinja2 import Template, contextfilter
+    from epydemicarchive import bootstrap, db, migrate, login, storage, analyser
+    from epydemicarchive import database, metrics, profiling
+
     # create the top-level app
     app = Flask(__name__)
 
     # configure app, using static configuration as the default
     app.config.from_object(config)
 
+    # make sure the archive directory exists
+    if app.config['ARCHIVE_DIR'] is None:
+        import tempfile
+        app.config['ARCHIVE_DIR'] = tempfile.mkdtemp()
+    os.makedirs(app.config['ARCHIVE_DIR'], exist_ok=True)
+
+    # tune the database connections
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database.engine_options(app.config)
+
     # bind the extensions to the app
     bootstrap.init_app(app)
     db.init_app(app)
+    database.init_app(app, db)
+    metrics.init_app(app, db)
+    profiling.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
+    storage.init_app(app)
 
     # bind the metadata analyser
     analyser.init_app(app)
 
+    # locate the compression dictionaries, and limit uploads
+    from epydemicarchive.archive import formats
+    formats.set_dictionary_dir(app.config['DICTIONARY_DIR'] or os.path.join(app.config['ARCHIVE_DIR'], 'dictionaries'))
+    formats.set_max_matrix_size(app.config['UPLOAD_MAX_MATRIX_SIZE'])
+
     # register blueprints
     from epydemicarchive.main import main                   # main application
     app.register_blueprint(main)
@@ -92,12 +219,38 @@ def create(config=Config):
     app.register_blueprint(api_v1, url_prefix='/api/v1')
 
     # register analysers
-    from epydemicarchive.metadata.hash import Hash          # SHA256 of network
-    analyser.register_analyser(Hash())
-    from epydemicarchive.metadata.topology import Topology  # basic metrics
-    analyser.register_analyser(Topology())
-    from epydemicarchive.metadata.er import ER              # ER check
-    analyser.register_analyser(ER())
+    # sd: analysers are registered by name, and only imported (along
+    # with numpy, scipy and networkx) when a process first runs them
+    analyser.register_analyser('epydemicarchive.metadata.hash:Hash')                  # SHA256 of network
+    analyser.register_analyser('epydemicarchive.metadata.fingerprint:Fingerprint')    # structural fingerprint
+    analyser.register_analyser('epydemicarchive.metadata.topology:Topology')          # basic metrics
+    analyser.register_analyser('epydemicarchive.metadata.classifier:DegreeDistributionClassifier',
+                               candidates=['epydemicarchive.metadata.regular:Regular',   # degree distribution
+                                           'epydemicarchive.metadata.er:ER',
+                                           'epydemicarchive.metadata.geometric:Geometric',
+                                           'epydemicarchive.metadata.exponential:Exponential',
+                                           'epydemicarchive.metadata.powerlaw:PowerLawCutoff'])
+    analyser.register_analyser('epydemicarchive.metadata.components:Components')      # connected components
+
+    # register sampled analysers, with the configured accuracy
+    sampling = dict(error=app.config['ANALYSIS_ERROR'],
+                    budget=app.config['ANALYSIS_BUDGET'])
+    analyser.register_analyser('epydemicarchive.metadata.clustering:Clustering', **sampling)       # clustering coefficient
+    analyser.register_analyser('epydemicarchive.metadata.pathlengths:PathLengths', **sampling)    # mean path length
+    analyser.register_analyser('epydemicarchive.metadata.assortativity:Assortativity', **sampling)  # degree assortativity
+
+    # register any analysers provided by other packages
+    analyser.register_entry_points()
+
+    # register maintenance commands
+    from epydemicarchive.metadata.commands import reanalyse, analysis_report
+    app.cli.add_command(reanalyse)
+    app.cli.add_command(analysis_report)
+    from epydemicarchive.archive.commands import recompress, train_dictionary, relocate, reconcile
+    app.cli.add_command(recompress)
+    app.cli.add_command(train_dictionary)
+    app.cli.add_command(relocate)
+    app.cli.add_command(reconcile)
 
     # custom error handlers
     def page_not_found(e):
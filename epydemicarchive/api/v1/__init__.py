@@ -17,10 +17,22 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-from flask import Blueprint
+import threading
 
 __version__ = 1
 
-api = Blueprint('api', __name__)
+_lock = threading.Lock()
 
-from . import routes
+
+def __getattr__(name):
+    # sd: the blueprint (and so Flask and the rest of the server) is
+    # only created when the server asks for it, so that the client
+    # package can be imported on its own
+    if name == 'api':
+        with _lock:
+            if 'api' not in globals():
+                from flask import Blueprint
+                globals()['api'] = Blueprint('api', __name__)
+                from . import routes
+        return globals()['api']
+    raise AttributeError(f'module {__name__} has no attribute {name}')
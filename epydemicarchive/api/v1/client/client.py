@@ -18,14 +18,13 @@
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
 import os
-import re
 from tempfile import NamedTemporaryFile
 from copy import copy
 from urllib.parse import urljoin
-import requests
-from requests import RequestException
-from requests_toolbelt import MultipartEncoder
-from networkx import Graph, write_adjlist, read_adjlist
+
+# sd: requests, requests_toolbelt and networkx are imported by the
+# methods that use them, as they take far longer to import than many
+# short-lived clients spend talking to the archive
 
 
 class Archive:
@@ -76,6 +75,7 @@ class Archive:
         '''Return all the tags applied to networks in the archive.
 
         :returns: a list of tags'''
+        import requests
         url = self.endpoint('/tags')
         r = requests.get(url,
                          headers=self._headers)
@@ -87,6 +87,7 @@ class Archive:
         '''Return all the network UUIDs for networks in the archive.
 
         :returns: a list of UUIDs'''
+        import requests
         url = self.endpoint('/networks')
         r = requests.get(url,
                          headers=self._headers)
@@ -99,17 +100,59 @@ class Archive:
 
         :param uuid the network's UUID
         :returns: a dict of information'''
+        import requests
         url = self.endpoint('/network/info', uuid)
         r = requests.get(url,
                          headers=self._headers)
         r.raise_for_status()
         return r.json()
 
+    def find(self, text=None, tags=[], metadata=[], page=1, per_page=None):
+        '''Return a page of the networks matching a query, best matches
+        first. Text is matched against the networks' titles and
+        descriptions, all of its words being required.
+
+        :param text: (optional) text the networks' titles or descriptions must contain
+        :param tags: (optional) tags the networks must carry
+        :param metadata: (optional) metadata terms the networks must satisfy
+        :param page: (optional) the page number, starting from 1 (defaults to the first)
+        :param per_page: (optional) the number of networks per page (defaults to the archive's page size, and limited to its maximum)
+        :returns: a dict with the total number of matches and a list of networks'''
+        import requests
+        url = self.endpoint('/find')
+        query = dict(text=text, tags=tags, metadata=metadata, page=page)
+        if per_page is not None:
+            query['per_page'] = per_page
+        r = requests.post(url,
+                          headers=self._headers,
+                          json=query)
+        r.raise_for_status()
+        return r.json()
+
+    def facets(self, text=None, tags=[], metadata=[]):
+        '''Return the facets of a query: the number of networks matching
+        the text, tags and metadata terms, the number of them carrying each
+        tag, and histograms of their core metadata.
+
+        :param text: (optional) text the networks' titles or descriptions must contain
+        :param tags: (optional) tags the networks must carry
+        :param metadata: (optional) metadata terms the networks must satisfy
+        :returns: a dict of facets'''
+        import requests
+        url = self.endpoint('/facets')
+        r = requests.post(url,
+                          headers=self._headers,
+                          json=dict(text=text, tags=tags, metadata=metadata))
+        r.raise_for_status()
+        return r.json()
+
     def raw(self, uuid):
         '''Retreve and load the network with the given UUID.
 
         :param uuid: the network's UUID
         :returns: the networkx representation of the network'''
+        import requests
+        from networkx import read_adjlist
         filename = None
         try:
             # create a tremporary file to hold the downloaded network
@@ -143,6 +186,9 @@ class Archive:
         :param desc: (optional) descrriptionfor the network
         :param tags: (optional) tags to be applied to the network
         :returns: the UUID of the submitted network'''
+        import requests
+        from requests_toolbelt import MultipartEncoder
+        from networkx import write_adjlist
         filename = None
         try:
             # write the network to a temporary file ready to stream
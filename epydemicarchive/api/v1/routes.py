@@ -19,15 +19,16 @@
 
 import logging
 import random
-from flask import jsonify, url_for, send_file, request
+from flask import jsonify, url_for, request, current_app
 from werkzeug.http import HTTP_STATUS_CODES
 from markupsafe import escape
 from epydemicarchive import tokenauth, db, analyser
 from epydemicarchive.api.v1 import api, __version__
-from epydemicarchive.archive.models import Tag, Network, Metadata
+from epydemicarchive.archive import formats
+from epydemicarchive.archive.models import Tag, Network, NetworkSummary
+from epydemicarchive.archive.cache import send_network
 from epydemicarchive.archive.queries import QueryNetworks
-from epydemicarchive.auth.models import User
-from epydemicarchive.metadata.analyser import Analyser
+from epydemicarchive.archive.facets import facets
 
 
 # Customise logging for API calls
@@ -80,7 +81,7 @@ def networks():
     '''Return a list of all network UUIDs.'''
     res = {
         '_version': __version__,
-        'uuids': [n.id for n in Network.query.all()]
+        'uuids': [id for (id, ) in db.session.query(NetworkSummary.id)]
     }
     return jsonify(res)
 
@@ -91,7 +92,7 @@ def network(id):
     '''Retrieve the metadata for the given network.
 
     :param id: the network's UUID'''
-    n = Network.query.filter_by(id=id).first()
+    n = NetworkSummary.query.get(id)
     if n is None:
         return error(404, f'Network {id} not known')
 
@@ -101,26 +102,78 @@ def network(id):
         'uploaded': n.uploaded,
         'title': n.title,
         'description': n.description,
-        'owner': n.owner.email,
-        'tags': [tag.name for tag in n.tags],
-        'metadata': {meta.key: meta.value for meta in n.metadata},
+        'owner': n.owner_email,
+        'tags': n.tagnames(),
+        'metadata': n.metadata_dict(),
         '_links': {
             'raw': url_for('.raw', id=id),
         },
     }
+    if n.analysis_error is not None:
+        res['analysis_error'] = n.analysis_error
     return jsonify(res)
 
 
+def requested_format():
+    '''Determine the format requested for a raw network, either from
+    the 'format' query parameter or from the first MIME type in the
+    Accept header that names a known format. Wildcards are ignored, so
+    clients that don't ask for a format get the stored file.
+
+    :returns: the format's extension, or None'''
+    f = request.args.get('format')
+    if f is None:
+        types = {fmt.MIMETYPE: ext for (ext, fmt) in formats.FORMATS.items() if fmt.writable()}
+        for (mt, q) in request.accept_mimetypes:
+            if q > 0 and mt in types:
+                return types[mt]
+    return f
+
+
 @api.route('/network/raw/<id>')
 @tokenauth.login_required
 def raw(id):
-    '''Return the network itself.
+    '''Return the network itself. By default this is the file as
+    stored if it's uncompressed or gzipped, which HTTP clients
+    decode themselves, and otherwise the network re-compressed with
+    gzip; a different format and/or compression can be requested
+    using the 'format' and 'compression' query parameters (with
+    'none' for uncompressed), or a format by its MIME type in the
+    Accept header. Converted networks are cached.
 
     :param id: the UUID of the network'''
     n = Network.from_uuid(id)
     if n is None:
         return error(404, f'Network {id} not known')
-    return send_file(n.network_filename())
+
+    # work out what's been asked for
+    stored = Network.is_acceptable_file(n.filename)
+    f = requested_format()
+    c = request.args.get('compression')
+    (sf, sc) = formats.split_extension(stored)
+    if f is None and c is None:
+        # sd: clients that don't ask for anything get a file sent with
+        # a Content-Encoding they'll decode, which zstd (and the
+        # other compressions) can't rely on
+        if sc not in [None, 'gz']:
+            stored = f'{sf}.gz'
+        return send_network(n, stored)
+    if f is None:
+        f = sf
+    if f not in formats.FORMATS or not formats.FORMATS[f].writable():
+        return error(400, f'Unknown format {escape(f)}')
+    if c == 'none':
+        c = None
+    if c is not None and c not in formats.COMPRESSIONS:
+        return error(400, f'Unknown compression {escape(c)}')
+    ext = f if c is None else f'{f}.{c}'
+
+    # serve the stored file or a cached variant
+    try:
+        return send_network(n, ext, mimetype=formats.mimetype(ext), as_attachment=True)
+    except Exception as e:
+        logger.error(f'Could not convert network {id} to {ext}: {e}')
+        return error(500, f'Could not convert network to {ext}')
 
 
 @api.route('/network/submit', methods=['POST'])
@@ -144,20 +197,25 @@ def submit():
         return error(400, 'No submitted network')
     raw = request.files['raw']
 
-    # create the network
-    n = Network.create_network(user,
-                               filename,
-                               raw,
-                               title,
-                               description,
-                               tags)
-    uuid = n.id
-
-    # extract metadata for the network
-    # TODO: this should be asynchronous
-    analyser.analyse(n)
-
-    db.session.commit()
+    try:
+        # create the network
+        n = Network.create_network(user,
+                                   filename,
+                                   raw,
+                                   title,
+                                   description,
+                                   tags)
+        uuid = n.id
+
+        # extract metadata for the network
+        # TODO: this should be asynchronous
+        analyser.analyse(n)
+
+        db.session.commit()
+    except Exception as e:
+        # unrecognised or malformed files
+        db.session.rollback()
+        return error(400, str(e))
     logging.info(f'Network {uuid} submitted by {email}')
 
     # return the UUID for the newly-created network
@@ -168,6 +226,30 @@ def submit():
     return jsonify(res)
 
 
+@api.route('/facets', methods=['POST'])
+@tokenauth.login_required
+def search_facets():
+    '''Return the facets of a query: the number of matching networks,
+    the number of them carrying each tag, and histograms of their core
+    metadata. The query takes the same form as for the 'search'
+    endpoint.'''
+
+    # retrieve the query
+    if not request.is_json:
+        return error(400, 'Not a JSON query')
+    query = request.get_json()
+
+    # version check
+    v = query.get('_version', __version__)
+    if v != __version__:
+        return error(400, 'API version mismatch ({c} used against {s})'.format(c=v,
+                                                                               s=__version__))
+
+    qn = QueryNetworks(query.get('tags', []), query.get('metadata', []), query.get('text'))
+    res = dict(facets(qn), _version=__version__)
+    return jsonify(res)
+
+
 @api.route('/search', methods=['POST'])
 @tokenauth.login_required
 def search():
@@ -190,7 +272,7 @@ def search():
 
 
     # perform the query against the archive
-    qn = QueryNetworks(query.get('tags', []), query.get('metadata', []))
+    qn = QueryNetworks(query.get('tags', []), query.get('metadata', []), query.get('text'))
     networks = list(qn.all())
     if len(networks) == 0:
         # no matching networks
@@ -234,3 +316,44 @@ def search():
         'message': n.id
     }
     return jsonify(res)
+
+
+@api.route('/find', methods=['POST'])
+@tokenauth.login_required
+def find():
+    '''Return a page of the networks matching the given specification,
+    best matches first. The specification takes the same form as for
+    the 'search' endpoint and can also give the page number and the
+    number of networks per page, which is capped at SEARCH_MAX_PAGE_SIZE.'''
+
+    # retrieve the query
+    if not request.is_json:
+        return error(400, 'Not a JSON query')
+    query = request.get_json()
+
+    # version check
+    v = query.get('_version', __version__)
+    if v != __version__:
+        return error(400, 'API version mismatch ({c} used against {s})'.format(c=v,
+                                                                               s=__version__))
+
+    # retrieve the requested page
+    try:
+        page = int(query.get('page', 1))
+        per_page = int(query.get('per_page', current_app.config['SEARCH_PAGE_SIZE']))
+    except (TypeError, ValueError):
+        return error(400, 'Page and page size must be integers')
+    if page < 1 or per_page < 1:
+        return error(400, 'Page and page size must be positive')
+    per_page = min(per_page, current_app.config['SEARCH_MAX_PAGE_SIZE'])
+    qn = QueryNetworks(query.get('tags', []), query.get('metadata', []), query.get('text'))
+    p = qn.page(page, per_page)
+
+    res = {
+        '_version': __version__,
+        'page': p.page,
+        'per_page': p.per_page,
+        'total': p.total,
+        'networks': [{'uuid': n.id, 'title': n.title} for n in p.items]
+    }
+    return jsonify(res)
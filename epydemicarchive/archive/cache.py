@@ -0,0 +1,168 @@
+# Cache of network files converted to other formats
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import logging
+from tempfile import mkstemp
+from flask import current_app, send_file, redirect
+from epydemicarchive import storage, metrics
+from epydemicarchive.archive import formats
+
+logger = logging.getLogger(__name__)
+
+
+class VariantCache:
+    '''A size-bounded on-disk cache of networks converted to formats
+    and compressions other than the one they're stored in. Variants
+    are generated on first request and then served directly. When the
+    cache grows beyond its size the least-recently-used variants are
+    evicted, using file modification times to track use so that the
+    cache can be shared between server processes.
+
+    :param dir: the cache directory
+    :param size: the maximum size of the cache in bytes'''
+
+    def __init__(self, dir, size):
+        self._dir = dir
+        self._size = size
+
+    @staticmethod
+    def from_config(config=None):
+        '''Create the cache described by an application's configuration.
+        The cache lives in CACHE_DIR if set, or within the archive
+        directory if not, and is bounded by CACHE_SIZE.
+
+        :param config: (optional) the configuration (defaults to the current app's)
+        :returns: the cache'''
+        if config is None:
+            config = current_app.config
+        dir = config.get('CACHE_DIR') or os.path.join(config['ARCHIVE_DIR'], 'variants')
+        return VariantCache(dir, config['CACHE_SIZE'])
+
+    def filename(self, n, ext):
+        '''Return the cache filename for a variant of a network.
+
+        :param n: the network
+        :param ext: the extension of the variant
+        :returns: the filename'''
+        return os.path.join(self._dir, f'{n.id}.{ext}')
+
+    def variant(self, n, ext):
+        '''Return the filename of a variant of a network, generating
+        it if it isn't already in the cache.
+
+        :param n: the network
+        :param ext: the extension of the format and compression required
+        :returns: the filename'''
+        filename = self.filename(n, ext)
+        if os.path.exists(filename):
+            # mark as recently used
+            try:
+                os.utime(filename)
+                return filename
+            except FileNotFoundError:
+                # evicted by another process, re-create
+                pass
+
+        # convert into a temporary file, then move into place so
+        # that other processes never see a partial variant; the
+        # temporary file is uniquely named, as several threads or
+        # processes may be converting the same network at once
+        os.makedirs(self._dir, exist_ok=True)
+        (fd, tmp) = mkstemp(dir=self._dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            with n.open_network() as fh:
+                formats.write(fh, n.is_acceptable_file(n.filename), tmp, ext)
+            os.replace(tmp, filename)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        logger.info(f'Created {ext} variant of network {n.id}')
+
+        self.evict(keep=filename)
+        return filename
+
+    def evict(self, keep=None):
+        '''Evict the least-recently-used variants until the cache
+        is within its size.
+
+        :param keep: (optional) a filename never to evict'''
+        entries = []
+        for e in os.scandir(self._dir):
+            if e.is_file() and not e.name.endswith('.tmp'):
+                try:
+                    st = e.stat()
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                except FileNotFoundError:
+                    pass
+        total = sum([size for (_, size, _) in entries])
+        for (_, size, path) in sorted(entries):
+            if total <= self._size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, id):
+        '''Remove all the cached variants of a network.
+
+        :param id: the network's UUID'''
+        if not os.path.exists(self._dir):
+            return
+        prefix = f'{id}.'
+        for e in os.scandir(self._dir):
+            if e.name.startswith(prefix):
+                try:
+                    os.remove(e.path)
+                except FileNotFoundError:
+                    pass
+
+
+def send_network(n, ext=None, **kwargs):
+    '''Send a network in response to a request. The stored file is
+    sent when that's what's asked for and clients can read it,
+    either directly or by redirecting to the storage backend; other
+    formats and compressions are sent from the variant cache.
+
+    :param n: the network
+    :param ext: (optional) the extension required (defaults to that of the stored file)
+    :param kwargs: (optional) arguments for send_file
+    :returns: the response'''
+    stored = n.is_acceptable_file(n.filename)
+    if ext is None:
+        ext = stored
+    if ext == stored:
+        with n.open_network() as fh:
+            ok = formats.portable(fh, stored)
+        if ok:
+            filename = storage.local_path(n.filename)
+            if filename is not None:
+                metrics.RAW_BYTES.inc(os.path.getsize(filename), format=ext)
+                return send_file(filename, **kwargs)
+            url = storage.url(n.filename)
+            if url is not None:
+                return redirect(url)
+    filename = VariantCache.from_config().variant(n, ext)
+    metrics.RAW_BYTES.inc(os.path.getsize(filename), format=ext)
+    return send_file(filename, **kwargs)
@@ -0,0 +1,337 @@
+# Command-line maintenance of stored networks
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from epydemicarchive.archive import formats
+
+logger = logging.getLogger(__name__)
+
+
+def misstored_networks(after=None, limit=None, everything=False):
+    '''Return the UUIDs of networks not stored with the configured
+    compression. UUIDs are returned in order, and can be paged through
+    using the last UUID of the previous page.
+
+    :param after: (optional) only return UUIDs after this one
+    :param limit: (optional) the maximum number of UUIDs to return
+    :param everything: (optional) return all networks regardless of compression
+    :returns: a list of UUIDs'''
+    from epydemicarchive import db
+    from epydemicarchive.archive.models import Network
+
+    q = db.session.query(Network.id)
+    if not everything:
+        q = q.filter(~Network.filename.like(f'%.{Network.storage_extension()}'))
+    q = q.order_by(Network.id)
+    if after is not None:
+        q = q.filter(Network.id > after)
+    if limit is not None:
+        q = q.limit(limit)
+    return [id for (id, ) in q]
+
+
+def recompress_network(id):
+    '''Re-write a network in the storage format with the configured
+    compression and dictionary, and re-compute its hash.
+
+    The new file only replaces any old one with the same key once
+    complete, and an old file with a different key is only deleted
+    once the network's new key has been committed, so an interrupted
+    re-compression leaves the network readable.
+
+    :param id: the network's UUID
+    :returns: a pair of the UUID and a pair of the old and new file sizes, or an error message'''
+    from epydemicarchive import db, analyser, storage
+    from epydemicarchive.archive.models import Network
+    from epydemicarchive.metadata.hash import Hash
+
+    try:
+        n = Network.from_uuid(id)
+        if n is None:
+            return (id, None)
+        old = n.filename
+        before = storage.size(old)
+
+        # write the network in its new form
+        key = storage.key(n.id, Network.storage_extension())
+        with n.open_network() as fh, storage.open_write(key) as out:
+            Network.store_network(fh, Network.is_acceptable_file(old), out)
+        after = storage.size(key)
+
+        # point the network at its new file
+        if key != old:
+            n.filename = key
+            try:
+                db.session.commit()
+            except Exception:
+                storage.delete(key)
+                raise
+            storage.delete(old)
+
+        # the file's hash has changed
+        analyser.analyse(n, [a for a in analyser.analysers() if isinstance(a, Hash)])
+        db.session.commit()
+        return (id, (before, after))
+    except Exception as e:
+        db.session.rollback()
+        return (id, str(e))
+
+
+@click.command('recompress')
+@click.option('--batch', default=100, show_default=True,
+              help='Number of networks to re-compress per batch.')
+@click.option('--workers', default=os.cpu_count(), show_default=True,
+              help='Number of worker processes.')
+@click.option('--all', 'everything', is_flag=True,
+              help='Re-compress all networks, for example to use a new dictionary.')
+@with_appcontext
+def recompress(batch, workers, everything):
+    '''Re-compress stored networks with the configured compression.
+
+    By default only networks stored with a different compression
+    are re-compressed, so an interrupted run can simply be re-started
+    and will pick up where it left off.'''
+    from epydemicarchive.metadata.commands import _init_worker
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(dict(current_app.config), ))
+    try:
+        after = None
+        done = failed = 0
+        before_total = after_total = 0
+        while True:
+            ids = misstored_networks(after, batch, everything)
+            if len(ids) == 0:
+                break
+            after = ids[-1]
+
+            if pool is None:
+                rcs = map(recompress_network, ids)
+            else:
+                rcs = pool.map(recompress_network, ids)
+            for (id, rc) in rcs:
+                if isinstance(rc, str):
+                    logger.error(f'Re-compression of network {id} failed: {rc}')
+                    failed += 1
+                elif rc is not None:
+                    before_total += rc[0]
+                    after_total += rc[1]
+                    done += 1
+            click.echo(f'{done} networks re-compressed ({before_total} -> {after_total} bytes), {failed} failed')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+@click.command('train-dictionary')
+@click.option('--samples', default=1000, show_default=True,
+              help='Maximum number of networks to train on.')
+@click.option('--largest', default=1024 * 1024, show_default=True,
+              help='Size in bytes (uncompressed) of the largest network to train on.')
+@click.option('--size', default=112640, show_default=True,
+              help='Size in bytes of the dictionary.')
+@with_appcontext
+def train_dictionary(samples, largest, size):
+    '''Train a zstd dictionary on the archive's small networks.
+
+    Dictionaries substantially improve the compression of small
+    networks with similar structure. A new dictionary isn't used
+    until its id is set as STORAGE_DICTIONARY, after which new
+    networks are compressed with it and existing ones can be
+    re-compressed with "flask recompress --all".'''
+    from epydemicarchive.archive.models import Network
+
+    if formats.zstandard is None:
+        raise click.ClickException('Dictionaries need the zstandard package')
+
+    # sample the small networks, which have random UUIDs
+    data = []
+    for n in Network.query.order_by(Network.id).yield_per(100):
+        (_, c) = formats.split_extension(Network.is_acceptable_file(n.filename))
+        with n.open_network() as fh, formats.open_compressed(fh, c) as zh:
+            bs = zh.read(largest + 1)
+        if len(bs) <= largest:
+            data.append(bs)
+            if len(data) >= samples:
+                break
+    if len(data) == 0:
+        raise click.ClickException('No networks small enough to train on')
+
+    # train and save the dictionary
+    try:
+        d = formats.zstandard.train_dictionary(size, data)
+    except formats.zstandard.ZstdError as e:
+        raise click.ClickException(f'Could not train dictionary: {e}')
+    dict_id = formats.save_dictionary(d)
+    click.echo(f'Trained dictionary {dict_id} on {len(data)} networks')
+
+
+def relocate_file(backend, key, newkey):
+    '''Move a stored file to a new key. A file that has already been
+    moved (by an interrupted run) is left where it is.
+
+    :param backend: the storage backend
+    :param key: the file's key
+    :param newkey: the new key
+    :returns: None, or an error message'''
+    try:
+        backend.rename(key, newkey)
+    except FileNotFoundError:
+        if not backend.exists(newkey):
+            return f'File {key} not found'
+    except Exception as e:
+        return str(e)
+    return None
+
+
+@click.command('relocate')
+@click.option('--batch', default=1000, show_default=True,
+              help='Number of networks to relocate per transaction.')
+@click.option('--workers', default=os.cpu_count(), show_default=True,
+              help='Number of files to move in parallel.')
+@with_appcontext
+def relocate(batch, workers):
+    '''Move stored networks to the storage backend's current layout.
+
+    Files are moved in parallel a batch at a time, and the batch's
+    new keys are then committed in a single transaction. Networks
+    remain readable throughout, since the backend finds files under
+    any layout, and an interrupted run can simply be re-started.'''
+    from epydemicarchive import db, storage
+    from epydemicarchive.archive.models import Network
+
+    # sd: the worker threads don't have an app context, so
+    # they're given the backend directly
+    backend = storage.backend()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        after = None
+        moved = failed = 0
+        while True:
+            q = db.session.query(Network.id, Network.filename).order_by(Network.id)
+            if after is not None:
+                q = q.filter(Network.id > after)
+            rows = q.limit(batch).all()
+            if len(rows) == 0:
+                break
+            after = rows[-1][0]
+
+            # move the files that aren't in the current layout
+            moves = [(id, key, backend.relocate(key)) for (id, key) in rows]
+            moves = [(id, key, newkey) for (id, key, newkey) in moves if newkey != key]
+            if len(moves) == 0:
+                continue
+            rcs = pool.map(lambda m: relocate_file(backend, m[1], m[2]), moves)
+
+            # update the keys of those that moved
+            updates = []
+            for ((id, key, newkey), rc) in zip(moves, rcs):
+                if rc is None:
+                    updates.append(dict(id=id, filename=newkey))
+                else:
+                    logger.error(f'Relocation of network {id} failed: {rc}')
+                    failed += 1
+            db.session.bulk_update_mappings(Network, updates)
+            db.session.commit()
+            moved += len(updates)
+            click.echo(f'{moved} networks relocated, {failed} failed')
+    finally:
+        pool.shutdown()
+
+
+@click.command('reconcile')
+@click.option('--grace', default=24 * 60 * 60, show_default=True,
+              help='Age in seconds below which unreferenced files are kept.')
+@click.option('--dry-run', is_flag=True,
+              help='Report what would be done without doing it.')
+@with_appcontext
+def reconcile(grace, dry_run):
+    '''Reconcile the stored files with the networks in the database.
+
+    The store is listed once and compared in bulk against a single
+    streamed query. Files not belonging to any network -- left by
+    interrupted uploads, deletions or maintenance -- are deleted
+    once they're older than the grace period, which protects uploads
+    in progress. Networks committed without their staged file having
+    been moved into place are completed, and networks whose files are
+    missing are reported.'''
+    from epydemicarchive import db, storage
+    from epydemicarchive.archive.models import Network
+
+    backend = storage.backend()
+
+    # list the store, indexing by name to match files under any layout
+    files = dict()
+    for key in backend.keys():
+        files.setdefault(key.rsplit('/', 1)[-1], []).append(key)
+
+    # compare against the database
+    referenced = set()
+    orphans = []
+    staged = []
+    missing = []
+    for (id, key) in db.session.query(Network.id, Network.filename).yield_per(10000):
+        name = key.rsplit('/', 1)[-1]
+        referenced.add(name)
+        if name in files:
+            # any copies other than the network's own are orphans
+            keys = files[name]
+            if key in keys:
+                orphans.extend([k for k in keys if k != key])
+        elif f'{name}.staged' in files:
+            referenced.add(f'{name}.staged')
+            staged.append((files[f'{name}.staged'][0], key))
+        else:
+            missing.append(id)
+    for (name, keys) in files.items():
+        if name not in referenced:
+            orphans.extend(keys)
+
+    # move committed networks' staged files into place
+    for (key, newkey) in staged:
+        logger.info(f'Completing staged file {key}')
+        if not dry_run:
+            backend.rename(key, newkey)
+
+    # delete orphans that are old enough not to be in use
+    now = time.time()
+    deleted = 0
+    for key in orphans:
+        try:
+            if now - backend.modified(key) < grace:
+                continue
+            logger.info(f'Deleting orphan file {key}')
+            if not dry_run:
+                backend.delete(key)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+
+    for id in missing:
+        logger.warning(f'File for network {id} is missing')
+    click.echo(f'{len(staged)} staged files completed, {deleted} of {len(orphans)} orphan files deleted, {len(missing)} networks missing files')
@@ -0,0 +1,176 @@
+# Faceted counts of tags and metadata over search results
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import func, cast, Integer
+from epydemicarchive import db
+from epydemicarchive.archive.models import NetworkSummary, Tag, tags
+
+
+class Facets:
+    '''Counts of the networks matching a query that carry each tag, and
+    histograms of their core numeric metadata. Each facet is computed
+    by a single aggregate query over the matching summaries.
+
+    :param qn: the query'''
+
+    BINS = 10     #: Number of bins in each metadata histogram.
+
+    def __init__(self, qn):
+        self._qn = qn
+
+    def compute(self):
+        '''Compute the facets.
+
+        :returns: a dict of facets'''
+        ids = self._qn.query().with_entities(NetworkSummary.id).subquery()
+
+        # count the networks carrying each tag
+        q = db.session.query(Tag.name, func.count()).join(tags, tags.c.tag == Tag.id)
+        q = q.filter(tags.c.network.in_(db.session.query(ids.c.id))).group_by(Tag.name)
+        tagcounts = {name: n for (name, n) in q}
+
+        # find the ranges of the core metadata
+        cols = [getattr(NetworkSummary, k) for k in NetworkSummary.CORE]
+        q = self._qn.query().with_entities(func.count(), *[func.min(c) for c in cols], *[func.max(c) for c in cols])
+        rc = q.one()
+        count = rc[0]
+        lows = rc[1:len(cols) + 1]
+        highs = rc[len(cols) + 1:]
+
+        # histogram each one
+        histograms = dict()
+        for (k, c, low, high) in zip(NetworkSummary.CORE, cols, lows, highs):
+            if low is not None:
+                histograms[k] = self.histogram(k, c, low, high)
+
+        return dict(count=count, tags=tagcounts, metadata=histograms)
+
+    def bin(self, c, low, width, dialect):
+        '''Return an expression for the histogram bin of a column's values.
+
+        :param c: the column
+        :param low: the smallest value
+        :param width: the width of the bins
+        :param dialect: the name of the database dialect
+        :returns: the expression'''
+        # sd: casting rounds (rather than truncates) on some databases,
+        # so bins are found with floor(); SQLite may lack floor(), but
+        # its casts truncate, which is the same for these non-negative values
+        bin = (c - low) / width
+        if dialect != 'sqlite':
+            bin = func.floor(bin)
+        return cast(bin, Integer)
+
+    def histogram(self, k, c, low, high):
+        '''Compute a histogram of a metadata column.
+
+        :param k: the metadata key
+        :param c: the column
+        :param low: the smallest value
+        :param high: the largest value
+        :returns: a list of dicts of the (inclusive) low, high and count of each bin'''
+        if NetworkSummary.CORE[k] is int:
+            width = max(1, math.ceil((high - low + 1) / self.BINS))
+            last = 1
+        else:
+            width = (high - low) / self.BINS or 1.0
+            last = 0
+        bin = self.bin(c, low, width, db.engine.dialect.name)
+        q = self._qn.query().with_entities(bin, func.count()).filter(c.isnot(None)).group_by(bin)
+
+        # sd: the largest float falls just outside the last bin
+        counts = dict()
+        for (b, n) in q:
+            b = min(b, self.BINS - 1)
+            counts[b] = counts.get(b, 0) + n
+        return [dict(low=low + b * width, high=min(low + (b + 1) * width - last, high), count=counts[b])
+                for b in sorted(counts.keys())]
+
+
+class FacetCache:
+    '''A cache of facets, keyed by the query that generated them. The
+    cache is cleared whenever a change to any network summary is
+    committed in this process; entries also expire, to bound how long
+    changes committed by other processes take to appear. The cache is
+    shared by the threads of a server process, and facets are computed
+    outside its lock.
+
+    :param size: the maximum number of entries
+    :param ttl: the lifetime of entries in seconds'''
+
+    def __init__(self, size, ttl):
+        self._size = size
+        self._ttl = ttl
+        self._cache = OrderedDict()
+        self._generation = NetworkSummary.generation
+        self._lock = threading.Lock()
+
+    def key(self, qn):
+        '''Return the cache key for a query.
+
+        :param qn: the query
+        :returns: the key'''
+        return json.dumps([sorted(qn.tags()), qn.terms(), qn.text()])
+
+    def facets(self, qn):
+        '''Return the facets for a query, computing them if they
+        aren't cached.
+
+        :param qn: the query
+        :returns: the facets'''
+        k = self.key(qn)
+        now = time.monotonic()
+        with self._lock:
+            if self._generation != NetworkSummary.generation:
+                self._cache.clear()
+                self._generation = NetworkSummary.generation
+            if k in self._cache:
+                (t, fs) = self._cache[k]
+                if now - t < self._ttl:
+                    self._cache.move_to_end(k)
+                    return fs
+            generation = self._generation
+
+        fs = Facets(qn).compute()
+
+        with self._lock:
+            # sd: don't cache facets computed before a change
+            if generation == NetworkSummary.generation:
+                self._cache[k] = (now, fs)
+                if len(self._cache) > self._size:
+                    self._cache.popitem(last=False)
+        return fs
+
+
+def facets(qn):
+    '''Return the facets for a query, using the current application's cache.
+
+    :param qn: the query
+    :returns: the facets'''
+    cache = current_app.extensions.get('facets')
+    if cache is None:
+        cache = current_app.extensions.setdefault('facets', FacetCache(current_app.config['FACET_CACHE_SIZE'],
+                                                                       current_app.config['FACET_CACHE_TTL']))
+    return cache.facets(qn)
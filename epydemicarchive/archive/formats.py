@@ -0,0 +1,660 @@
+# Network file formats and compressions
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import io
+import re
+import gzip
+import bz2
+import lzma
+from array import array
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import quoteattr
+
+# zstd is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# ---------- Compressions ----------
+
+ZSTD_LEVEL = 10             #: Compression level for zstd.
+ZSTD_FRAME_HEADER_MAX = 18  #: Maximum size of a zstd frame header.
+
+_dictionary_dir = None      # directory holding trained zstd dictionaries
+_dictionaries = dict()      # loaded dictionaries, keyed by dictionary id
+
+
+def set_dictionary_dir(dir):
+    '''Set the directory holding trained zstd dictionaries.
+
+    :param dir: the directory'''
+    global _dictionary_dir
+    _dictionary_dir = dir
+
+
+def dictionary(dict_id):
+    '''Return a trained zstd dictionary, loading it if needed.
+
+    :param dict_id: the dictionary id
+    :returns: the dictionary'''
+    if dict_id not in _dictionaries:
+        if _dictionary_dir is None:
+            raise Exception(f'No directory for zstd dictionary {dict_id}')
+        with open(os.path.join(_dictionary_dir, f'{dict_id}.zdict'), 'rb') as fh:
+            _dictionaries[dict_id] = zstandard.ZstdCompressionDict(fh.read())
+    return _dictionaries[dict_id]
+
+
+def save_dictionary(d):
+    '''Save a trained zstd dictionary, which can then be used to
+    compress stored networks. Dictionaries must never be deleted
+    while any file compressed with them remains.
+
+    :param d: the dictionary
+    :returns: the dictionary id'''
+    dict_id = d.dict_id()
+    os.makedirs(_dictionary_dir, exist_ok=True)
+    with open(os.path.join(_dictionary_dir, f'{dict_id}.zdict'), 'wb') as fh:
+        fh.write(d.as_bytes())
+    _dictionaries[dict_id] = d
+    return dict_id
+
+
+def peek(fh, n):
+    '''Return the first bytes of a file object without consuming them.
+
+    :param fh: the file object, which must be peekable or seekable
+    :param n: the number of bytes
+    :returns: up to n bytes'''
+    if hasattr(fh, 'peek'):
+        return fh.peek(n)[:n]
+    else:
+        pos = fh.tell()
+        bs = fh.read(n)
+        fh.seek(pos)
+        return bs
+
+
+def dictionary_id(f):
+    '''Return the id of the dictionary a zstd file was compressed
+    with, read from its frame header.
+
+    :param f: the filename or file object
+    :returns: the dictionary id, or 0 for none'''
+    if isinstance(f, str):
+        with open(f, 'rb') as fh:
+            header = fh.read(ZSTD_FRAME_HEADER_MAX)
+    else:
+        header = peek(f, ZSTD_FRAME_HEADER_MAX)
+    if len(header) == 0:
+        return 0
+    return zstandard.get_frame_parameters(header).dict_id
+
+
+def _zstd_open(f, mode, dict_id=None):
+    '''Open a zstd-compressed file. When reading, any dictionary
+    used to compress the file is found automatically.
+
+    :param f: the filename or file object
+    :param mode: the mode
+    :param dict_id: (optional) the dictionary to compress with
+    :returns: a file object'''
+    if zstandard is None:
+        raise Exception('zstd compression needs the zstandard package')
+    fh = open(f, mode) if isinstance(f, str) else f
+    if 'r' in mode:
+        dict_id = dictionary_id(fh)
+        d = dictionary(dict_id) if dict_id else None
+        return zstandard.open(fh, mode, dctx=zstandard.ZstdDecompressor(dict_data=d),
+                              closefd=fh is not f)
+    else:
+        d = dictionary(dict_id) if dict_id else None
+        return zstandard.open(fh, mode, cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL,
+                                                                     dict_data=d,
+                                                                     write_checksum=True),
+                              closefd=fh is not f)
+
+
+COMPRESSIONS = {
+    'gz': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+    'zst': _zstd_open,
+}   #: Compressions, as a map from extension to opener function.
+
+COMPRESSION_MIMETYPES = {
+    'gz': 'application/gzip',
+    'bz2': 'application/x-bzip2',
+    'xz': 'application/x-xz',
+    'zst': 'application/zstd',
+}   #: MIME types of compressed files.
+
+
+def open_compressed(f, compression, mode='rb', dict_id=None):
+    '''Open a file, decompressing or compressing as required. Files
+    can be given either by name or as binary file objects (which
+    aren't closed when the returned file object is closed, unless
+    there is no compression).
+
+    :param f: the filename or file object
+    :param compression: the compression extension, or None for an uncompressed file
+    :param mode: (optional) the mode (defaults to 'rb')
+    :param dict_id: (optional) zstd dictionary to compress with
+    :returns: a binary file object'''
+    if compression is None:
+        return open(f, mode) if isinstance(f, str) else f
+    elif compression == 'zst':
+        return _zstd_open(f, mode, dict_id)
+    elif compression in COMPRESSIONS:
+        return COMPRESSIONS[compression](f, mode)
+    else:
+        raise Exception(f'Unknown compression {compression}')
+
+
+# ---------- Formats ----------
+
+class NetworkFormat:
+    '''A file format for networks. Formats read a file as a stream of
+    items, each of which is either a singleton tuple representing a
+    node or a pair representing an edge, with nodes identified by
+    strings. This lets networks be converted between formats without
+    ever being held in memory.
+    '''
+
+    NAME = None          #: Description of the format.
+    EXTENSION = None     #: Filename extension for the format.
+    MIMETYPE = None      #: MIME type for the format.
+
+    CHUNKSIZE = 65536    #: Size of chunks to read from files.
+
+    def items(self, fh):
+        '''Read the nodes and edges from a file. This should be
+        overridden by sub-classes.
+
+        :param fh: a binary file object
+        :returns: a generator of node and edge tuples'''
+        raise NotImplementedError('items')
+
+    def write(self, items, fh):
+        '''Write a stream of nodes and edges to a file. Sub-classes
+        should override this if they can be written.
+
+        :param items: the node and edge tuples
+        :param fh: a binary file object'''
+        raise NotImplementedError('write')
+
+    def writable(self):
+        '''Test whether the format can be written.
+
+        :returns: True if the format overrides :meth:`write`'''
+        return type(self).write is not NetworkFormat.write
+
+    def lines(self, fh):
+        '''Return the lines of a file as text.
+
+        :param fh: a binary file object
+        :returns: a text file object'''
+        return io.TextIOWrapper(fh, encoding='utf-8')
+
+    def label(self, v):
+        '''Check that a node label can be represented in the
+        archive's whitespace-separated storage format.
+
+        :param v: the label (None if the node has no label)
+        :returns: the label'''
+        if v is None:
+            raise Exception(f'Node without a label in {self.NAME} file')
+        if len(v) == 0 or re.search(r'\s', v) is not None:
+            raise Exception(f'Node label "{v}" can\'t be stored')
+        return v
+
+
+class AdjacencyList(NetworkFormat):
+    '''The networkx adjacency list format, with each line giving a node
+    followed by its neighbours. This is the archive's canonical format:
+    it can be written as a stream of items with a single edge (or
+    isolated node) per line.'''
+
+    NAME = 'adjacency list'
+    EXTENSION = 'al'
+    MIMETYPE = 'text/x-adjacency-list'
+
+    def items(self, fh):
+        for line in self.lines(fh):
+            vs = line.split('#', 1)[0].split()
+            if len(vs) == 1:
+                yield (vs[0], )
+            elif len(vs) > 1:
+                u = vs[0]
+                for v in vs[1:]:
+                    yield (u, v)
+
+    def write(self, items, fh):
+        # sd: consecutive edges from the same node share a line
+        with io.TextIOWrapper(fh, encoding='utf-8') as th:
+            u = None
+            for item in items:
+                if len(item) == 2 and item[0] == u:
+                    th.write(' ' + item[1])
+                else:
+                    if u is not None:
+                        th.write('\n')
+                    th.write(' '.join(item))
+                    u = item[0]
+            if u is not None:
+                th.write('\n')
+
+
+class EdgeList(NetworkFormat):
+    '''An edge list, with one edge per line and any data after the
+    endpoints ignored. Lines with a single node give isolated nodes.'''
+
+    NAME = 'edge list'
+    EXTENSION = 'el'
+    MIMETYPE = 'text/x-edge-list'
+
+    def items(self, fh):
+        for line in self.lines(fh):
+            vs = line.split('#', 1)[0].split()
+            if len(vs) == 1:
+                yield (vs[0], )
+            elif len(vs) > 1:
+                yield (vs[0], vs[1])
+
+    def write(self, items, fh):
+        with io.TextIOWrapper(fh, encoding='utf-8') as th:
+            for item in items:
+                th.write(' '.join(item) + '\n')
+
+
+class GraphML(NetworkFormat):
+    '''GraphML, parsed incrementally so that the document tree is
+    never held in memory.'''
+
+    NAME = 'GraphML'
+    EXTENSION = 'graphml'
+    MIMETYPE = 'application/graphml+xml'
+
+    def items(self, fh):
+        graph = None
+        for (event, elem) in iterparse(fh, events=('start', 'end')):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'graph' and graph is None:
+                    graph = elem
+            elif tag in ['node', 'edge']:
+                if tag == 'node':
+                    yield (self.label(elem.get('id')), )
+                else:
+                    yield (self.label(elem.get('source')), self.label(elem.get('target')))
+
+                # discard the element once processed
+                elem.clear()
+                if graph is not None:
+                    try:
+                        graph.remove(elem)
+                    except ValueError:
+                        # nested, leave it where it is
+                        pass
+
+    def write(self, items, fh):
+        # sd: GraphML allows nodes and edges to be interleaved, so
+        # we declare each node the first time we see it
+        seen = set()
+        with io.TextIOWrapper(fh, encoding='utf-8') as th:
+            th.write('<?xml version="1.0" encoding="utf-8"?>\n')
+            th.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+            th.write('<graph edgedefault="undirected">\n')
+            for item in items:
+                for v in item:
+                    if v not in seen:
+                        seen.add(v)
+                        th.write(f'<node id={quoteattr(v)}/>\n')
+                if len(item) == 2:
+                    th.write(f'<edge source={quoteattr(item[0])} target={quoteattr(item[1])}/>\n')
+            th.write('</graph>\n')
+            th.write('</graphml>\n')
+
+
+class GML(NetworkFormat):
+    '''GML, tokenised and parsed incrementally. Nodes are identified
+    by their GML ids.'''
+
+    NAME = 'GML'
+    EXTENSION = 'gml'
+    MIMETYPE = 'text/x-gml'
+
+    # Tokens, skipping whitespace and comments
+    Token = re.compile(r'(?:\s|#[^\n]*\n)*("[^"]*"|\[|\]|[^\s\[\]"]+)')
+
+    def tokens(self, th):
+        '''Split a file into GML tokens.
+
+        :param th: a text file object
+        :returns: a generator of tokens'''
+        buf = ''
+        while True:
+            chunk = th.read(self.CHUNKSIZE)
+            buf += chunk
+            pos = 0
+            while True:
+                m = self.Token.match(buf, pos)
+                if m is None or (len(chunk) > 0 and m.end() == len(buf)):
+                    # no complete token left in the buffer
+                    break
+                yield m[1]
+                pos = m.end()
+            buf = buf[pos:]
+            if len(chunk) == 0:
+                if len(buf.strip()) > 0:
+                    raise Exception('Malformed GML')
+                return
+
+    def items(self, fh):
+        stack = []
+        key = None
+        attrs = None
+        for t in self.tokens(self.lines(fh)):
+            if t == '[':
+                stack.append(key)
+                key = None
+                if stack in [['graph', 'node'], ['graph', 'edge']]:
+                    attrs = dict()
+            elif t == ']':
+                if len(stack) == 0:
+                    raise Exception('Unbalanced ] in GML')
+                k = stack.pop()
+                if stack == ['graph'] and attrs is not None:
+                    if k == 'node':
+                        yield (self.label(attrs.get('id')), )
+                    elif k == 'edge':
+                        yield (self.label(attrs.get('source')), self.label(attrs.get('target')))
+                    attrs = None
+                key = None
+            elif key is None:
+                key = t
+            else:
+                if attrs is not None and len(stack) == 2:
+                    attrs[key] = t.strip('"')
+                key = None
+        if len(stack) > 0:
+            raise Exception('Truncated GML')
+
+
+MAX_MATRIX_SIZE = 10 ** 7       #: Default largest Matrix Market matrix accepted.
+
+_max_matrix_size = MAX_MATRIX_SIZE
+
+
+def set_max_matrix_size(n):
+    '''Set the largest Matrix Market matrix accepted, in nodes. The
+    size is declared by the file, and memory is allocated (and every
+    isolated node written) before the entries are read, so files
+    claiming to be larger than this are rejected.
+
+    :param n: the number of nodes'''
+    global _max_matrix_size
+    _max_matrix_size = n
+
+
+class MatrixMarket(NetworkFormat):
+    '''Matrix Market coordinate format, with rows and columns as nodes
+    and non-zero entries as edges. Nodes are numbered from 1, and all
+    nodes up to the size of the matrix are included, whether or not
+    they have edges. Matrices larger than :func:`set_max_matrix_size`
+    are rejected.'''
+
+    NAME = 'Matrix Market'
+    EXTENSION = 'mtx'
+    MIMETYPE = 'text/x-matrix-market'
+
+    def index(self, v):
+        '''Parse a row or column index or size.
+
+        :param v: the string
+        :returns: the integer'''
+        try:
+            return int(v)
+        except ValueError:
+            raise Exception(f'Matrix Market index "{v}" isn\'t an integer')
+
+    def items(self, fh):
+        lines = self.lines(fh)
+
+        # check the header
+        header = lines.readline().split()
+        if len(header) < 3 or header[0].lower() != '%%matrixmarket' or header[2].lower() != 'coordinate':
+            raise Exception('Matrix Market file must be in coordinate format')
+
+        # read the size
+        size = None
+        for line in lines:
+            if not line.startswith('%') and len(line.strip()) > 0:
+                size = line.split()
+                break
+        if size is None or len(size) < 2:
+            raise Exception('Matrix Market file has no size')
+        N = max(self.index(size[0]), self.index(size[1]))
+        if N > _max_matrix_size:
+            raise Exception(f'Matrix Market file has {N} nodes, more than the {_max_matrix_size} allowed')
+
+        # read the entries, noting which nodes we've seen
+        seen = bytearray(N + 1)
+        for line in lines:
+            vs = line.split()
+            if len(vs) < 2 or line.startswith('%'):
+                continue
+            (i, j) = (self.index(vs[0]), self.index(vs[1]))
+            if not (1 <= i <= N and 1 <= j <= N):
+                raise Exception(f'Matrix Market entry ({i}, {j}) is outside a {N}-node matrix')
+            seen[i] = seen[j] = 1
+            yield (str(i), str(j))
+
+        # add any isolated nodes
+        for i in range(1, N + 1):
+            if not seen[i]:
+                yield (str(i), )
+
+
+class CSR(NetworkFormat):
+    '''A binary compressed sparse row representation, stored as a numpy
+    .npz archive containing the arrays indptr and indices (with each
+    edge appearing in both directions) and the node labels. This is
+    the most compact format, and can be loaded directly by numpy and
+    scipy without any parsing.'''
+
+    NAME = 'compressed sparse row'
+    EXTENSION = 'csr'
+    MIMETYPE = 'application/x-csr+npz'
+
+    def items(self, fh):
+        # sd: numpy is imported here rather than with the module, as
+        # most processes never need it
+        from numpy import load as load_npz
+
+        # sd: npz needs random access, so read the whole (compact) file
+        arrays = load_npz(io.BytesIO(fh.read()), allow_pickle=False)
+        (indptr, indices, labels) = (arrays['indptr'], arrays['indices'], arrays['labels'])
+        for i in range(len(labels)):
+            u = str(labels[i])
+            vs = indices[indptr[i]:indptr[i + 1]]
+            if len(vs) == 0:
+                yield (u, )
+            else:
+                for j in vs[vs >= i]:
+                    yield (u, str(labels[j]))
+
+    def write(self, items, fh):
+        from numpy import frombuffer, concatenate, argsort, bincount, cumsum, int64, savez
+
+        # number the nodes and collect the edges
+        index = dict()
+        us = array('q')
+        vs = array('q')
+        for item in items:
+            ids = [index.setdefault(v, len(index)) for v in item]
+            if len(ids) == 2:
+                us.append(ids[0])
+                vs.append(ids[1])
+        N = len(index)
+
+        # include both directions of each edge (but self-loops only once)
+        us = frombuffer(us.tobytes(), dtype=int64)
+        vs = frombuffer(vs.tobytes(), dtype=int64)
+        loops = us == vs
+        rows = concatenate((us, vs[~loops]))
+        cols = concatenate((vs, us[~loops]))
+
+        # sort by row and construct the row pointers
+        order = argsort(rows, kind='stable')
+        indices = cols[order]
+        indptr = concatenate(([0], cumsum(bincount(rows, minlength=N)))).astype(int64)
+        labels = list(index.keys())
+
+        # sd: npz writing seeks, which compressed streams can't do
+        buf = io.BytesIO()
+        savez(buf, indptr=indptr, indices=indices, labels=labels)
+        fh.write(buf.getbuffer())
+
+
+FORMATS = dict()   #: Formats, as a map from extension to format.
+
+
+def register_format(f):
+    '''Register a network format.
+
+    :param f: the format'''
+    FORMATS[f.EXTENSION] = f
+
+
+for f in [AdjacencyList(), EdgeList(), GraphML(), GML(), MatrixMarket(), CSR()]:
+    register_format(f)
+
+CANONICAL_FORMAT = 'al'          #: Format used to store networks in the archive.
+CANONICAL_COMPRESSION = 'gz'     #: Compression used to store networks in the archive.
+
+
+# ---------- Extensions ----------
+
+def extensions_pattern():
+    '''Return a regexp matching filenames with a registered format and
+    (optionally) compression. The first group is the full extension,
+    the second the format, and the fourth the compression.
+
+    :returns: a compiled regexp'''
+    formats = '|'.join(map(re.escape, FORMATS.keys()))
+    compressions = '|'.join(map(re.escape, COMPRESSIONS.keys()))
+    return re.compile(rf'.+?\.(({formats})(\.({compressions}))?)$')
+
+
+def split_extension(ext):
+    '''Split an extension into its format and compression.
+
+    :param ext: the extension
+    :returns: a pair of the format extension and compression extension (or None)'''
+    vs = ext.split('.', 1)
+    return (vs[0], vs[1] if len(vs) > 1 else None)
+
+
+def canonical_extension(compression=None):
+    '''Return the extension for files in the canonical storage format.
+
+    :param compression: (optional) the compression (defaults to CANONICAL_COMPRESSION)
+    :returns: the extension'''
+    return f'{CANONICAL_FORMAT}.{compression or CANONICAL_COMPRESSION}'
+
+
+def portable(source, ext):
+    '''Test whether a file can be decompressed without any of the
+    archive's private zstd dictionaries, and so can be given to
+    clients as-is.
+
+    :param source: the filename or (peekable) file object
+    :param ext: the file's extension
+    :returns: True if the file is portable'''
+    (_, c) = split_extension(ext)
+    return c != 'zst' or dictionary_id(source) == 0
+
+
+# ---------- Conversion and loading ----------
+
+def items(source, ext):
+    '''Return a stream of the nodes and edges in a file.
+
+    :param source: the filename or file object
+    :param ext: the file's extension
+    :returns: a generator of node and edge tuples'''
+    (f, c) = split_extension(ext)
+    with open_compressed(source, c) as fh:
+        yield from FORMATS[f].items(fh)
+
+
+def convert(source, ext, out, compression=None, dict_id=None):
+    '''Convert a file to the canonical storage format, streaming
+    the nodes and edges through rather than loading the network.
+
+    :param source: the filename or file object to convert
+    :param ext: the file's extension
+    :param out: the filename or file object to write the converted network to
+    :param compression: (optional) the compression (defaults to CANONICAL_COMPRESSION)
+    :param dict_id: (optional) zstd dictionary to compress with'''
+    write(source, ext, out, canonical_extension(compression), dict_id)
+
+
+def write(source, ext, out, outext, dict_id=None):
+    '''Write a network in a different format and compression,
+    streaming the nodes and edges through.
+
+    :param source: the filename or file object to convert
+    :param ext: the file's extension
+    :param out: the filename or file object to write to
+    :param outext: the extension of the format and compression to write
+    :param dict_id: (optional) zstd dictionary to compress with'''
+    (f, c) = split_extension(outext)
+    with open_compressed(out, c, 'wb', dict_id) as fh:
+        FORMATS[f].write(items(source, ext), fh)
+
+
+def mimetype(ext):
+    '''Return the MIME type of a file with the given extension.
+
+    :param ext: the extension
+    :returns: the MIME type'''
+    (f, c) = split_extension(ext)
+    return FORMATS[f].MIMETYPE if c is None else COMPRESSION_MIMETYPES[c]
+
+
+def load(source, ext):
+    '''Load a network into memory.
+
+    :param source: the filename or file object
+    :param ext: the file's extension
+    :returns: the networkx representation of the network'''
+    from networkx import Graph
+
+    g = Graph()
+    for item in items(source, ext):
+        if len(item) == 1:
+            g.add_node(item[0])
+        else:
+            g.add_edge(*item)
+    return g
@@ -92,6 +92,7 @@ class EditNetwork(FlaskForm):
 
 class SearchNetworks(FlaskForm):
 
+    text = StringField('Title or description')
     tags = TagField('Tags')
     metadata = StringField('Metadata')
     add_tag = StringField('New tag')
@@ -0,0 +1,121 @@
+# Full-text search over network titles and descriptions
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import re
+from sqlalchemy import DDL, event, func, table, column, literal_column, select, and_, or_, literal
+from epydemicarchive import db
+
+# Full-text search uses whatever the database provides. Under SQLite
+# this is an FTS5 table holding a copy of each summary's title and
+# description, kept up to date by triggers; under PostgreSQL it is an
+# expression index over the summary table itself, which needs no
+# maintenance. Other databases fall back to (unranked and unindexed)
+# substring matching.
+
+
+#: Name of the SQLite FTS5 table.
+TABLE = 'network_text'
+
+#: Text search configuration used by PostgreSQL.
+LANGUAGE = 'english'
+
+#: The document indexed by PostgreSQL. This must be identical in the
+#: index and in queries for the index to be used.
+TSVECTOR = f"to_tsvector('{LANGUAGE}', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+#: Relative weights of title and description when ranking under SQLite.
+WEIGHTS = (2.0, 1.0)
+
+# DDL for the FTS5 table and the triggers that maintain it
+SQLITE_DDL = [
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(id UNINDEXED, title, description)',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON network_summary BEGIN
+          INSERT INTO {TABLE} (id, title, description) VALUES (new.id, new.title, new.description);
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_update AFTER UPDATE OF title, description ON network_summary BEGIN
+          UPDATE {TABLE} SET title = new.title, description = new.description WHERE id = old.id;
+        END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON network_summary BEGIN
+          DELETE FROM {TABLE} WHERE id = old.id;
+        END''',
+]
+
+# DDL for the PostgreSQL index
+POSTGRESQL_DDL = [
+    f'CREATE INDEX IF NOT EXISTS ix_network_summary_text ON network_summary USING gin ({TSVECTOR})',
+]
+
+
+def install(table):
+    '''Arrange for the full-text index to be created and dropped alongside
+    the summary table.
+
+    :param table: the summary table'''
+    for ddl in SQLITE_DDL:
+        event.listen(table, 'after_create', DDL(ddl).execute_if(dialect='sqlite'))
+    event.listen(table, 'after_drop', DDL(f'DROP TABLE IF EXISTS {TABLE}').execute_if(dialect='sqlite'))
+    for ddl in POSTGRESQL_DDL:
+        event.listen(table, 'after_create', DDL(ddl).execute_if(dialect='postgresql'))
+
+
+def words(text):
+    '''Split a query into words, discarding any punctuation that would
+    otherwise be interpreted as query syntax.
+
+    :param text: the query text
+    :returns: a list of words'''
+    return re.findall(r'\w+', text)
+
+
+def match(text):
+    '''Return a query selecting the UUIDs of the summaries matching
+    all the words in the given text, together with a score for each
+    where higher scores are better matches.
+
+    :param text: the query text
+    :returns: a selectable with columns id and score, or None if the text has no words'''
+    from epydemicarchive.archive.models import NetworkSummary
+
+    ws = words(text)
+    if len(ws) == 0:
+        return None
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # sd: quoting each word makes it a string rather than an FTS5 keyword
+        q = ' '.join(['"{w}"'.format(w=w.replace('"', '""')) for w in ws])
+        text = table(TABLE, column('id'))
+        fts = literal_column(TABLE)
+        bm25 = func.bm25(fts, 0.0, *WEIGHTS)
+        return select(text.c.id.label('id'), (-bm25).label('score')) \
+            .where(fts.op('MATCH')(q)) \
+            .subquery()
+    elif dialect == 'postgresql':
+        doc = literal_column(TSVECTOR)
+        tsq = func.plainto_tsquery(literal_column(f"'{LANGUAGE}'"), ' '.join(ws))
+        return select(NetworkSummary.id.label('id'), func.ts_rank_cd(doc, tsq).label('score')) \
+            .where(doc.op('@@')(tsq)) \
+            .subquery()
+    else:
+        conds = [or_(func.lower(NetworkSummary.title).contains(w.lower(), autoescape=True),
+                     func.lower(NetworkSummary.description).contains(w.lower(), autoescape=True))
+                 for w in ws]
+        return select(NetworkSummary.id.label('id'), literal(0.0).label('score')) \
+            .where(and_(*conds)) \
+            .subquery()
@@ -17,18 +17,21 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-import os
-import re
 import uuid
 from datetime import datetime
-import networkx
 from flask import current_app
-from epydemicarchive import db
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from epydemicarchive import db, storage
+from epydemicarchive.storage import on_commit, on_rollback
+from epydemicarchive.archive import formats, fulltext
+from epydemicarchive.archive.cache import VariantCache
 
 
 tags = db.Table('tags',
                 db.Column('network', db.ForeignKey('network.id'), primary_key=True),
-                db.Column('tag', db.ForeignKey('tag.id'), primary_key=True))
+                db.Column('tag', db.ForeignKey('tag.id'), primary_key=True),
+                db.Index('ix_tags_tag_network', 'tag', 'network'))
 
 
 class Network(db.Model):
@@ -36,37 +39,26 @@ class Network(db.Model):
     in the archive.
     '''
 
-    # The file types of networks we recognise, with their names
-    # and fuloader functions
-    FILETYPES = {
-        'al': ('adjacency list', networkx.read_adjlist),
-    }
-
-    # The file types of compressions we recognise
-    COMPRESSIONS = [ 'gz', 'bz2']
-
-    # The regexp for all the acceptable extensions for network files
-    # sd: should be constructed from the above
-    NetworkFileExtensions = re.compile(r'.+?\.(al.gz)$')
-
-    # The regexp to extract the file's type (extension)
-    # sd: should be constructed from the above
-    NetworkFileType = re.compile(r'.+?\.([a-zA-Z0-9]+)(\.((gz)|(bz2)))?$')
+    # The regexp for all the acceptable extensions for network files,
+    # constructed from the registered formats and compressions
+    NetworkFileExtensions = formats.extensions_pattern()
 
     # Location information
     id = db.Column(db.String(64), primary_key=True)
-    filename = db.Column(db.String(256))             # relative to ARCHIVE_DIR
+    filename = db.Column(db.String(256))             # key in the storage backend
 
     # Lifecycle
-    uploaded = db.Column(db.DateTime)
+    uploaded = db.Column(db.DateTime, index=True)
     available = db.Column(db.Boolean)
+    analysis_error = db.Column(db.String(1024))      # reason the last analysis failed
+    staged = None                                    # key of a new network's file until committed
 
     # Metadata
     title = db.Column(db.String(256))
     description = db.Column(db.String(1024))
     tags = db.relationship('Tag', secondary=tags, lazy='subquery',
                            backref=db.backref('networks', lazy=True))
-    user_id = db.Column(db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.ForeignKey('user.id'), nullable=False, index=True)
     owner = db.relationship('User', backref=db.backref('networks', lazy=True))
 
 
@@ -76,36 +68,28 @@ class Network(db.Model):
         :returns: the network's tags'''
         return [tag.name for tag in self.tags]
 
-    def network_filename(self):
-        '''Return the file in the archive holding the network.
+    def open_network(self):
+        '''Open the stored file holding the network. The file of a
+        newly-created network is read from where it was staged until
+        the network is committed.
 
-        :returns: the filename'''
-        return os.path.join(current_app.config['ARCHIVE_DIR'],
-                            self.filename)
+        :returns: a binary file object'''
+        return storage.open_read(self.staged or self.filename)
 
     def load_network(self):
         '''Load the network into memory using networkx. This involves
-        working out the type of network representation uploaded.
+        working out the type of network representation stored.
 
         :returns: the raw network'''
-        filename = self.network_filename()
 
         # extract the file type from the filename
-        m = Network.NetworkFileType.match(filename)
-        if m is None:
+        ext = Network.is_acceptable_file(self.filename)
+        if ext is None:
             raise Exception('Can\'t determine network type')
-        t = m[1]
 
         # read network
-        if t in self.FILETYPES:
-            # use the loader function to load the network
-            (_, loader) = self.FILETYPES[t]
-            g = loader(filename)
-        else:
-            # unknown type
-            raise Exception(f'Unknown network file type {t}')
-
-        return g
+        with self.open_network() as fh:
+            return formats.load(fh, ext)
 
     def get(self, key, default=None):
         '''Return the given metadata element. The default is returned
@@ -137,17 +121,41 @@ class Network(db.Model):
 
     @staticmethod
     def is_acceptable_file(filename):
-        '''Test whether the given filename has an acceptable extension.
-        This is a sub-set of the file types handled by NetworkX.
+        '''Test whether the given filename has an acceptable extension,
+        being one of the registered formats optionally followed by
+        one of the registered compressions.
 
         :param filename: the filename
         :returns: the network model's acceptable extension, or None'''
         m = Network.NetworkFileExtensions.match(filename)
         return None if m is None else m[1]
 
+    @staticmethod
+    def storage_extension():
+        '''Return the extension of networks as stored, in the canonical
+        format with the configured compression.
+
+        :returns: the extension'''
+        return formats.canonical_extension(current_app.config['STORAGE_COMPRESSION'])
+
+    @staticmethod
+    def store_network(source, ext, out):
+        '''Convert a network file into the storage format, compressing
+        with the configured compression and dictionary.
+
+        :param source: the file object to convert
+        :param ext: the file's extension
+        :param out: the file object to store the network in'''
+        formats.convert(source, ext, out,
+                        current_app.config['STORAGE_COMPRESSION'],
+                        current_app.config['STORAGE_DICTIONARY'])
+
     @staticmethod
     def create_network(user, filename, data, title, desc, tags):
-        '''Create a new network object.
+        '''Create a new network object. Networks uploaded in formats
+        other than the archive's canonical storage format are converted
+        as they're stored. The network's file is staged, and only moved
+        into place when the new network is committed.
 
         :param user: the owner of the network
         :param filename: the filename of the uploaded network
@@ -160,42 +168,65 @@ class Network(db.Model):
         # create a UUID for this new network
         id = str(uuid.uuid4())
 
-        # construct a filename for the uploaded network, maintaining
-        # the original extension
+        # construct a filename for the network in the canonical format
         ext = Network.is_acceptable_file(filename)
-        basename = f'{id}.{ext}'
-        full = os.path.join(current_app.config['ARCHIVE_DIR'],
-                            basename)
-
-        # save the uploaded network into the archive directory
-        data.save(full)
+        if ext is None:
+            raise Exception(f'File {filename} does not have a recognised extension')
+        key = storage.key(id, Network.storage_extension())
+        staged = f'{key}.staged'
+
+        # stream the uploaded network into the store, converting
+        # it if necessary, staging it alongside its final key
+        with storage.open_write(staged) as fh:
+            if ext == Network.storage_extension() and current_app.config['STORAGE_DICTIONARY'] is None:
+                data.save(fh)
+            else:
+                Network.store_network(data.stream, ext, fh)
 
         # create the network
         now = datetime.utcnow()
         n = Network(id=id,
-                    filename=basename,
+                    filename=key,
                     owner=user,
                     uploaded=now,
                     available=False,
                     title=title,
                     description=desc,
                     tags=Tag.ensure_tags(tags))
+        n.staged = staged
         db.session.add(n)
+        NetworkSummary.refresh(n)
+
+        # move the file into place once the network is committed,
+        # and discard it if it isn't
+        backend = storage.backend()
+
+        def commit():
+            backend.rename(staged, key)
+            n.staged = None
+        on_commit(db.session(), commit)
+        on_rollback(db.session(), lambda: backend.delete(staged))
 
         return n
 
     @staticmethod
     def delete_network(n):
-        '''Delete the network from the archive.
+        '''Delete the network from the archive. The network's file is
+        deleted when the deletion is committed.
 
         :param n: the network'''
 
         # delete the network record
         db.session.delete(n)
 
-        # delete network file -- in this order to make
-        # sure we don't end up with dangling files
-        os.remove(n.network_filename())
+        # delete the network file and any cached variants, but only
+        # once the deletion has been committed
+        backend = storage.backend()
+        cache = VariantCache.from_config()
+        (id, key) = (n.id, n.filename)
+        on_commit(db.session(), lambda: backend.delete(key))
+        on_commit(db.session(), lambda: cache.invalidate(id))
+        on_commit(db.session(), NetworkSummary.changed)
 
 
 class Tag(db.Model):
@@ -204,32 +235,83 @@ class Tag(db.Model):
     '''
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(32), index=True)
+    name = db.Column(db.String(32), index=True, unique=True)
+
+    @staticmethod
+    def ids():
+        '''Return the cache of tag ids, mapping names to ids. Tags are
+        never deleted, so the cache only ever grows, and it only holds
+        tags that have been committed.
+
+        :returns: a dict from names to ids'''
+        return current_app.extensions.setdefault('tags', dict())
+
+    @staticmethod
+    def insert_tags(names):
+        '''Add the given tags to the table if they aren't there already,
+        in a single statement where the database supports it.
+
+        :param names: the tag names'''
+        dialect = db.engine.dialect.name
+        if dialect in ['sqlite', 'postgresql']:
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(Tag.__table__).values([dict(name=name) for name in names])
+            db.session.execute(stmt.on_conflict_do_nothing(index_elements=['name']))
+        else:
+            for name in names:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(Tag.__table__.insert().values(name=name))
+                except IntegrityError:
+                    pass
 
     @staticmethod
     def create_tag(tag):
         '''Ensure that a tag exists in the tags table. Tags are
         always normalised to be lower case.
 
-        :param tag: the tag'''
-        tag = tag.lower()
-        t = Tag.query.filter_by(name=tag).first()
-        if t is None:
-            # no such tag, add it to the table
-            t = Tag(name=tag)
-            db.session.add(t)
-        return t
+        :param tag: the tag
+        :returns: the Tag object'''
+        return Tag.ensure_tags([tag])[0]
 
     @staticmethod
     def ensure_tags(tags):
-        '''Ensure all tags exist in the table.
+        '''Ensure all tags exist in the table. Tags are normalised
+        to lower case and duplicates removed, preserving their order.
+
+        Tags already known to exist are taken from the cache without
+        touching the database. Any others are added in one statement,
+        without disturbing any that have been added concurrently, and
+        then loaded in one query.
 
         :param tags: a list of tags
         :returns: a list of Tag objects'''
-        alltags = []
-        for tag in tags:
-            alltags.append(Tag.create_tag(tag))
-        return alltags
+        names = list(dict.fromkeys([tag.lower() for tag in tags]))
+        ids = Tag.ids()
+
+        # sd: merging without loading makes a cached tag persistent
+        # without a query
+        alltags = dict()
+        for name in names:
+            if name in ids:
+                t = Tag(id=ids[name], name=name)
+                make_transient_to_detached(t)
+                alltags[name] = db.session.merge(t, load=False)
+
+        # add any tags we haven't seen
+        missing = [name for name in names if name not in alltags]
+        if len(missing) > 0:
+            Tag.insert_tags(missing)
+            ts = Tag.query.filter(Tag.name.in_(missing)).all()
+            for t in ts:
+                alltags[t.name] = t
+            newids = {t.name: t.id for t in ts}
+            on_commit(db.session(), lambda: ids.update(newids))
+
+        return [alltags[name] for name in names]
 
 
 class Metadata(db.Model):
@@ -241,5 +323,128 @@ class Metadata(db.Model):
                               backref=db.backref('metadata', lazy=True,
                                                  cascade='all, delete-orphan'),
                               cascade='all')
-    key = db.Column(db.String(32), index=True)
+    analyser = db.Column(db.String(32))              # analyser that generated it
+    key = db.Column(db.String(32))
     value = db.Column(db.String(128))
+
+    # sd: the first index serves a network's metadata, the second
+    # finds networks by value (notably by fingerprint)
+    __table_args__ = (db.Index('ix_metadata_network_id_key', 'network_id', 'key'),
+                      db.Index('ix_metadata_key_value', 'key', 'value'))
+
+
+class Analysis(db.Model):
+    '''A record of an analyser having been run over a network, used
+    to find networks whose analysis is missing or out of date.'''
+
+    id = db.Column(db.Integer, primary_key=True)
+    network_id = db.Column(db.ForeignKey('network.id'), nullable=False, index=True)
+    network = db.relationship('Network',
+                              backref=db.backref('analyses', lazy=True,
+                                                 cascade='all, delete-orphan'))
+    analyser = db.Column(db.String(32), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    analysed = db.Column(db.DateTime)
+    wall_time = db.Column(db.Float)                  # seconds, if the analyser was run
+    cpu_time = db.Column(db.Float)                   # seconds
+    peak_rss = db.Column(db.BigInteger)              # bytes
+
+    __table_args__ = (db.UniqueConstraint('network_id', 'analyser'),)
+
+    def set_usage(self, usage):
+        '''Record the resources used by the run.
+
+        :param usage: a dict of resources, or None if the analyser wasn't run'''
+        usage = usage or dict()
+        self.wall_time = usage.get('wall')
+        self.cpu_time = usage.get('cpu')
+        self.peak_rss = usage.get('rss')
+
+
+class NetworkSummary(db.Model):
+    '''A denormalised summary of a network, holding everything needed
+    to list, display and search for it in a single row. Summaries are
+    refreshed whenever a network is created, edited or analysed.'''
+
+    #: Metadata keys that also have their own numeric columns.
+    CORE = {'N': int, 'M': int, 'kmin': int, 'kmax': int, 'kmean': float}
+
+    #: Incremented whenever changes to summaries are committed by this
+    #: process, so that anything derived from them can be invalidated.
+    generation = 0
+
+    id = db.Column(db.ForeignKey('network.id'), primary_key=True)
+    network = db.relationship('Network',
+                              backref=db.backref('summary', lazy=True, uselist=False,
+                                                 cascade='all, delete-orphan'))
+    title = db.Column(db.String(256))
+    description = db.Column(db.Text)
+    owner_email = db.Column(db.String(120))
+    uploaded = db.Column(db.DateTime)
+    analysis_error = db.Column(db.String(1024))
+    tags = db.Column(db.Text)                           # tag names, delimited by |
+    N = db.Column(db.Integer, index=True)
+    M = db.Column(db.Integer, index=True)
+    kmin = db.Column(db.Integer, index=True)
+    kmax = db.Column(db.Integer, index=True)
+    kmean = db.Column(db.Float, index=True)
+    meta = db.Column(db.JSON)                        # all metadata, as strings
+
+    # sd: the order in which unranked search results are listed
+    __table_args__ = (db.Index('ix_network_summary_uploaded_id', 'uploaded', 'id'),)
+
+    def tagnames(self):
+        '''Return a list of tag names.
+
+        :returns: the network's tags'''
+        return [t for t in self.tags.split('|') if t != '']
+
+    def metadata_dict(self):
+        '''Return the network's metadata. (This can't be called
+        "metadata", which is reserved by SQLAlchemy.)
+
+        :returns: a dict of metadata values'''
+        return dict(self.meta or {})
+
+    @staticmethod
+    def tagstring(tags):
+        '''Return the delimited string representing a list of tags.
+
+        :param tags: the tag names
+        :returns: the string'''
+        return '|' + ''.join([f'{t}|' for t in tags])
+
+    @staticmethod
+    def changed():
+        '''Note that summaries have changed.'''
+        NetworkSummary.generation += 1
+
+    @staticmethod
+    def refresh(n):
+        '''Bring a network's summary up to date.
+
+        :param n: the network
+        :returns: the summary'''
+        s = n.summary
+        if s is None:
+            s = NetworkSummary(network=n)
+            db.session.add(s)
+        on_commit(db.session(), NetworkSummary.changed)
+        s.title = n.title
+        s.description = n.description
+        s.owner_email = n.owner.email
+        s.uploaded = n.uploaded
+        s.analysis_error = n.analysis_error
+        s.tags = NetworkSummary.tagstring(n.tagnames())
+        meta = {m.key: m.value for m in n.metadata}
+        s.meta = meta
+        for (k, t) in NetworkSummary.CORE.items():
+            try:
+                setattr(s, k, t(float(meta[k])) if k in meta else None)
+            except ValueError:
+                setattr(s, k, None)
+        return s
+
+
+# full-text index over the summaries' titles and descriptions
+fulltext.install(NetworkSummary.__table__)
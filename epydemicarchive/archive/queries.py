@@ -18,7 +18,8 @@
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
 from epydemicarchive import db
-from epydemicarchive.archive.models import Network, Tag, Metadata
+from epydemicarchive.archive import fulltext
+from epydemicarchive.archive.models import NetworkSummary, Tag, tags
 
 
 class QueryNetworks:
@@ -33,33 +34,68 @@ class QueryNetworks:
         'between': '<=>',
     }
 
-    def __init__(self, tags, terms):
+    def __init__(self, tags, terms, text=None):
         self._tags = tags
         self._terms = terms
+        self._text = text
+        self._score = None
 
-        # sd: we user outerjoin() here to get the networks that don't
-        # have tags or metadata as well as those that do: join() would
-        # discard the former
-        self._q = Network.query.outerjoin(Network.tags)
+        # sd: queries run against the network summaries, so each
+        # constraint is a filter on a single table
+        self._q = NetworkSummary.query
         for tag in tags:
             self.add_tag(tag)
-        self._q = self._q.outerjoin(Network.metadata)
         for term in terms:
             self.add_term(term)
+        if text:
+            self.add_text(text)
 
     def add_tag(self, tag):
-        self._q = self._q.filter(Tag.name == tag)
+        # sd: tagged networks are found through the (tag, network)
+        # index, rather than by scanning the summaries' tag strings
+        tagged = db.session.query(tags.c.network).join(Tag, Tag.id == tags.c.tag).filter(Tag.name == tag.lower())
+        self._q = self._q.filter(NetworkSummary.id.in_(tagged))
 
     def add_term(self, term):
         f = self.filter(term)
         self._q = f(self._q)
 
+    def add_text(self, text):
+        m = fulltext.match(text)
+        if m is not None:
+            self._q = self._q.join(m, m.c.id == NetworkSummary.id)
+            self._score = m.c.score
+
     def all(self):
         return list(self._q.all())
 
+    def query(self):
+        return self._q
+
+    def ranked(self):
+        '''Return the query with its results ordered best match first
+        if there is a text constraint, and most recent first otherwise.
+
+        :returns: the query'''
+        if self._score is not None:
+            return self._q.order_by(self._score.desc(), NetworkSummary.id)
+        else:
+            return self._q.order_by(NetworkSummary.uploaded.desc(), NetworkSummary.id.desc())
+
+    def page(self, page, per_page):
+        '''Return a page of the ranked results.
+
+        :param page: the page number, starting from 1
+        :param per_page: the number of results per page
+        :returns: a pagination object'''
+        return self.ranked().paginate(page=page, per_page=per_page, error_out=False)
+
     def tags(self):
         return self._tags
 
+    def text(self):
+        return self._text
+
     def terms(self):
         ts = []
         for term in self._terms:
@@ -74,6 +110,21 @@ class QueryNetworks:
                                             v=v))
         return ts
 
+    def column(self, key, v):
+        '''Return the column and value to compare for a metadata
+        key. Core metadata is compared numerically, and anything
+        else as strings.
+
+        :param key: the metadata key
+        :param v: the value
+        :returns: a pair of column and value'''
+        if key in NetworkSummary.CORE:
+            try:
+                return (getattr(NetworkSummary, key), float(v))
+            except ValueError:
+                pass
+        return (NetworkSummary.meta[key].as_string(), str(v))
+
     def filter(self, term):
         op = term['operator']
         f = None
@@ -95,44 +146,51 @@ class QueryNetworks:
         return f(term)
 
     def query_equal(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value == term['value'])
+            return q.filter(c == v)
         return f
 
     def query_notequal(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value != term['value'])
+            return q.filter(c != v)
         return f
 
     def query_lessthan(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value < term['value'])
+            return q.filter(c < v)
         return f
 
     def query_lessthanorequal(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value <= term['value'])
+            return q.filter(c <= v)
         return f
 
     def query_greaterthan(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value > term['value'])
+            return q.filter(c > v)
         return f
 
     def query_greaterthanorequal(self, term):
+        (c, v) = self.column(term['key'], term['value'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value >= term['value'])
+            return q.filter(c >= v)
         return f
 
     def query_between(self, term):
+        (c, low) = self.column(term['key'], term['low'])
+        (c, high) = self.column(term['key'], term['high'])
+
         def f(q):
-            return q.filter(Metadata.key == term['key'],
-                            Metadata.value >= term['low'],
-                            Metadata.value <= term['high'])
+            return q.filter(c >= low, c <= high)
         return f
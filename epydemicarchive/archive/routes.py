@@ -17,17 +17,17 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-import os
 import logging
-from flask import render_template, flash, redirect, url_for, send_file, session
+from flask import render_template, flash, redirect, url_for, session, request, current_app
 from flask_login import current_user
-from wtforms import FormField
 from markupsafe import escape
 from epydemicarchive import db, analyser
 from epydemicarchive.archive import archive
 from epydemicarchive.archive.forms import UploadNetwork, EditNetwork, SearchNetworks
-from epydemicarchive.archive.models import Network, Tag
+from epydemicarchive.archive.models import Network, Tag, NetworkSummary
+from epydemicarchive.archive.cache import send_network
 from epydemicarchive.archive.queries import QueryNetworks
+from epydemicarchive.archive.facets import facets
 
 logger = logging.getLogger(__name__)
 
@@ -50,10 +50,13 @@ def upload():
 
             # extract metadata for the network
             # TODO: this should be asynchronous
-            analyser.analyse(n)
+            analysed = analyser.analyse(n)
 
             db.session.commit()
-            flash(f'New network uploaded as {uuid}', 'success')
+            if analysed:
+                flash(f'New network uploaded as {uuid}', 'success')
+            else:
+                flash(f'New network uploaded as {uuid}, but analysis failed: {n.analysis_error}', 'warning')
             logger.info(f'Network {uuid} uploaded')
         except Exception as e:
             flash(f'Problem uploading network: {e}', 'error')
@@ -67,7 +70,7 @@ def upload():
 @archive.route('/browse')
 def browse():
     '''Browse all the available networks.'''
-    networks = Network.query.all()
+    networks = NetworkSummary.query.all()
     return render_template('browse.tmpl', title='Browse networks', networks=networks)
 
 
@@ -94,7 +97,7 @@ def edit(id):
                 flash('Edit cancelled', 'info')
         elif form.download.data:
             # user downloaded network, send as a file
-            return send_file(n.network_filename(), as_attachment=True)
+            return send_network(n, as_attachment=True)
 
         # the next two commands are only available to the owner of
         # the network. They are only presented to the owner in the
@@ -111,7 +114,7 @@ def edit(id):
                 flash(f'Network {id} deleted', 'success')
                 logger.info(f'Network {id} deleted')
             else:
-                flash(f'Can\'t delete a network you don\'t own', 'error')
+                flash('Can\'t delete a network you don\'t own', 'error')
         else:
             if current_user == n.owner:
                 try:
@@ -119,6 +122,7 @@ def edit(id):
                     n.title = escape(form.title.data)
                     n.description = escape(form.description.data)
                     n.tags = Tag.ensure_tags(form.tags.data)
+                    NetworkSummary.refresh(n)
 
                     db.session.commit()
 
@@ -127,7 +131,7 @@ def edit(id):
                 except Exception as e:
                     flash(f'Problem editing network: {e}', 'error')
             else:
-                flash(f'Can\'t edit a network you don\'t own', 'error')
+                flash('Can\'t edit a network you don\'t own', 'error')
 
         # jump back to browsing page
         return redirect(url_for('.browse'))
@@ -140,6 +144,7 @@ def search():
     '''Search the archive, using tags and metadata values to narrow the choice.'''
     session['tags'] = []
     session['metadata'] = []
+    session['text'] = ''
     return redirect(url_for('.refine'))
 
 
@@ -148,31 +153,36 @@ def refine():
     '''Search the archive, using tags and metadata values to narrow the choice.'''
     tags = session.get('tags', [])
     metadata = session.get('metadata', [])
+    text = session.get('text', '')
+    page = request.args.get('page', 1, type=int)
 
     # restrict the networks according to the current constraints
-    qn = QueryNetworks(tags, metadata)
-    networks = qn.all()
+    qn = QueryNetworks(tags, metadata, text)
+    networks = qn.page(page, current_app.config['SEARCH_PAGE_SIZE'])
+    fs = facets(qn)
 
     # populate the form
     form = SearchNetworks()
+    if not form.is_submitted():
+        form.text.data = text
     form.tags.data = qn.tags()
     form.metadata.data = ', '.join(qn.terms())
 
     if form.validate_on_submit():
         if form.refine.data:
+            session['text'] = (form.text.data or '').strip()
+            # sd: the session only notices assignments, not
+            # changes to the lists it holds
             if form.add_tag.data:
                 # additional tags
-                print(form.add_tag.data)
-                session['tags'].append(form.add_tag.data)
-                print('new tags')
-                print(session['tags'])
-            elif form.add_meta_key:
+                session['tags'] = tags + [form.add_tag.data]
+            elif form.add_meta_key.data:
                 # additional metadata
                 k = form.add_meta_key.data
                 v = form.add_meta_value.data
-                session['metadata'].append({'key': k,
-                                            'operator': 'equal',
-                                            'value': v})
+                session['metadata'] = metadata + [{'key': k,
+                                                   'operator': 'equal',
+                                                   'value': v}]
 
             return redirect(url_for('.refine'))
 
@@ -182,4 +192,35 @@ def refine():
 
     return render_template('search.tmpl', title='Search the archive',
                            networks=networks,
+                           facets=fs,
                            form=form)
+
+
+@archive.route('/refine/tag/<tag>')
+def refine_tag(tag):
+    '''Narrow the current search to networks with the given tag.
+
+    :param tag: the tag'''
+    tags = session.get('tags', [])
+    if tag not in tags:
+        session['tags'] = tags + [tag]
+    return redirect(url_for('.refine'))
+
+
+@archive.route('/refine/range/<key>')
+def refine_range(key):
+    '''Narrow the current search to networks whose metadata value
+    for the given key lies in the range given by the "low" and
+    "high" query parameters.
+
+    :param key: the metadata key'''
+    low = request.args.get('low')
+    high = request.args.get('high')
+    if low is None or high is None:
+        flash('Range needs both low and high values', 'error')
+    else:
+        session['metadata'] = session.get('metadata', []) + [{'key': key,
+                                                              'operator': 'between',
+                                                              'low': low,
+                                                              'high': high}]
+    return redirect(url_for('.refine'))
@@ -0,0 +1,164 @@
+# Database connection tuning
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import sqlite3
+import logging
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+
+#: Tuning profiles. The default profile suits development and light
+#: use; the concurrent profile suits several server processes sharing
+#: a database, such as gunicorn workers. SQLite settings are applied as
+#: pragmas on each new connection; pool settings apply to client-server
+#: databases such as PostgreSQL.
+PROFILES = {
+    'default': {
+        'SQLITE_JOURNAL_MODE': None,
+        'SQLITE_SYNCHRONOUS': None,
+        'SQLITE_BUSY_TIMEOUT': 5000,                # ms
+        'SQLITE_MMAP_SIZE': None,
+        'DATABASE_POOL_SIZE': 5,
+        'DATABASE_MAX_OVERFLOW': 10,
+        'DATABASE_POOL_TIMEOUT': 30,                # s
+        'DATABASE_POOL_RECYCLE': 3600,              # s
+        'DATABASE_POOL_PRE_PING': True,
+    },
+    'concurrent': {
+        'SQLITE_JOURNAL_MODE': 'WAL',
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'SQLITE_BUSY_TIMEOUT': 30000,
+        'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,      # bytes
+        'DATABASE_POOL_SIZE': 10,
+        'DATABASE_MAX_OVERFLOW': 20,
+        'DATABASE_POOL_TIMEOUT': 10,
+        'DATABASE_POOL_RECYCLE': 1800,
+        'DATABASE_POOL_PRE_PING': True,
+    },
+}
+
+
+#: Types of the settings, used to convert values taken from the environment.
+TYPES = {
+    'SQLITE_JOURNAL_MODE': str,
+    'SQLITE_SYNCHRONOUS': str,
+    'SQLITE_BUSY_TIMEOUT': int,
+    'SQLITE_MMAP_SIZE': int,
+    'DATABASE_POOL_SIZE': int,
+    'DATABASE_MAX_OVERFLOW': int,
+    'DATABASE_POOL_TIMEOUT': int,
+    'DATABASE_POOL_RECYCLE': int,
+    'DATABASE_POOL_PRE_PING': bool,
+}
+
+
+def setting(config, k):
+    '''Return a tuning setting, taken from the configuration if set
+    there explicitly and otherwise from the selected profile.
+
+    :param config: the configuration
+    :param k: the setting
+    :returns: the value'''
+    v = config.get(k)
+    if v is not None:
+        if isinstance(v, str):
+            if TYPES[k] is bool:
+                v = v.lower() in ['yes', 'true', '1']
+            else:
+                v = TYPES[k](v)
+        return v
+    profile = config.get('DATABASE_PROFILE') or 'default'
+    if profile not in PROFILES:
+        raise Exception(f'Unknown database profile {profile}')
+    return PROFILES[profile][k]
+
+
+def is_sqlite(config):
+    '''Test whether the configured database is SQLite.
+
+    :param config: the configuration
+    :returns: True if the database is SQLite'''
+    return make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite'
+
+
+def engine_options(config):
+    '''Return the engine options for the configured database, with any
+    options already configured taking precedence.
+
+    :param config: the configuration
+    :returns: a dict of options'''
+    options = dict()
+    if not is_sqlite(config):
+        # sd: SQLite's pools depend on whether the database is a file
+        # or in memory, and don't all accept sizes
+        options = dict(pool_size=setting(config, 'DATABASE_POOL_SIZE'),
+                       max_overflow=setting(config, 'DATABASE_MAX_OVERFLOW'),
+                       pool_timeout=setting(config, 'DATABASE_POOL_TIMEOUT'),
+                       pool_recycle=setting(config, 'DATABASE_POOL_RECYCLE'),
+                       pool_pre_ping=setting(config, 'DATABASE_POOL_PRE_PING'))
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or dict())
+    return options
+
+
+def pragmas(config):
+    '''Return the pragmas to apply to SQLite connections.
+
+    :param config: the configuration
+    :returns: a list of pragma statements'''
+    ps = []
+    mode = setting(config, 'SQLITE_JOURNAL_MODE')
+    if mode is not None:
+        ps.append(f'PRAGMA journal_mode={mode}')
+    sync = setting(config, 'SQLITE_SYNCHRONOUS')
+    if sync is not None:
+        ps.append(f'PRAGMA synchronous={sync}')
+    timeout = setting(config, 'SQLITE_BUSY_TIMEOUT')
+    if timeout is not None:
+        ps.append(f'PRAGMA busy_timeout={int(timeout)}')
+    mmap = setting(config, 'SQLITE_MMAP_SIZE')
+    if mmap is not None:
+        ps.append(f'PRAGMA mmap_size={int(mmap)}')
+    return ps
+
+
+def init_app(app, db):
+    '''Apply the tuning for the configured database to an application's
+    database connections. This must be called after the database has
+    been bound to the application.
+
+    :param app: the application
+    :param db: the database'''
+    if not is_sqlite(app.config):
+        return
+    ps = pragmas(app.config)
+    if len(ps) == 0:
+        return
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            cursor = dbapi_connection.cursor()
+            for p in ps:
+                cursor.execute(p)
+            cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', apply_pragmas)
+    logger.debug('SQLite connections will use ' + '; '.join(ps))
@@ -17,6 +17,16 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
+import logging
+import threading
+from datetime import datetime
+from importlib import import_module
+from contextlib import nullcontext
+from epydemicarchive import metrics, profiling
+from epydemicarchive.metadata.usage import ResourceUsage
+
+logger = logging.getLogger(__name__)
+
 
 class Analyser:
     '''An analyser is a class that examines a network submitted to
@@ -28,8 +38,38 @@ class Analyser:
     The actual analysis function is goven by overriding the :meth:`do`
     method, which is passed the network record in the archive and the
     `networkx` representaton of the network loaded from disc.
+
+    Each analyser has a name and a version, which are recorded against
+    every network it analyses. The version should be incremented
+    whenever a change to the analyser changes the metadata it generates,
+    so that networks analysed by earlier versions can be re-analysed.
+
+    An analyser whose results depend only on the structure of the
+    network, and not on how it is labelled or stored, can be marked
+    as structural. Its results may then be copied from another network
+    with the same fingerprint rather than being re-computed.
     '''
 
+    NAME = None          #: Name of the analyser (defaults to the lower-cased class name).
+    VERSION = 1          #: Version of the analyser.
+    STRUCTURAL = False   #: True if results can be shared between networks with the same structure.
+
+    def name(self):
+        '''Return the name of the analyser, under which its runs
+        and metadata are recorded.
+
+        :returns: the name'''
+        if self.NAME is None:
+            return type(self).__name__.lower()
+        else:
+            return self.NAME
+
+    def version(self):
+        '''Return the version of the analyser.
+
+        :returns: the version'''
+        return self.VERSION
+
     def do(self, n, g):
         '''Analyse the given network. This should be overridden by sub-classes.
 
@@ -38,16 +78,55 @@ class Analyser:
         raise NotImplementedError('analyse')
 
 
+def load_analyser(spec, **kwargs):
+    '''Create an analyser from a specification of the form
+    "module:name", where the name (which may be dotted) is a class or
+    function that is called with the keyword arguments to create the
+    analyser. Importing the module is deferred until this is called.
+
+    :param spec: the specification
+    :returns: the analyser'''
+    (module, _, name) = spec.partition(':')
+    if name == '':
+        raise Exception(f'Analyser {spec} should be given as module:name')
+    f = import_module(module)
+    for attr in name.split('.'):
+        f = getattr(f, attr)
+    return f(**kwargs)
+
+
 class AnalyserChain:
     '''An analyser chain is a collection of :class:`Analyser`s run sequentially.
+
+    Once a network's fingerprint is known (see
+    :class:`epydemicarchive.metadata.fingerprint.Fingerprint`), the chain
+    looks for another network with the same fingerprint and copies the
+    results of any structural analysers run over it at their current
+    version, rather than running them again. The network itself is only
+    loaded if some analyser actually needs to be run.
+
+    If the application is configured to do so (using the
+    ANALYSIS_SANDBOX, ANALYSIS_MEMORY_LIMIT, and ANALYSIS_CPU_LIMIT
+    settings), the analysers are run in a separate
+    :class:`epydemicarchive.metadata.sandbox.Sandbox` process with
+    limited resources. The sandbox never touches the database: results
+    are passed back to be recorded as each analyser completes, so a
+    failure part-way through keeps the results computed so far.
     '''
 
+    FINGERPRINT = 'fingerprint'    #: Metadata key for a network's structural fingerprint.
+    LOAD = '_load'                 #: Name under which the resources used to load networks are recorded.
+    ENTRY_POINTS = 'epydemicarchive.analysers'   #: Entry point group for analysers provided by other packages.
+
     def __init__(self, app=None):
         '''Create a new analyser chain.
 
         :param app: (optional) application to bind to'''
         self._db = None
-        self._chain = []
+        self._registered = []
+        self._chain = None
+        self._lock = threading.Lock()
+        self._sandbox = None
         if app is not None:
             self.init_app(app)
 
@@ -57,24 +136,264 @@ class AnalyserChain:
         :param app: the application t bind to'''
         from epydemicarchive import db
         self._db = db
-        self._chain = []
+        self._registered = []
+        self._chain = None
+
+        # set up the sandbox if required
+        self._sandbox = None
+        if app.config.get('ANALYSIS_SANDBOX', False):
+            from epydemicarchive.metadata.sandbox import Sandbox
+            self._sandbox = Sandbox(memory=app.config.get('ANALYSIS_MEMORY_LIMIT'),
+                                    cpu=app.config.get('ANALYSIS_CPU_LIMIT'),
+                                    initialise=self._sandboxed)
+
+    def register_analyser(self, a, **kwargs):
+        '''Add an analyser to the chain. The analyser can be given
+        directly, or as a specification to be passed (with any keyword
+        arguments) to :func:`load_analyser` when the chain is first used,
+        so that the analyser's module and its dependencies are only
+        imported by processes that actually run analyses.
+
+        :param a: the analyser or its specification
+        :param kwargs: (optional) arguments used to create the analyser'''
+        self._registered.append((a, kwargs))
+        self._chain = None
+
+    def register_entry_points(self, group=None):
+        '''Add the analysers registered as entry points by installed
+        packages. Each entry point names a class or function that
+        creates an analyser, and is only loaded when the chain
+        is first used.
 
-    def register_analyser(self, a):
-        '''Add an analyser to the chain.
+        :param group: (optional) the entry point group (defaults to ENTRY_POINTS)'''
+        from importlib.metadata import entry_points
+        if group is None:
+            group = self.ENTRY_POINTS
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=group)
+        else:
+            eps = eps.get(group, [])
+        for ep in eps:
+            self.register_analyser(ep.value)
 
-        :param a: the analyser'''
-        self._chain.append(a)
+    def analysers(self):
+        '''Return the analysers in the chain, in the order they run.
+        Any analysers registered by name are created the first time
+        this is called.
 
-    def analyse(self, n):
+        :returns: a list of analysers'''
+        if self._chain is None:
+            with self._lock:
+                if self._chain is None:
+                    chain = []
+                    for (a, kwargs) in self._registered:
+                        if isinstance(a, str):
+                            a = load_analyser(a, **kwargs)
+                        chain.append(a)
+                    self._chain = chain
+        return list(self._chain)
+
+    def outdated(self, n):
+        '''Return the analysers that have either not been run over
+        the given network, or were run at an earlier version.
+
+        :param n: the network's archive record
+        :returns: a list of analysers'''
+        done = {r.analyser: r.version for r in n.analyses}
+        return [a for a in self.analysers() if done.get(a.name(), 0) < a.version()]
+
+    def analyse(self, n, analysers=None):
         '''Run the analysis chain over the given network, populating
-        the metadata table appropriately.
+        the metadata table appropriately. By default all the analysers
+        in the chain are run: providing a list (for example from
+        :meth:`outdated`) runs only those, replacing any metadata
+        they generated previously.
+
+        Failures don't raise exceptions: instead the error is recorded
+        in the network's record and False is returned.
+
+        :param n: the network's archive record
+        :param analysers: (optional) the analysers to run
+        :returns: True if the analysis succeeded'''
+        if analysers is None:
+            analysers = self.analysers()
+        byname = {a.name(): a for a in analysers}
+
+        # if we already know the network's fingerprint, find any
+        # results we can re-use
+        fingerprint = n.get(self.FINGERPRINT)
+        reusable = None if fingerprint is None else self.reusable(n, fingerprint)
+
+        # load the network's record, so the sandbox doesn't have to
+        self._load(n)
+
+        # the database operations, which always happen in this process
+        services = dict(record=lambda name, rc, usage: self._record(n, byname[name], rc, usage),
+                        loaded=lambda usage: self._record_load(n, usage),
+                        reusable=lambda fingerprint: self.reusable(n, fingerprint))
+
+        def compute(call):
+            self._compute(call, n, analysers, reusable)
+
+        try:
+            if self._sandbox is None:
+                compute(lambda name, *args: services[name](*args))
+            else:
+                self._sandbox.run(compute, services)
+            n.analysis_error = None
+            ok = True
+        except Exception as e:
+            n.analysis_error = str(e)[:1024]
+            logger.warning(f'Analysis of network {n.id} failed: {e}')
+            ok = False
+
+        # update the network's summary with the new metadata
+        from epydemicarchive.archive.models import NetworkSummary
+        NetworkSummary.refresh(n)
+        return ok
+
+    def _load(self, n):
+        '''Load all the columns of a network's record that aren't
+        already loaded, so that they can be read in a sandbox without
+        touching the database.
 
         :param n: the network's archive record'''
-        from epydemicarchive.archive.models import Metadata
-        g = n.load_network()
-        for a in self._chain:
-            rc = a.do(n, g)
-            for k in rc:
-                m = Metadata(network=n,
-                             key=k, value=str(rc[k]))
-                self._db.session.add(m)
+        from sqlalchemy import inspect
+        for attr in inspect(n).mapper.column_attrs:
+            getattr(n, attr.key)
+
+    def _sandboxed(self):
+        '''Initialise a sandboxed process. The process mustn't use the
+        database connections it inherited from the parent, so these are
+        discarded (without closing them, as the parent is still using
+        them), and the sampled analysers are re-seeded so that they
+        don't all replay the same random numbers.'''
+        from epydemicarchive.metadata.sampled import SampledAnalyser
+        self._db.engine.dispose(close=False)
+        for a in self.analysers():
+            if isinstance(a, SampledAnalyser):
+                a.reseed()
+
+    def _compute(self, call, n, analysers, reusable):
+        '''Run the analysers over a network. This may run in a sandbox,
+        and so calls back for anything involving the database.
+
+        :param call: function to call the database services
+        :param n: the network's archive record
+        :param analysers: the analysers to run
+        :param reusable: results that can be re-used, or None'''
+        g = None
+        for a in analysers:
+            if a.STRUCTURAL and reusable is not None and a.name() in reusable:
+                # copy the results from an identical network
+                rc = reusable[a.name()]
+                usage = None
+            else:
+                # run the analyser, loading the network if we haven't already
+                if g is None:
+                    with ResourceUsage() as u:
+                        g = n.load_network()
+                    call('loaded', u.asdict())
+                with ResourceUsage() as u, self._profile(n, a):
+                    rc = a.do(n, g)
+                usage = u.asdict()
+            call('record', a.name(), rc, usage)
+
+            # if we've just found the fingerprint, look for re-usable results
+            if reusable is None and self.FINGERPRINT in rc:
+                reusable = call('reusable', rc[self.FINGERPRINT])
+
+    def _profile(self, n, a):
+        '''Return a context in which to run an analyser, which
+        profiles the run if the analyser is being profiled.
+
+        :param n: the network's archive record
+        :param a: the analyser
+        :returns: a context manager'''
+        if profiling.profiling_analyser(a.name()):
+            return profiling.Profile('analyser', f'{a.name()}-{n.id}')
+        else:
+            return nullcontext()
+
+    def reusable(self, n, fingerprint):
+        '''Find the results of structural analysers that can be re-used
+        for a network. These come from whichever other network with the
+        same fingerprint has the most runs of the current versions of
+        structural analysers, and only include those runs.
+
+        :param n: the network's archive record
+        :param fingerprint: the network's fingerprint
+        :returns: a dict from analyser names to metadata dicts'''
+        from sqlalchemy import and_, or_, func
+        from epydemicarchive.archive.models import Network, Metadata, Analysis
+
+        current = {a.name(): a.version() for a in self.analysers() if a.STRUCTURAL}
+        if len(current) == 0:
+            return dict()
+
+        # find the other network with the same fingerprint that has
+        # the most current runs of structural analysers
+        runs = self._db.session.query(Analysis.network_id, func.count().label('runs'))
+        runs = runs.filter(or_(*[and_(Analysis.analyser == name, Analysis.version == v) for (name, v) in current.items()]))
+        runs = runs.group_by(Analysis.network_id).subquery()
+        other = Network.query.join(Network.metadata).join(runs, runs.c.network_id == Network.id)
+        other = other.filter(Metadata.key == self.FINGERPRINT,
+                             Metadata.value == fingerprint,
+                             Network.id != n.id).order_by(runs.c.runs.desc()).first()
+        if other is None:
+            return dict()
+
+        # extract the metadata generated by current structural analysers
+        rcs = {r.analyser: dict() for r in other.analyses if current.get(r.analyser) == r.version}
+        for m in other.metadata:
+            if m.analyser in rcs:
+                rcs[m.analyser][m.key] = m.value
+        return rcs
+
+    def _record(self, n, a, rc, usage=None):
+        '''Record the metadata generated by an analyser, replacing any
+        previously generated by it, and note the version that was run
+        and the resources it used.
+
+        :param n: the network's archive record
+        :param a: the analyser
+        :param rc: the dict of metadata
+        :param usage: (optional) the resources used, if the analyser was run'''
+        from epydemicarchive.archive.models import Metadata, Analysis
+        name = a.name()
+        if usage is not None:
+            metrics.ANALYSER_TIME.observe(usage['wall'], analyser=name)
+
+        # discard previous results, and any other values for the same keys
+        n.metadata = [m for m in n.metadata
+                      if not (m.analyser == name or m.key in rc)]
+
+        # add the new results
+        for k in rc:
+            m = Metadata(network=n, analyser=name,
+                         key=k, value=str(rc[k]))
+            self._db.session.add(m)
+
+        # record the run
+        run = next((r for r in n.analyses if r.analyser == name), None)
+        if run is None:
+            run = Analysis(network=n, analyser=name)
+            self._db.session.add(run)
+        run.version = a.version()
+        run.analysed = datetime.utcnow()
+        run.set_usage(usage)
+
+    def _record_load(self, n, usage):
+        '''Record the resources used to load a network for analysis.
+
+        :param n: the network's archive record
+        :param usage: the resources used'''
+        from epydemicarchive.archive.models import Analysis
+        run = next((r for r in n.analyses if r.analyser == self.LOAD), None)
+        if run is None:
+            run = Analysis(network=n, analyser=self.LOAD)
+            self._db.session.add(run)
+        run.version = 0
+        run.analysed = datetime.utcnow()
+        run.set_usage(usage)
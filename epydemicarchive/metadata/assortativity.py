@@ -0,0 +1,92 @@
+# Degree assortativity analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import array, arctanh, tanh, corrcoef, concatenate, isnan, sqrt
+from scipy.stats import norm
+from epydemicarchive.metadata.sampled import SampledAnalyser
+
+
+class Assortativity(SampledAnalyser):
+    '''An analyser that estimates the degree assortativity of a network
+    from a uniform sample of its edges. Edges are sampled by choosing
+    an endpoint with probability proportional to its degree and then
+    one of its neighbours uniformly, so only the neighbourhoods of
+    sampled nodes are ever enumerated. The confidence interval comes
+    from the Fisher transformation of the correlation coefficient.
+    '''
+
+    NAME = 'assortativity'
+    VERSION = 1
+
+    BATCH = 1000     #: Edges sampled per batch.
+
+    def correlation(self, samples):
+        '''Compute the degree correlation of a sample of edges.
+
+        :param samples: an array of pairs of endpoint degrees
+        :returns: a pair of the correlation and its error'''
+        # symmetrise, since the network is undirected
+        x = concatenate((samples[:, 0], samples[:, 1]))
+        y = concatenate((samples[:, 1], samples[:, 0]))
+        if x.std() == 0:
+            # all degrees equal, correlation is undefined
+            return (float('nan'), 0)
+        r = corrcoef(x, y)[0, 1]
+
+        # confidence interval from Fisher's z, using the number of edges
+        m = len(samples)
+        if m <= 3 or abs(r) >= 1:
+            return (r, float('inf') if m <= 3 else 0)
+        z = arctanh(r)
+        dz = norm.ppf((1 + self._confidence) / 2) / sqrt(m - 3)
+        e = (tanh(z + dz) - tanh(z - dz)) / 2
+        return (r, e)
+
+    def do(self, n, g):
+        '''Estimate the degree assortativity of the network.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        nodes = list(g.nodes())
+        degrees = array([d for (_, d) in g.degree(nodes)], dtype=float)
+        total = degrees.sum()
+        if total == 0:
+            # no edges
+            return dict()
+        p = degrees / total
+        neighbours = dict()
+
+        def edges(k):
+            us = self._rng.choice(len(nodes), size=k, p=p)
+            rs = self._rng.random(k)
+            ks = []
+            for (i, r) in zip(us, rs):
+                u = nodes[i]
+                if u not in neighbours:
+                    neighbours[u] = list(g.adj[u])
+                vs = neighbours[u]
+                v = vs[int(r * len(vs))]
+                ks.append((degrees[i], g.degree(v)))
+            return (array(ks), k)
+
+        (v, e, _) = self.sample(edges, self.correlation)
+        if v is None or isnan(v):
+            return dict()
+        return self.record('assortativity', v, e)
@@ -0,0 +1,68 @@
+# Degree distribution classifier
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from epydemicarchive.metadata.analyser import load_analyser
+from epydemicarchive.metadata.degreedistribution import DegreeDistribution
+
+
+class DegreeDistributionClassifier(DegreeDistribution):
+    '''An analyser that tests a network against several candidate degree
+    distributions and records the one that fits best. The network's
+    degree histogram is computed only once and shared between all the
+    candidates, so adding candidates only adds the (small) cost of
+    fitting them.
+
+    The best fit is the candidate with the largest p-value above the
+    significance level. Candidates are tried in order, so if two fit
+    equally well the earlier one wins: simpler distributions should
+    therefore be listed first.
+
+    :param candidates: a list of :class:`DegreeDistribution` analysers or their specifications
+    '''
+
+    NAME = 'degreedistribution'
+    VERSION = 2
+    STRUCTURAL = True
+
+    def __init__(self, candidates):
+        super().__init__()
+        self._candidates = [load_analyser(c) if isinstance(c, str) else c for c in candidates]
+
+    def do(self, n, g):
+        '''Classify the degree distribution of the network.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        dist = dict()
+
+        if g.order() > 0:
+            hist = self.histogram(g)
+            best = None
+            bestp = None
+            for c in self._candidates:
+                p = c.test(hist)
+                if c.fits(p) and (bestp is None or p > bestp):
+                    best = c
+                    bestp = p
+            if best is not None:
+                dist['degree-distribution'] = best.DISTRIBUTION
+                dist['degree-distribution-p'] = bestp
+
+        return dist
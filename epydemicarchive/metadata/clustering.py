@@ -0,0 +1,47 @@
+# Clustering coefficient analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import array
+from networkx import clustering
+from epydemicarchive.metadata.sampled import SampledAnalyser
+
+
+class Clustering(SampledAnalyser):
+    '''An analyser that estimates the average clustering coefficient
+    of a network from the local clustering of a sample of its nodes.
+    '''
+
+    NAME = 'clustering'
+    VERSION = 1
+
+    def do(self, n, g):
+        '''Estimate the clustering coefficient of the network.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        nodes = list(g.nodes())
+
+        def local(vs):
+            cs = clustering(g, vs)
+            return array([cs[v] for v in vs])
+
+        (v, e, _) = self.sample(self.without_replacement(nodes, local),
+                                population=len(nodes))
+        return self.record('clustering', v, e)
@@ -0,0 +1,214 @@
+# Command-line maintenance of network metadata
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicarchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, or_, func
+
+logger = logging.getLogger(__name__)
+
+
+def stale_networks(after=None, limit=None):
+    '''Return the UUIDs of networks that are missing the results of
+    one or more analysers in the chain, or that were analysed by
+    an earlier version of one. UUIDs are returned in order, and
+    can be paged through using the last UUID of the previous page.
+
+    :param after: (optional) only return UUIDs after this one
+    :param limit: (optional) the maximum number of UUIDs to return
+    :returns: a list of UUIDs'''
+    from epydemicarchive import db, analyser
+    from epydemicarchive.archive.models import Network, Analysis
+
+    # with no analysers, every network is up to date
+    chain = analyser.analysers()
+    if len(chain) == 0:
+        return []
+
+    # networks with current runs of all the analysers in the chain
+    current = [and_(Analysis.analyser == a.name(), Analysis.version >= a.version()) for a in chain]
+    uptodate = db.session.query(Analysis.network_id).filter(or_(*current)).group_by(Analysis.network_id).having(func.count() == len(chain))
+
+    # all the other networks
+    q = db.session.query(Network.id).filter(~Network.id.in_(uptodate)).order_by(Network.id)
+    if after is not None:
+        q = q.filter(Network.id > after)
+    if limit is not None:
+        q = q.limit(limit)
+    return [id for (id, ) in q]
+
+
+def reanalyse_network(id):
+    '''Run any missing or outdated analysers over a network, committing
+    the results.
+
+    :param id: the network's UUID
+    :returns: a pair of the UUID and a list of analyser names run, or an error message'''
+    from epydemicarchive import db, analyser
+    from epydemicarchive.archive.models import Network
+
+    try:
+        n = Network.from_uuid(id)
+        if n is None:
+            return (id, [])
+        outdated = analyser.outdated(n)
+        ok = analyser.analyse(n, outdated)
+        db.session.commit()
+        if ok:
+            return (id, [a.name() for a in outdated])
+        else:
+            return (id, n.analysis_error)
+    except Exception as e:
+        db.session.rollback()
+        return (id, str(e))
+
+
+def _init_worker(config):
+    '''Initialise a worker process with its own application (and so its
+    own database connections) configured in the same way as the parent.
+    The application is created from the parent's configuration, so that
+    the database and other extensions are bound to the same resources.
+
+    :param config: the parent's configuration'''
+    from epydemicarchive import create
+    app = create(type('WorkerConfig', (), config))
+    app.app_context().push()
+
+
+@click.command('reanalyse')
+@click.option('--batch', default=100, show_default=True,
+              help='Number of networks to analyse per batch.')
+@click.option('--workers', default=os.cpu_count(), show_default=True,
+              help='Number of worker processes.')
+@with_appcontext
+def reanalyse(batch, workers):
+    '''Run any missing or outdated analysers over the archive.
+
+    Networks are processed in batches, each network's results being
+    committed independently, so an interrupted run can simply be
+    re-started and will pick up where it left off. Parallel workers
+    each open their own database connection, and so need a database
+    that isn't held in memory.'''
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(dict(current_app.config), ))
+    try:
+        after = None
+        analysed = failed = 0
+        while True:
+            ids = stale_networks(after, batch)
+            if len(ids) == 0:
+                break
+            after = ids[-1]
+
+            if pool is None:
+                rcs = map(reanalyse_network, ids)
+            else:
+                rcs = pool.map(reanalyse_network, ids)
+            for (id, rc) in rcs:
+                if isinstance(rc, str):
+                    logger.error(f'Analysis of network {id} failed: {rc}')
+                    failed += 1
+                elif len(rc) > 0:
+                    logger.info(f'Network {id} re-analysed by {", ".join(rc)}')
+                    analysed += 1
+            click.echo(f'{analysed} networks analysed, {failed} failed')
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+#: Bands of network size (number of nodes) used in the analysis report.
+SIZE_BANDS = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+
+
+@click.command('analysis-report')
+@click.option('--by-size/--overall', default=True, show_default=True,
+              help='Break the report down by network size.')
+@with_appcontext
+def analysis_report(by_size):
+    '''Report the resources used by each analyser, and for loading
+    networks, over all the runs recorded in the archive.
+
+    For each analyser, and (by default) each band of network sizes,
+    this shows the number of runs, their total and mean wall-clock
+    time, their mean CPU time, and the largest peak memory of any
+    run. Results copied from identical networks aren't included.
+    CPU time and memory are only those of the analysers themselves
+    when ANALYSIS_SANDBOX is set; otherwise they include anything
+    else the server process was doing at the time.'''
+    from sqlalchemy import case
+    from epydemicarchive import db
+    from epydemicarchive.archive.models import Analysis, NetworkSummary
+
+    cols = [Analysis.analyser]
+    if by_size:
+        N = NetworkSummary.N
+        band = case((N.is_(None), -1),
+                    *[(N < b, i) for (i, b) in enumerate(SIZE_BANDS)],
+                    else_=len(SIZE_BANDS))
+        cols.append(band)
+    q = db.session.query(*cols,
+                         func.count(Analysis.wall_time),
+                         func.sum(Analysis.wall_time),
+                         func.avg(Analysis.wall_time),
+                         func.avg(Analysis.cpu_time),
+                         func.max(Analysis.peak_rss)).filter(Analysis.wall_time.isnot(None))
+    if by_size:
+        q = q.outerjoin(NetworkSummary, NetworkSummary.id == Analysis.network_id)
+        q = q.group_by(Analysis.analyser, band).order_by(Analysis.analyser, band)
+    else:
+        q = q.group_by(Analysis.analyser).order_by(Analysis.analyser)
+
+    def bandname(i):
+        if i < 0:
+            return 'unknown'
+        elif i == 0:
+            return f'< {SIZE_BANDS[0]}'
+        elif i < len(SIZE_BANDS):
+            return f'{SIZE_BANDS[i - 1]}-{SIZE_BANDS[i] - 1}'
+        else:
+            return f'>= {SIZE_BANDS[-1]}'
+
+    headings = ['analyser'] + (['nodes'] if by_size else []) + ['runs', 'total (s)', 'mean (s)', 'mean CPU (s)', 'max RSS (MB)']
+    rows = []
+    for r in q:
+        r = list(r)
+        if by_size:
+            r[1] = bandname(r[1])
+        (runs, total, wall, cpu, rss) = r[-5:]
+        rows.append(r[:-5] + [str(runs),
+                              f'{total:.2f}',
+                              f'{wall:.3f}',
+                              '' if cpu is None else f'{cpu:.3f}',
+                              '' if rss is None else f'{rss / (1024 * 1024):.0f}'])
+    if len(rows) == 0:
+        click.echo('No analyser runs recorded')
+        return
+
+    widths = [max(len(h), *[len(r[i]) for r in rows]) for (i, h) in enumerate(headings)]
+    click.echo('  '.join([h.ljust(w) for (h, w) in zip(headings, widths)]))
+    for r in rows:
+        click.echo('  '.join([v.ljust(w) for (v, w) in zip(r, widths)]))
@@ -0,0 +1,47 @@
+# Connected components analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from networkx import connected_components
+from epydemicarchive.metadata.analyser import Analyser
+
+
+class Components(Analyser):
+    '''An analyser that counts the connected components of a network
+    and the fraction of nodes in the largest. This is computed exactly,
+    in a single pass over the network.
+    '''
+
+    NAME = 'components'
+    VERSION = 1
+
+    def do(self, n, g):
+        '''Find the components of the network.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        components = dict()
+
+        N = g.order()
+        if N > 0:
+            sizes = [len(c) for c in connected_components(g)]
+            components['components'] = len(sizes)
+            components['lcc'] = max(sizes) / N
+
+        return components
@@ -17,8 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-from collections import Counter
-from numpy import mean
+from numpy import arange, bincount, cumsum, fromiter, int64
 from scipy.stats import chisquare
 from epydemicarchive.metadata.analyser import Analyser
 
@@ -26,47 +25,111 @@ from epydemicarchive.metadata.analyser import Analyser
 class DegreeDistribution(Analyser):
     '''Base class for analysers that classify the degree distribution of
     a network.
+
+    Sub-classes provide the theoretical distribution by overriding
+    :meth:`probabilities`, which is passed the whole range of degrees
+    at once and should return the corresponding probabilities as an
+    array, computed in one vectorised operation. The network's degree
+    histogram is then compared against this distribution using a
+    chi-squared goodness-of-fit test.
+
+    Sub-classes are usually used as the candidates of a
+    :class:`epydemicarchive.metadata.classifier.DegreeDistributionClassifier`,
+    but can also be run as analysers in their own right.
     '''
 
-    SIGNIFICANCE = 0.05    #: P-value at which to reject the null hypothesis (5%).
+    DISTRIBUTION = None      #: Name of the distribution, recorded when it fits.
+    SIGNIFICANCE = 0.05      #: P-value at which to reject the null hypothesis (5%).
+    MINIMUM_EXPECTED = 5     #: Smallest expected count in a bin of the chi-squared test.
 
-    def significance(self, g, gf):
-        '''Compare the degree distribution of the network against
-        that described by the given generating function.
+    def histogram(self, g):
+        '''Construct the degree histogram of a network.
 
         :param g: the networkx representation of the network
-        :param gf: the theoretical degree distribution
-        :returns: True if the network's distribution is as expected'''
-        dist = dict()
+        :returns: an array of the number of nodes with each degree'''
+        return bincount(fromiter((d for (_, d) in g.degree()), dtype=int64, count=g.order()))
+
+    def probabilities(self, ks, hist):
+        '''Return the theoretical probabilities of the given degrees,
+        fitting any parameters to the network's degree histogram. This
+        should be overridden by sub-classes.
 
-        # construct the degree histogram of the network
-        N = g.order()
-        seq = sorted([d for (_, d) in g.degree()])
-        kmean = mean(seq)
-        hist = Counter(seq)
-        maxk = max(seq)
-        d_network = [hist[i] for i in range(maxk + 1)]
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :returns: a pair of an array of probabilities and the number of parameters fitted'''
+        raise NotImplementedError('probabilities')
+
+    def pool(self, observed, expected):
+        '''Pool adjacent bins so that every bin has an expected count of
+        at least :attr:`MINIMUM_EXPECTED`. Each bin with a large enough
+        expected count starts a group, which then absorbs the following
+        bins until the next one that is large enough: any bins before
+        the first large bin join its group.
+
+        :param observed: the observed counts
+        :param expected: the expected counts
+        :returns: a pair of pooled observed and expected counts'''
+        large = expected >= self.MINIMUM_EXPECTED
+        groups = cumsum(large) - 1
+        groups[groups < 0] = 0
+        return (bincount(groups, weights=observed),
+                bincount(groups, weights=expected))
+
+    def significance(self, hist, ps, ddof=0):
+        '''Compare a degree histogram against the given theoretical
+        degree distribution. Any probability mass above the largest
+        degree in the histogram is included in the largest degree's
+        bin, and bins are pooled to keep the test valid.
+
+        :param hist: the degree histogram of the network
+        :param ps: the theoretical probabilities of each degree in the histogram
+        :param ddof: (optional) the number of parameters fitted to the network
+        :returns: the p-value of the test, or None if there are too few bins'''
+        N = hist.sum()
 
         # construct the theoretical degree histogram
-        d_theory = [int(gf[k] * N) for k in range(maxk + 1)]
-
-        # remove any expected-zero degrees
-        # sd: this seems like it could go wrong in some instances,
-        # but scipy requires that there are no zeros in the expected
-        # distribution
-        remove = []
-        for k in range(maxk + 1):
-            if d_theory[k] == 0:
-                remove.append(k - len(remove))
-        for k in remove:
-            del d_network[k]
-            del d_theory[k]
+        ps = ps[:len(hist)].astype(float)
+        ps[-1] += max(1.0 - ps.sum(), 0.0)
+        expected = N * ps / ps.sum()
+
+        # pool the bins, and check we still have some degrees of freedom
+        (observed, expected) = self.pool(hist.astype(float), expected)
+        if len(observed) - 1 - ddof < 1:
+            return None
 
         # perform a chi-squared test on the samples
-        (_, p) = chisquare(d_network, d_theory)
-        print(p)
+        (_, p) = chisquare(observed, expected, ddof=ddof)
+        return p
+
+    def test(self, hist):
+        '''Test a degree histogram against the sub-class' distribution.
+
+        :param hist: the degree histogram of the network
+        :returns: the p-value of the test, or None if it couldn't be performed'''
+        ks = arange(len(hist))
+        (ps, ddof) = self.probabilities(ks, hist)
+        return self.significance(hist, ps, ddof)
+
+    def fits(self, p):
+        '''Decide whether a p-value indicates a good fit. For a
+        goodness-of-fit test we reject the null hypothesis (that the
+        samples come from the expected distribution) for p-values less
+        that the chosen significance value.
+
+        :param p: the p-value
+        :returns: True if the network's distribution is as expected'''
+        return p is not None and p > self.SIGNIFICANCE
+
+    def do(self, n, g):
+        '''Compare the degree distribution of the network against
+        the sub-class' distribution.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        rc = dict()
+
+        if g.order() > 0 and self.fits(self.test(self.histogram(g))):
+            rc['degree-distribution'] = self.DISTRIBUTION
 
-        # for a goodness-of-fit test we reject the null hypothesis (that
-        # the samples come from the expected distribution) for p-values
-        # less that the chosen significance value
-        return p > self.SIGNIFICANCE
+        return rc
@@ -17,8 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-from epydemic.gf import gf_er
-from epydemicarchive.metadata.analyser import Analyser
+from scipy.stats import poisson
 from epydemicarchive.metadata.degreedistribution import DegreeDistribution
 
 
@@ -26,19 +25,18 @@ class ER(DegreeDistribution):
     '''An analyser that checks for Erdos-Renyi degree topology.
     '''
 
-    def do(self, n, g):
-        '''Compare the degree distribution of the network against
-        that expected of an ER network.
+    NAME = 'er'
+    VERSION = 2
+    STRUCTURAL = True
 
-        :param n: the network
-        :param g: the networkx representation of the network
-        :returns: a dict of metadata'''
-        er = dict()
+    DISTRIBUTION = 'ER'
 
-        N = int(n['N'])
-        kmean = float(n['kmean'])
-        gf = gf_er(N, kmean)
-        if self.significance(g, gf):
-            er['degree-distribution'] = 'ER'
+    def probabilities(self, ks, hist):
+        '''Return the Poisson degree distribution with the network's
+        mean degree.
 
-        return er
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :returns: a pair of the probabilities and the number of parameters fitted'''
+        kmean = (ks * hist).sum() / hist.sum()
+        return (poisson.pmf(ks, kmean), 1)
@@ -0,0 +1,48 @@
+# Exponential degree distribution analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import nonzero
+from scipy.stats import geom
+from epydemicarchive.metadata.degreedistribution import DegreeDistribution
+
+
+class Exponential(DegreeDistribution):
+    '''An analyser that checks for an exponential degree distribution
+    above a minimum degree, with the probability of a node having degree
+    k >= kmin decaying as exp(-k / kappa), discretised as a shifted
+    geometric distribution. Both the minimum degree and the scale are fitted to
+    the network.
+    '''
+
+    NAME = 'exponential'
+    VERSION = 1
+    STRUCTURAL = True
+
+    DISTRIBUTION = 'exponential'
+
+    def probabilities(self, ks, hist):
+        '''Return the exponential distribution starting from the
+        network's smallest degree with the network's mean degree.
+
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :returns: a pair of the probabilities and the number of parameters fitted'''
+        kmin = nonzero(hist)[0][0]
+        kmean = (ks * hist).sum() / hist.sum()
+        return (geom.pmf(ks, 1 / (1 + kmean - kmin), loc=kmin - 1), 2)
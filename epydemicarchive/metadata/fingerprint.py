@@ -0,0 +1,61 @@
+# Structural fingerprint analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from hashlib import sha256
+from numpy import array, sort, int64
+from networkx import weisfeiler_lehman_graph_hash
+from epydemicarchive.metadata.analyser import Analyser, AnalyserChain
+
+
+class Fingerprint(Analyser):
+    '''An analyser that computes a structural fingerprint of a network,
+    independent of how its nodes are labelled. The fingerprint combines
+    the sorted degree sequence with a Weisfeiler-Lehman graph hash, and
+    so is identical for isomorphic networks: it is used by
+    :class:`AnalyserChain` to re-use the results of structural analysers
+    between relabelled copies of the same network.
+
+    The Weisfeiler-Lehman hash can't distinguish all non-isomorphic
+    networks (notably regular networks of the same size and degree),
+    so the fingerprint should only be used to share results that
+    the hash captures.
+    '''
+
+    NAME = 'fingerprint'
+    VERSION = 1
+
+    ITERATIONS = 3    #: Number of Weisfeiler-Lehman iterations.
+
+    def do(self, n, g):
+        '''Compute the fingerprint of the network.
+
+        :param n: the network (unused)
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        h = sha256()
+
+        # sorted degree sequence
+        degrees = sort(array([d for (_, d) in g.degree()], dtype=int64))
+        h.update(degrees.tobytes())
+
+        # hash of the node neighbourhoods
+        h.update(weisfeiler_lehman_graph_hash(g, iterations=self.ITERATIONS).encode())
+
+        rc = {AnalyserChain.FINGERPRINT: h.hexdigest()}
+        return rc
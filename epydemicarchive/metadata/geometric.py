@@ -0,0 +1,44 @@
+# Geometric degree distribution analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from scipy.stats import geom
+from epydemicarchive.metadata.degreedistribution import DegreeDistribution
+
+
+class Geometric(DegreeDistribution):
+    '''An analyser that checks for a geometric degree distribution,
+    with probability (1 - q) q^k of a node having degree k >= 0.
+    '''
+
+    NAME = 'geometric'
+    VERSION = 1
+    STRUCTURAL = True
+
+    DISTRIBUTION = 'geometric'
+
+    def probabilities(self, ks, hist):
+        '''Return the geometric distribution with the network's mean degree.
+
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :returns: a pair of the probabilities and the number of parameters fitted'''
+        kmean = (ks * hist).sum() / hist.sum()
+
+        # sd: scipy's geometric distribution starts at 1, so shift it down
+        return (geom.pmf(ks, 1 / (1 + kmean), loc=-1), 1)
@@ -27,6 +27,9 @@ class Hash(Analyser):
     so is potentially expensive when applied to large networks.
     '''
 
+    NAME = 'hash'
+    VERSION = 1
+
     CHUNKSIZE = 4096    #: Size of chunks to read from file.
 
     def do(self, n, g):
@@ -35,9 +38,8 @@ class Hash(Analyser):
         :param n: the network
         :param g: the networkx representation of the network (unused)
         :returns: a dict of metadata'''
-        filename = n.network_filename()
         h = sha256()
-        with open(filename, 'rb') as fh:
+        with n.open_network() as fh:
             while True:
                 bs = fh.read(self.CHUNKSIZE)
                 if len(bs) == 0:
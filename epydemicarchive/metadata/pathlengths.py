@@ -0,0 +1,65 @@
+# Path length analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import array
+from networkx import single_source_shortest_path_length
+from epydemicarchive.metadata.sampled import SampledAnalyser
+
+
+class PathLengths(SampledAnalyser):
+    '''An analyser that estimates the mean shortest path length of a
+    network by breadth-first search from a sample of source nodes. Each
+    source contributes the mean distance to the nodes reachable from it,
+    so disconnected networks are characterised by their within-component
+    distances. The target error is relative to the estimate.
+    '''
+
+    NAME = 'pathlengths'
+    VERSION = 1
+
+    BATCH = 2     #: Searches per batch (each is linear in the size of the network).
+
+    def converged(self, v, e):
+        '''Use a relative error.
+
+        :param v: the estimate
+        :param e: the error
+        :returns: True if sampling can stop'''
+        return e <= self._error * v
+
+    def do(self, n, g):
+        '''Estimate the mean shortest path length of the network.
+
+        :param n: the network
+        :param g: the networkx representation of the network
+        :returns: a dict of metadata'''
+        nodes = list(g.nodes())
+
+        def distances(vs):
+            ds = []
+            for v in vs:
+                ls = single_source_shortest_path_length(g, v)
+                if len(ls) > 1:
+                    # sd: the distance to the source itself is zero
+                    ds.append(sum(ls.values()) / (len(ls) - 1))
+            return array(ds)
+
+        (v, e, _) = self.sample(self.without_replacement(nodes, distances),
+                                population=len(nodes))
+        return self.record('pathlength', v, e)
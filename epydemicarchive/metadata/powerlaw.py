@@ -0,0 +1,104 @@
+# Power-law with cutoff degree distribution analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import arange, exp, log, zeros, nonzero
+from scipy.optimize import minimize
+from epydemicarchive.metadata.degreedistribution import DegreeDistribution
+
+
+class PowerLawCutoff(DegreeDistribution):
+    '''An analyser that checks for a power-law degree distribution with an
+    exponential cutoff above a minimum degree, with the probability of a
+    node having degree k >= kmin proportional to k^(-alpha) exp(-k / kappa).
+    The minimum degree is the network's smallest non-zero degree, and
+    the exponent and cutoff are fitted to the network by maximum likelihood.
+    '''
+
+    NAME = 'powerlaw-cutoff'
+    VERSION = 2
+    STRUCTURAL = True
+
+    DISTRIBUTION = 'powerlaw-cutoff'
+
+    SUPPORT = 10    #: Multiple of the largest degree used to normalise the distribution.
+
+    def support(self, ks, kmin):
+        '''Return the degrees over which the distribution is normalised,
+        extending well beyond the largest degree.
+
+        :param ks: an array of degrees
+        :param kmin: the minimum degree
+        :returns: an array of degrees'''
+        return arange(kmin, max(ks[-1], 1) * self.SUPPORT + 1)
+
+    def distribution(self, ks, kmin, alpha, lam):
+        '''Return the probabilities of the given degrees, normalised
+        over a support extending well beyond them.
+
+        :param ks: an array of degrees
+        :param kmin: the minimum degree
+        :param alpha: the exponent
+        :param lam: the reciprocal of the cutoff
+        :returns: an array of probabilities'''
+        support = self.support(ks, kmin)
+        Z = (support ** -alpha * exp(-lam * support)).sum()
+        ps = zeros(len(ks))
+        ps[kmin:] = ks[kmin:] ** -alpha * exp(-lam * ks[kmin:]) / Z
+        return ps
+
+    def fit(self, ks, hist, kmin):
+        '''Fit the exponent and cutoff to the degree histogram by
+        maximising the log-likelihood. Nodes with degrees less than
+        the minimum are ignored.
+
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :param kmin: the minimum degree
+        :returns: a pair of the exponent and the reciprocal of the cutoff'''
+        ks1 = ks[kmin:]
+        hs = hist[kmin:]
+        N = hs.sum()
+        support = self.support(ks, kmin)
+        logsupport = log(support)
+        meanlogk = (hs * log(ks1)).sum() / N
+        kmean = (hs * ks1).sum() / N
+
+        # sd: the likelihood is averaged over the nodes, since the
+        # optimiser copes badly with the large values of the total
+        def nll(params):
+            (alpha, lam) = params
+            Z = exp(-alpha * logsupport - lam * support).sum()
+            return alpha * meanlogk + lam * kmean + log(Z)
+
+        res = minimize(nll, [2.0, 1 / kmean], method='L-BFGS-B',
+                       bounds=[(0.0, 6.0), (1e-8, 10.0)])
+        return tuple(res.x)
+
+    def probabilities(self, ks, hist):
+        '''Return the fitted power-law with cutoff.
+
+        :param ks: an array of degrees
+        :param hist: the degree histogram of the network
+        :returns: a pair of the probabilities and the number of parameters fitted'''
+        if hist[1:].sum() == 0:
+            # no nodes with any edges, so nothing to fit
+            return (zeros(len(ks)), 3)
+        kmin = nonzero(hist[1:])[0][0] + 1
+        (alpha, lam) = self.fit(ks, hist, kmin)
+        return (self.distribution(ks, kmin, alpha, lam), 3)
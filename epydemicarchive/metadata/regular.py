@@ -0,0 +1,42 @@
+# Regular network analyser
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from numpy import count_nonzero
+from epydemicarchive.metadata.degreedistribution import DegreeDistribution
+
+
+class Regular(DegreeDistribution):
+    '''An analyser that checks for a regular network, in which all
+    nodes have the same degree. This is an exact test rather than a
+    statistical one, since a chi-squared test has no degrees of
+    freedom for a single degree.
+    '''
+
+    NAME = 'regular'
+    VERSION = 1
+    STRUCTURAL = True
+
+    DISTRIBUTION = 'regular'
+
+    def test(self, hist):
+        '''Test whether all nodes have the same degree.
+
+        :param hist: the degree histogram of the network
+        :returns: 1.0 if the network is regular, 0.0 otherwise'''
+        return 1.0 if count_nonzero(hist) == 1 else 0.0
@@ -0,0 +1,178 @@
+# Sampled analyser base class
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import time
+from numpy import concatenate, sqrt
+from numpy.random import default_rng, SeedSequence
+from scipy.stats import norm
+from epydemicarchive.metadata.analyser import Analyser
+
+
+class SampledAnalyser(Analyser):
+    '''Base class for analysers that estimate a property of a network
+    by sampling, rather than computing it exactly. Samples are drawn
+    in batches until the estimate is within the requested error at the
+    requested confidence level, or until the time budget runs out.
+
+    The estimate, the half-width of its confidence interval, and the
+    confidence level are all recorded in the metadata, under the key
+    of the property and the key suffixed with '-error' and '-confidence'
+    respectively.
+
+    :param error: (optional) the target half-width of the confidence interval
+    :param confidence: (optional) the confidence level
+    :param budget: (optional) the maximum time to spend sampling, in seconds
+    :param seed: (optional) seed for the random number generator
+    '''
+
+    ERROR = 0.01          #: Default target half-width of the confidence interval.
+    CONFIDENCE = 0.95     #: Default confidence level.
+    BUDGET = 1.0          #: Default time budget in seconds.
+    BATCH = 100           #: Number of samples drawn between checks.
+    MINIMUM = 10          #: Number of samples needed before the error is trusted.
+
+    def __init__(self, error=None, confidence=None, budget=None, seed=None):
+        super().__init__()
+        self._error = self.ERROR if error is None else error
+        self._confidence = self.CONFIDENCE if confidence is None else confidence
+        self._budget = self.BUDGET if budget is None else budget
+        self._seed = seed
+        self._rng = default_rng(seed)
+
+    def reseed(self):
+        '''Re-seed the random number generator, unless it was given an
+        explicit seed. This is called in sandboxed processes, which would
+        otherwise all start with (and so replay) the generator state of
+        the process that forked them.'''
+        if self._seed is None:
+            self._rng = default_rng([os.getpid(), SeedSequence().entropy])
+
+    def sample(self, draw, statistic=None, population=None):
+        '''Estimate a property by sampling. The draw function is
+        passed a number of items to draw and returns a pair of an array
+        of samples and the number of items actually drawn, which is
+        fewer than asked for once the items are exhausted. There may be
+        fewer samples than items drawn, if some items don't yield a
+        sample. The statistic function is passed all the samples drawn
+        so far and returns a pair of the estimate and the half-width of
+        its confidence interval. By default this is the sample mean
+        with a normal-approximation confidence interval, corrected for
+        sampling without replacement if the population size is given.
+
+        Sampling always draws at least two batches of samples, so the
+        error estimate is meaningful even if the time budget is exhausted,
+        and doesn't stop on reaching the target error until it has at
+        least MINIMUM samples, since the error is itself estimated
+        from the samples.
+
+        :param draw: function to draw samples
+        :param statistic: (optional) function to compute the estimate
+        :param population: (optional) the population size for the default statistic
+        :returns: a triple of the estimate, its error, and the number of samples'''
+        if statistic is None:
+            statistic = lambda samples: self.mean(samples, population)
+
+        start = time.perf_counter()
+        samples = None
+        batches = 0
+        while True:
+            # draw a batch
+            (batch, drawn) = draw(self.BATCH)
+            if len(batch) > 0:
+                samples = batch if samples is None else concatenate((samples, batch))
+                batches += 1
+            exhausted = drawn < self.BATCH
+            overrun = time.perf_counter() - start > self._budget
+
+            # carry on until we have some samples
+            if samples is None:
+                if exhausted or overrun:
+                    return (None, None, 0)
+                continue
+
+            # check the error
+            (v, e) = statistic(samples)
+            converged = len(samples) >= self.MINIMUM and self.converged(v, e)
+            if exhausted or batches > 1 and (converged or overrun):
+                return (v, e, len(samples))
+
+    def converged(self, v, e):
+        '''Test whether an estimate is accurate enough to stop sampling.
+        By default this compares the error against the target error
+        absolutely, which suits properties with a fixed range: sub-classes
+        can override this to use a relative error.
+
+        :param v: the estimate
+        :param e: the error
+        :returns: True if sampling can stop'''
+        return e <= self._error
+
+    def without_replacement(self, items, f):
+        '''Return a draw function (for :meth:`sample`) that applies a
+        function to items taken in a random order without replacement.
+
+        :param items: a list of items
+        :param f: function taking a list of items and returning an array of samples
+        :returns: a draw function'''
+        order = self._rng.permutation(len(items))
+        taken = 0
+
+        def draw(k):
+            nonlocal taken
+            batch = [items[i] for i in order[taken:taken + k]]
+            taken += len(batch)
+            return (f(batch), len(batch))
+
+        return draw
+
+    def mean(self, samples, population=None):
+        '''Estimate the mean of a sample, with a confidence interval
+        from the normal approximation. If the size of the population is
+        given the samples are assumed to have been drawn without
+        replacement, and the interval narrows to nothing as the sample
+        approaches the whole population.
+
+        :param samples: the samples
+        :param population: (optional) the size of the population
+        :returns: a pair of the mean and the confidence interval half-width'''
+        z = norm.ppf((1 + self._confidence) / 2)
+        n = len(samples)
+        m = samples.mean()
+        if n < 2:
+            e = float('inf')
+        else:
+            e = z * samples.std(ddof=1) / sqrt(n)
+            if population is not None:
+                e *= sqrt(max(population - n, 0) / max(population - 1, 1))
+        return (m, e)
+
+    def record(self, key, v, e):
+        '''Construct the metadata for an estimate.
+
+        :param key: the metadata key
+        :param v: the estimate
+        :param e: the error
+        :returns: a dict of metadata'''
+        rc = dict()
+        if v is not None:
+            rc[key] = v
+            rc[key + '-error'] = e
+            rc[key + '-confidence'] = self._confidence
+        return rc
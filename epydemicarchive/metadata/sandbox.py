@@ -0,0 +1,133 @@
+# Resource-limited analysis processes
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import signal
+import resource
+import multiprocessing
+
+
+class Sandbox:
+    '''A sandbox runs a function in a separate process whose memory and
+    CPU time are limited, so that analysing a pathological network can't
+    exhaust the resources of the server. The process is forked, so it
+    shares the state of the caller at the point the sandbox is run, but
+    any changes it makes are lost.
+
+    The function is passed a single argument, a function it can use to
+    call services in the parent process. These are typically used to
+    record results as they are computed, so that they survive if the
+    sandboxed process fails later, and to access the database, which
+    should never be touched from within the sandbox.
+
+    Anything inherited from the parent that mustn't be shared with it,
+    such as database connections or the state of random number
+    generators, can be re-initialised in the child by providing an
+    initialisation function, which is called before the sandboxed function.
+
+    :param memory: (optional) limit on the process' address space in bytes
+    :param cpu: (optional) limit on the process' CPU time in seconds
+    :param initialise: (optional) function called in the sandboxed process before the function
+    '''
+
+    def __init__(self, memory=None, cpu=None, initialise=None):
+        self._memory = memory
+        self._cpu = cpu
+        self._initialise = initialise
+
+    def run(self, f, services):
+        '''Run a function in the sandbox. Exceptions raised by the
+        function are re-raised in the caller (as plain exceptions
+        carrying the original message), as is any failure of the
+        process itself.
+
+        :param f: the function
+        :param services: a dict of functions the sandboxed function can call by name
+        :returns: the result of the function'''
+        ctx = multiprocessing.get_context('fork')
+        (conn, child) = ctx.Pipe()
+        p = ctx.Process(target=self._child, args=(child, f))
+        p.start()
+        child.close()
+        try:
+            while True:
+                try:
+                    (kind, v) = conn.recv()
+                except EOFError:
+                    # process died without reporting back
+                    p.join()
+                    raise Exception(self.failure(p.exitcode))
+                if kind == 'call':
+                    (name, args) = v
+                    conn.send(services[name](*args))
+                elif kind == 'result':
+                    return v
+                else:
+                    raise Exception(v)
+        finally:
+            conn.close()
+            if p.is_alive():
+                p.kill()
+            p.join()
+
+    def failure(self, rc):
+        '''Construct a message explaining why a sandboxed process failed.
+
+        :param rc: the process' exit code
+        :returns: a message'''
+        if rc == -signal.SIGXCPU:
+            return f'Analysis exceeded its CPU time limit of {self._cpu}s'
+        elif rc is not None and rc < 0:
+            return f'Analysis killed by signal {-rc}'
+        else:
+            return f'Analysis process failed (exit code {rc})'
+
+    def _limit(self):
+        '''Apply the resource limits to the current process.'''
+        if self._memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self._memory, self._memory))
+        if self._cpu is not None:
+            # sd: the soft limit sends SIGXCPU, the hard limit SIGKILL
+            resource.setrlimit(resource.RLIMIT_CPU, (self._cpu, self._cpu + 1))
+
+    def _child(self, conn, f):
+        '''The body of the sandboxed process.
+
+        :param conn: the connection to the parent
+        :param f: the function'''
+        def call(name, *args):
+            conn.send(('call', (name, args)))
+            return conn.recv()
+
+        try:
+            self._limit()
+            if self._initialise is not None:
+                self._initialise()
+            rc = f(call)
+            conn.send(('result', rc))
+        except MemoryError:
+            conn.send(('error', f'Analysis exceeded its memory limit of {self._memory} bytes'))
+        except BaseException as e:
+            conn.send(('error', f'{type(e).__name__}: {e}'))
+        finally:
+            # sd: exit immediately, without running any clean-up handlers
+            # that might touch resources (like database connections)
+            # shared with the parent
+            conn.close()
+            os._exit(0)
@@ -26,6 +26,10 @@ class Topology(Analyser):
     summary statistics.
     '''
 
+    NAME = 'topology'
+    VERSION = 1
+    STRUCTURAL = True
+
     def do(self, n, g):
         '''Analyse the topology of the given network.
 
@@ -0,0 +1,96 @@
+# Measuring the resources used by analysers
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import sys
+import time
+
+# resource is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class ResourceUsage:
+    '''A context manager measuring the wall-clock time, CPU time, and
+    peak resident memory of the code it encloses, within the current
+    process.
+
+    CPU time and peak memory are those of the whole process, not just
+    of the enclosed code: they only describe the code alone if nothing
+    else runs in the process meanwhile, as when analysers run in a
+    sandbox. In a threaded server they include the work of any other
+    threads, and so are upper bounds.
+
+    Under Linux the process' peak memory is reset on entry, so the
+    peak is that reached while running the enclosed code. Elsewhere
+    the peak is the process' high-water mark so far, which is an
+    upper bound.'''
+
+    CLEAR_REFS = '/proc/self/clear_refs'    #: Linux file used to reset the peak memory.
+    STATUS = '/proc/self/status'            #: Linux file reporting the peak memory.
+
+    def __init__(self):
+        self.wall = None
+        self.cpu = None
+        self.rss = None
+
+    def __enter__(self):
+        self.reset_peak()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+        self.rss = self.peak()
+        return False
+
+    def reset_peak(self):
+        '''Reset the process' peak memory, if possible.'''
+        try:
+            with open(self.CLEAR_REFS, 'w') as fh:
+                fh.write('5')
+        except OSError:
+            pass
+
+    def peak(self):
+        '''Return the process' peak resident memory.
+
+        :returns: the peak in bytes, or None if it can't be found'''
+        try:
+            with open(self.STATUS) as fh:
+                for line in fh:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        if resource is not None:
+            # sd: ru_maxrss is in kilobytes, except under macOS
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss if sys.platform == 'darwin' else rss * 1024
+        return None
+
+    def asdict(self):
+        '''Return the measurements, in a form that can be passed
+        between processes.
+
+        :returns: a dict of wall and CPU time in seconds, and peak memory in bytes'''
+        return dict(wall=self.wall, cpu=self.cpu, rss=self.rss)
@@ -0,0 +1,235 @@
+# Performance metrics, exposed for Prometheus
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import time
+import threading
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+
+# Metrics are held in memory by each process, and so only describe the
+# requests that process has handled: when running several server
+# processes, each should be scraped directly (or the totals will jump
+# around as successive scrapes reach different processes).
+
+
+class Metric:
+    '''A family of metrics with the same name, distinguished by the
+    values of their labels.
+
+    :param name: the metric's name
+    :param help: a description of the metric
+    :param labels: (optional) the label names'''
+
+    TYPE = None      #: The Prometheus metric type.
+
+    def __init__(self, name, help, labels=[]):
+        self._name = name
+        self._help = help
+        self._labels = list(labels)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def key(self, labels):
+        '''Return the key for a set of label values.
+
+        :param labels: a dict of label values
+        :returns: the key'''
+        return tuple([str(labels.get(l, '')) for l in self._labels])
+
+    def labelstring(self, key, extra=None):
+        '''Return the text form of a set of labels.
+
+        :param key: the label values
+        :param extra: (optional) a list of additional label name/value pairs
+        :returns: the labels'''
+        ls = list(zip(self._labels, key)) + (extra or [])
+        if len(ls) == 0:
+            return ''
+        vs = ['{l}="{v}"'.format(l=l, v=v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for (l, v) in ls]
+        return '{' + ','.join(vs) + '}'
+
+    def exposition(self):
+        '''Return the text exposition of the metric.
+
+        :returns: a list of lines'''
+        lines = [f'# HELP {self._name} {self._help}',
+                 f'# TYPE {self._name} {self.TYPE}']
+        with self._lock:
+            for key in sorted(self._values.keys()):
+                lines.extend(self.samples(key, self._values[key]))
+        return lines
+
+    def samples(self, key, v):
+        '''Return the samples for one set of labels. This should be
+        overridden by sub-classes.
+
+        :param key: the label values
+        :param v: the value
+        :returns: a list of lines'''
+        raise NotImplementedError('samples')
+
+
+class Counter(Metric):
+    '''A metric that only increases.'''
+
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        '''Increase the counter.
+
+        :param amount: (optional) the amount (defaults to 1)
+        :param labels: the label values'''
+        k = self.key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + amount
+
+    def samples(self, key, v):
+        return [f'{self._name}{self.labelstring(key)} {v}']
+
+
+class Histogram(Metric):
+    '''A metric that counts observations into buckets.
+
+    :param name: the metric's name
+    :param help: a description of the metric
+    :param labels: (optional) the label names
+    :param buckets: (optional) the upper bounds of the buckets'''
+
+    TYPE = 'histogram'
+
+    #: Default buckets, suitable for latencies in seconds.
+    BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self, name, help, labels=[], buckets=None):
+        super().__init__(name, help, labels)
+        self._buckets = list(buckets or self.BUCKETS)
+
+    def observe(self, v, **labels):
+        '''Record an observation.
+
+        :param v: the observation
+        :param labels: the label values'''
+        k = self.key(labels)
+        i = bisect_left(self._buckets, v)
+        with self._lock:
+            if k not in self._values:
+                self._values[k] = [[0] * (len(self._buckets) + 1), 0.0, 0]
+            (counts, _, _) = h = self._values[k]
+            counts[i] += 1
+            h[1] += v
+            h[2] += 1
+
+    def samples(self, key, v):
+        (counts, total, n) = v
+        lines = []
+        cumulative = 0
+        for (b, c) in zip(self._buckets + ['+Inf'], counts):
+            cumulative += c
+            lines.append(f'{self._name}_bucket{self.labelstring(key, [("le", str(b))])} {cumulative}')
+        lines.append(f'{self._name}_sum{self.labelstring(key)} {total}')
+        lines.append(f'{self._name}_count{self.labelstring(key)} {n}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('ea_request_duration_seconds',
+                            'Time taken to handle requests.',
+                            ['endpoint', 'method', 'status'])
+REQUEST_QUERIES = Histogram('ea_request_sql_queries',
+                            'SQL statements executed per request.',
+                            ['endpoint'],
+                            buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200, 500])
+REQUEST_SQL_TIME = Histogram('ea_request_sql_duration_seconds',
+                             'Time spent executing SQL statements per request.',
+                             ['endpoint'])
+ANALYSER_TIME = Histogram('ea_analyser_duration_seconds',
+                          'Time taken by analysers.',
+                          ['analyser'],
+                          buckets=[0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0])
+RAW_BYTES = Counter('ea_raw_bytes_total',
+                    'Bytes of network files sent by this process.',
+                    ['format'])
+
+METRICS = [REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_SQL_TIME, ANALYSER_TIME, RAW_BYTES]  #: All metrics.
+
+
+def exposition():
+    '''Return the text exposition of all the metrics.
+
+    :returns: the metrics in Prometheus text format'''
+    lines = []
+    for m in METRICS:
+        lines.extend(m.exposition())
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app, db):
+    '''Record metrics for an application's requests and database
+    statements, and add the /metrics endpoint if METRICS_ENABLED
+    is set. This must be called after the database has been bound
+    to the application.
+
+    :param app: the application
+    :param db: the database'''
+    from flask import g, request, has_request_context, Response
+    from sqlalchemy import event
+
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    @app.before_request
+    def start_request():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_time = 0.0
+
+    @app.after_request
+    def end_request(response):
+        start = g.get('metrics_start')
+        if start is not None:
+            endpoint = request.endpoint or 'none'
+            REQUEST_LATENCY.observe(time.perf_counter() - start,
+                                    endpoint=endpoint,
+                                    method=request.method,
+                                    status=response.status_code)
+            REQUEST_QUERIES.observe(g.metrics_queries, endpoint=endpoint)
+            REQUEST_SQL_TIME.observe(g.metrics_sql_time, endpoint=endpoint)
+        return response
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            starts = conn.info.get('metrics_start')
+            if starts:
+                g.metrics_queries = g.get('metrics_queries', 0) + 1
+                g.metrics_sql_time = g.get('metrics_sql_time', 0.0) + time.perf_counter() - starts.pop()
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_execute)
+        event.listen(db.engine, 'after_cursor_execute', after_execute)
+
+    def metrics():
+        return Response(exposition(), mimetype='text/plain; version=0.0.4')
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,214 @@
+# Opt-in profiling of requests and analyser runs
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+
+import os
+import hmac
+import uuid
+import logging
+import threading
+import cProfile
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+# Profiles are stored as files in the profile directory, in the format
+# written by cProfile and read by pstats (or tools like snakeviz). Each
+# is named for the time it was taken and what was profiled, and only
+# the most recent ones are kept.
+
+HEADER = 'X-Profile'          #: Request header carrying the profiling key.
+ID_HEADER = 'X-Profile-Id'    #: Response header giving the id of a request's profile.
+SUFFIX = '.prof'              #: Extension for stored profiles.
+
+_directory = None             # where profiles are stored
+_keep = 100                   # number of profiles to keep
+_analysers = frozenset()      # names of analysers to profile
+
+# sd: only one profiler can be active in a process at once (enforced
+# from Python 3.12), so a request arriving while another thread is
+# being profiled simply isn't
+_active = threading.Lock()
+
+
+def configure(directory, keep=100, analysers=[]):
+    '''Set where profiles are stored, and which analysers are profiled.
+
+    :param directory: the directory for profiles
+    :param keep: (optional) the number of profiles to keep (defaults to 100)
+    :param analysers: (optional) the names of analysers to profile, or ['all']'''
+    global _directory, _keep, _analysers
+    _directory = directory
+    _keep = keep
+    _analysers = frozenset(analysers)
+
+
+def profiling_analyser(name):
+    '''Test whether an analyser's runs are to be profiled.
+
+    :param name: the analyser's name
+    :returns: True if the analyser is profiled'''
+    return name in _analysers or 'all' in _analysers
+
+
+def store(profile, kind, name):
+    '''Store a profile, discarding the oldest if there are too many.
+
+    :param profile: the profile
+    :param kind: the kind of thing profiled ('request' or 'analyser')
+    :param name: what was profiled
+    :returns: the profile's id'''
+    os.makedirs(_directory, exist_ok=True)
+    safe = ''.join([c if c.isalnum() or c in '-_' else '_' for c in name])
+    id = '{t}-{k}-{n}-{u}'.format(t=datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'),
+                                  k=kind,
+                                  n=safe,
+                                  u=uuid.uuid4().hex[:8])
+    profile.dump_stats(os.path.join(_directory, id + SUFFIX))
+
+    # discard the oldest profiles
+    ids = profiles()
+    for old in ids[_keep:]:
+        try:
+            os.remove(os.path.join(_directory, old + SUFFIX))
+        except FileNotFoundError:
+            pass
+    return id
+
+
+def profiles():
+    '''Return the ids of the stored profiles, most recent first.
+
+    :returns: a list of ids'''
+    if _directory is None or not os.path.isdir(_directory):
+        return []
+    ids = [fn[:-len(SUFFIX)] for fn in os.listdir(_directory) if fn.endswith(SUFFIX)]
+    return sorted(ids, reverse=True)
+
+
+class Profile:
+    '''A context manager that profiles its body, if no other profile
+    is being taken at the time, and stores the profile.
+
+    :param kind: the kind of thing profiled
+    :param name: what is being profiled'''
+
+    def __init__(self, kind, name):
+        self._kind = kind
+        self._name = name
+        self._profile = None
+        self.id = None            #: The id of the stored profile, once taken.
+
+    def start(self):
+        '''Start profiling.
+
+        :returns: True if profiling started'''
+        if not _active.acquire(blocking=False):
+            logger.info(f'Not profiling {self._kind} {self._name} as another profile is being taken')
+            return False
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    def stop(self):
+        '''Stop profiling and store the profile.
+
+        :returns: the profile's id, or None if nothing was profiled'''
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        _active.release()
+        try:
+            self.id = store(self._profile, self._kind, self._name)
+        except Exception as e:
+            logger.error(f'Couldn\'t store profile of {self._kind} {self._name}: {e}')
+        self._profile = None
+        return self.id
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+def init_app(app):
+    '''Configure profiling for an application. Analysers named in
+    PROFILE_ANALYSERS are profiled whenever they run. If PROFILING_KEY
+    is set, requests carrying it in the X-Profile header are profiled,
+    and the stored profiles can be listed at /profiles and downloaded
+    from /profiles/<id> by requests carrying the same header.
+
+    :param app: the application'''
+    from flask import g, request, abort, jsonify, send_from_directory
+
+    directory = app.config.get('PROFILE_DIR') or os.path.join(app.config['ARCHIVE_DIR'], 'profiles')
+    analysers = [a.strip() for a in (app.config.get('PROFILE_ANALYSERS') or '').split(',') if a.strip() != '']
+    configure(directory, app.config.get('PROFILE_KEEP', 100), analysers)
+
+    # sd: with no key, no hooks are installed, so requests pay nothing
+    key = app.config.get('PROFILING_KEY')
+    if not key:
+        return
+
+    def authorised():
+        given = request.headers.get(HEADER)
+        return given is not None and hmac.compare_digest(given.encode(), key.encode())
+
+    @app.before_request
+    def start_profile():
+        if HEADER in request.headers and authorised():
+            p = Profile('request', request.endpoint or 'none')
+            if p.start():
+                g.profile = p
+
+    @app.after_request
+    def end_profile(response):
+        p = g.pop('profile', None)
+        if p is not None:
+            id = p.stop()
+            if id is not None:
+                response.headers[ID_HEADER] = id
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # sd: after_request handlers aren't run if the request fails,
+        # but the profile still needs to be stopped
+        p = g.pop('profile', None)
+        if p is not None:
+            p.stop()
+
+    def list_profiles():
+        if not authorised():
+            abort(403)
+        return jsonify(dict(profiles=profiles()))
+    app.add_url_rule('/profiles', 'profiles', list_profiles)
+
+    def download_profile(id):
+        if not authorised():
+            abort(403)
+        if id not in profiles():
+            abort(404)
+        return send_from_directory(_directory, id + SUFFIX,
+                                   as_attachment=True, mimetype='application/octet-stream')
+    app.add_url_rule('/profiles/<id>', 'profile', download_profile)
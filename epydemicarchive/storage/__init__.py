@@ -0,0 +1,30 @@
+# Storage of network files
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+from .storage import Storage, NetworkStore
+from .local import LocalStorage
+from .transactions import on_commit, on_rollback
+
+
+def __getattr__(name):
+    # sd: S3 support imports boto3, which is slow, so only do so if needed
+    if name == 'S3Storage':
+        from .s3 import S3Storage
+        return S3Storage
+    raise AttributeError(f'module {__name__} has no attribute {name}')
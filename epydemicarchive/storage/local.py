@@ -0,0 +1,139 @@
+# Storage in a local directory
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import re
+from hashlib import sha1
+from epydemicarchive.storage.storage import Storage, StagedWrite
+
+
+class _AtomicWrite(StagedWrite):
+    '''A stream that writes to a temporary file alongside its
+    final location, and renames it into place when committed.
+
+    :param filename: the filename'''
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._tmp = f'{filename}.{os.getpid()}.tmp'
+        super().__init__(open(self._tmp, 'wb'))
+
+    def commit(self):
+        self._fh.close()
+        os.replace(self._tmp, self._filename)
+
+    def abandon(self):
+        self._fh.close()
+        os.remove(self._tmp)
+
+
+class LocalStorage(Storage):
+    '''Storage in a local directory. To keep directories small, new
+    networks are stored in a two-level hierarchy of sub-directories
+    named by the first four hex digits of a hash of their UUID,
+    giving 65536 directories that fill evenly.
+
+    Files stored under earlier layouts -- directly in the root
+    directory, or in a single level of sub-directories named by
+    UUID prefix -- remain accessible, and are found even under keys
+    for a different layout. This keeps networks readable while their
+    files are moved to the current layout, before their keys have
+    been updated.
+
+    :param root: the root directory'''
+
+    SHARD = re.compile('[0-9a-f]{2}$')    #: Pattern matching shard directory names.
+
+    def __init__(self, root):
+        self._root = root
+
+    def path(self, key):
+        '''Return the filename for a key.
+
+        :param key: the key
+        :returns: the filename'''
+        return os.path.join(self._root, key)
+
+    def locations(self, key):
+        '''Return the keys under which a file might be found: the key
+        itself, and where the file would be under each layout.
+
+        :param key: the key
+        :returns: a list of keys'''
+        name = key.rsplit('/', 1)[-1]
+        ks = [key, self.relocate(key), name, f'{name[:2]}/{name}']
+        return list(dict.fromkeys(ks))
+
+    def find(self, key):
+        '''Return the filename of a file, looking in each place
+        it might be found.
+
+        :param key: the key
+        :returns: the filename (which doesn't exist if the file isn't found)'''
+        for k in self.locations(key):
+            filename = self.path(k)
+            if os.path.exists(filename):
+                return filename
+        return self.path(key)
+
+    def key(self, id, ext):
+        h = sha1(id.encode()).hexdigest()
+        return f'{h[:2]}/{h[2:4]}/{id}.{ext}'
+
+    def open_read(self, key):
+        return open(self.find(key), 'rb')
+
+    def open_write(self, key):
+        filename = self.path(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        return _AtomicWrite(filename)
+
+    def exists(self, key):
+        return os.path.exists(self.find(key))
+
+    def size(self, key):
+        return os.path.getsize(self.find(key))
+
+    def modified(self, key):
+        return os.path.getmtime(self.find(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.find(key))
+        except FileNotFoundError:
+            pass
+
+    def rename(self, key, newkey):
+        filename = self.path(newkey)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        os.replace(self.path(key), filename)
+
+    def keys(self):
+        # sd: only look in the shard directories, as other directories
+        # (such as caches) may also live in the root
+        def scan(dir, prefix, depth):
+            for e in os.scandir(dir):
+                if e.is_file():
+                    yield prefix + e.name
+                elif depth < 2 and e.is_dir() and self.SHARD.match(e.name):
+                    yield from scan(e.path, f'{prefix}{e.name}/', depth + 1)
+        yield from scan(self._root, '', 0)
+
+    def local_path(self, key):
+        return self.find(key)
@@ -0,0 +1,169 @@
+# Storage in an S3-compatible object store
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import io
+import tempfile
+from epydemicarchive.storage.storage import Storage, StagedWrite
+
+# boto3 is optional
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+class _StreamingReader(io.RawIOBase):
+    '''Adapt an S3 response body to a raw stream, so that it can be
+    buffered.
+
+    :param body: the body'''
+
+    def __init__(self, body):
+        self._body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        bs = self._body.read(len(b))
+        n = len(bs)
+        b[:n] = bs
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._body.close()
+        super().close()
+
+
+class _SpooledUpload(StagedWrite):
+    '''A stream that spools what's written to it (in memory and then
+    on disc) and uploads it when committed.
+
+    :param upload: a function taking a file object to upload
+    :param spool: size in bytes to hold in memory before spooling to disc'''
+
+    def __init__(self, upload, spool):
+        super().__init__(tempfile.SpooledTemporaryFile(max_size=spool))
+        self._upload = upload
+
+    def commit(self):
+        try:
+            self._fh.seek(0)
+            self._upload(self._fh)
+        finally:
+            self._fh.close()
+
+    def abandon(self):
+        self._fh.close()
+
+
+class S3Storage(Storage):
+    '''Storage in an S3-compatible object store. Objects are stored
+    flat under a prefix, since object stores don't slow down with
+    large numbers of keys. Downloads are served by redirecting to
+    pre-signed URLs. Credentials are found by boto3 in the usual
+    way, and the endpoint can be set to use any S3-compatible store
+    (including a local stand-in for testing).
+
+    :param bucket: the bucket
+    :param prefix: (optional) prefix for all keys
+    :param endpoint_url: (optional) the store's endpoint (defaults to AWS)
+    :param expiry: (optional) lifetime of download URLs in seconds'''
+
+    CHUNKSIZE = 64 * 1024               #: Size of buffer for reads.
+    SPOOL = 64 * 1024 * 1024            #: Size of uploads held in memory.
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, expiry=3600):
+        if boto3 is None:
+            raise Exception('S3 storage needs the boto3 package')
+        self._bucket = bucket
+        self._prefix = prefix
+        self._endpoint_url = endpoint_url
+        self._expiry = expiry
+        self._client = None
+        self._pid = None
+
+    def client(self):
+        '''Return the S3 client. Clients can't be shared across
+        a fork, so each process creates its own.
+
+        :returns: the client'''
+        if self._pid != os.getpid():
+            self._client = boto3.client('s3', endpoint_url=self._endpoint_url)
+            self._pid = os.getpid()
+        return self._client
+
+    def key(self, id, ext):
+        return f'{id}.{ext}'
+
+    def open_read(self, key):
+        rc = self.client().get_object(Bucket=self._bucket, Key=self._prefix + key)
+        return io.BufferedReader(_StreamingReader(rc['Body']), buffer_size=self.CHUNKSIZE)
+
+    def open_write(self, key):
+        def upload(fh):
+            self.client().upload_fileobj(fh, self._bucket, self._prefix + key)
+        return _SpooledUpload(upload, self.SPOOL)
+
+    def _head(self, key):
+        try:
+            return self.client().head_object(Bucket=self._bucket, Key=self._prefix + key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey']:
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        rc = self._head(key)
+        if rc is None:
+            raise FileNotFoundError(key)
+        return rc['ContentLength']
+
+    def modified(self, key):
+        rc = self._head(key)
+        if rc is None:
+            raise FileNotFoundError(key)
+        return rc['LastModified'].timestamp()
+
+    def delete(self, key):
+        self.client().delete_object(Bucket=self._bucket, Key=self._prefix + key)
+
+    def rename(self, key, newkey):
+        # sd: managed copy, as single copies are limited to 5GB
+        self.client().copy({'Bucket': self._bucket, 'Key': self._prefix + key},
+                           self._bucket, self._prefix + newkey)
+        self.delete(key)
+
+    def keys(self):
+        paginator = self.client().get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=self._prefix):
+            for o in page.get('Contents', []):
+                yield o['Key'][len(self._prefix):]
+
+    def url(self, key):
+        return self.client().generate_presigned_url('get_object',
+                                                    Params={'Bucket': self._bucket,
+                                                            'Key': self._prefix + key},
+                                                    ExpiresIn=self._expiry)
@@ -0,0 +1,204 @@
+# Base class and extension for storage of network files
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import io
+from flask import current_app
+
+
+class StagedWrite(io.RawIOBase):
+    '''A stream that writes to a staging file, committing it to the
+    store when closed. If the stream is used in a with block that
+    raises an exception the file is abandoned instead, so a partly
+    written file is never stored.
+
+    :param fh: the staging file'''
+
+    def __init__(self, fh):
+        self._fh = fh
+        self._abandoned = False
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self._fh.write(b)
+
+    def commit(self):
+        '''Store the staged file. Sub-classes must override this.'''
+        raise NotImplementedError('commit')
+
+    def abandon(self):
+        '''Discard the staged file. Sub-classes must override this.'''
+        raise NotImplementedError('abandon')
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._abandoned:
+                    self.abandon()
+                else:
+                    self.commit()
+            finally:
+                super().close()
+
+    def __exit__(self, t, v, tb):
+        if t is not None:
+            self._abandoned = True
+        self.close()
+
+
+class Storage:
+    '''The base class for storage backends. A backend stores
+    network files under keys, which are relative names that the
+    backend chooses when a network is created and that are then
+    recorded against the network. All reads and writes are streamed
+    through binary file objects.'''
+
+    def key(self, id, ext):
+        '''Return the key under which to store a new network.
+
+        :param id: the network's UUID
+        :param ext: the file's extension
+        :returns: the key'''
+        raise NotImplementedError('key')
+
+    def relocate(self, key):
+        '''Return the key that a file should have under the backend's
+        current layout. This will differ from its actual key if the
+        file was stored under an earlier layout.
+
+        :param key: the key
+        :returns: the key under the current layout'''
+        (id, ext) = key.rsplit('/', 1)[-1].split('.', 1)
+        return self.key(id, ext)
+
+    def open_read(self, key):
+        '''Open a stored file for reading. The file object supports
+        peeking at its contents without consuming them.
+
+        :param key: the key
+        :returns: a buffered binary file object'''
+        raise NotImplementedError('open_read')
+
+    def open_write(self, key):
+        '''Open a file for writing, replacing any file with the same
+        key. The file is only stored once the file object is closed
+        without an exception.
+
+        :param key: the key
+        :returns: a binary file object'''
+        raise NotImplementedError('open_write')
+
+    def exists(self, key):
+        '''Test whether a file exists.
+
+        :param key: the key
+        :returns: True if the file exists'''
+        raise NotImplementedError('exists')
+
+    def size(self, key):
+        '''Return the size of a stored file.
+
+        :param key: the key
+        :returns: the size in bytes'''
+        raise NotImplementedError('size')
+
+    def modified(self, key):
+        '''Return the time a file was last modified.
+
+        :param key: the key
+        :returns: the time in seconds since the epoch'''
+        raise NotImplementedError('modified')
+
+    def delete(self, key):
+        '''Delete a file. Deleting a non-existent file does nothing.
+
+        :param key: the key'''
+        raise NotImplementedError('delete')
+
+    def rename(self, key, newkey):
+        '''Rename a file, replacing any file with the new key.
+
+        :param key: the existing key
+        :param newkey: the new key'''
+        raise NotImplementedError('rename')
+
+    def keys(self):
+        '''Return all the keys in the store.
+
+        :returns: a generator of keys'''
+        raise NotImplementedError('keys')
+
+    def local_path(self, key):
+        '''Return the local filename of a stored file, if it has one.
+        This lets files be served directly by the web server.
+
+        :param key: the key
+        :returns: the filename or None'''
+        return None
+
+    def url(self, key):
+        '''Return a URL from which clients can download a stored file
+        directly, if there is one.
+
+        :param key: the key
+        :returns: the URL or None'''
+        return None
+
+
+class NetworkStore:
+    '''A Flask extension giving access to the storage backend selected
+    by an application's configuration. STORAGE_BACKEND selects either
+    'local' storage in ARCHIVE_DIR or an 's3' bucket. Attributes are
+    looked-up on the current application's backend, so the extension
+    can be used directly as a :class:`Storage`.'''
+
+    def init_app(self, app):
+        '''Create the backend for an application.
+
+        :param app: the application'''
+        app.extensions['storage'] = NetworkStore.create_backend(app.config)
+
+    @staticmethod
+    def create_backend(config):
+        '''Create the backend described by a configuration.
+
+        :param config: the configuration
+        :returns: the backend'''
+        backend = config['STORAGE_BACKEND']
+        if backend == 'local':
+            from epydemicarchive.storage.local import LocalStorage
+            return LocalStorage(config['ARCHIVE_DIR'])
+        elif backend == 's3':
+            from epydemicarchive.storage.s3 import S3Storage
+            return S3Storage(config['S3_BUCKET'],
+                             prefix=config['S3_PREFIX'],
+                             endpoint_url=config['S3_ENDPOINT_URL'],
+                             expiry=config['S3_URL_EXPIRY'])
+        else:
+            raise Exception(f'Unknown storage backend {backend}')
+
+    def backend(self):
+        '''Return the backend for the current application.
+
+        :returns: the backend'''
+        return current_app.extensions['storage']
+
+    def __getattr__(self, name):
+        return getattr(self.backend(), name)
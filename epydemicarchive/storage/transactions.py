@@ -0,0 +1,74 @@
+# Storage operations tied to database transactions
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+def on_commit(session, f):
+    '''Run a function once the session's current transaction commits.
+    The function is discarded if the transaction rolls back instead.
+    Functions are run outside the transaction, and so mustn't use the
+    database; any exception they raise is logged and ignored.
+
+    :param session: the session
+    :param f: a function of no arguments'''
+    session.info.setdefault('on_commit', []).append(f)
+
+
+def on_rollback(session, f):
+    '''Run a function if the session's current transaction rolls back
+    (or is closed without committing). The function is discarded if
+    the transaction commits.
+
+    :param session: the session
+    :param f: a function of no arguments'''
+    session.info.setdefault('on_rollback', []).append(f)
+
+
+def _run(fs):
+    '''Run a list of functions, logging any failures.
+
+    :param fs: the functions'''
+    for f in fs:
+        try:
+            f()
+        except Exception as e:
+            logger.error(f'Post-transaction action failed: {e}')
+
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    # sd: releasing a savepoint also counts as a commit
+    if session.in_nested_transaction():
+        return
+    session.info.pop('on_rollback', None)
+    _run(session.info.pop('on_commit', []))
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    # sd: anything left when the outermost transaction ends
+    # wasn't committed
+    if transaction.parent is None:
+        session.info.pop('on_commit', None)
+        _run(session.info.pop('on_rollback', []))
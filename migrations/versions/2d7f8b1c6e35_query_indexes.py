@@ -0,0 +1,43 @@
+"""query indexes
+
+Revision ID: 2d7f8b1c6e35
+Revises: 9a06c5e2d4b8
+Create Date: 2026-10-19 18:05:44.290117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7f8b1c6e35'
+down_revision = '9a06c5e2d4b8'
+branch_labels = None
+depends_on = None
+
+
+# core metadata with their own columns
+CORE = ['N', 'M', 'kmin', 'kmax', 'kmean']
+
+
+def upgrade():
+    op.create_index(op.f('ix_network_uploaded'), 'network', ['uploaded'], unique=False)
+    op.create_index(op.f('ix_network_user_id'), 'network', ['user_id'], unique=False)
+    op.create_index('ix_tags_tag_network', 'tags', ['tag', 'network'], unique=False)
+    op.drop_index('ix_metadata_key', table_name='metadata')
+    op.create_index('ix_metadata_key_value', 'metadata', ['key', 'value'], unique=False)
+    op.create_index('ix_metadata_network_id_key', 'metadata', ['network_id', 'key'], unique=False)
+    op.create_index('ix_network_summary_uploaded_id', 'network_summary', ['uploaded', 'id'], unique=False)
+    for k in CORE:
+        op.create_index(op.f(f'ix_network_summary_{k}'), 'network_summary', [k], unique=False)
+
+
+def downgrade():
+    for k in CORE:
+        op.drop_index(op.f(f'ix_network_summary_{k}'), table_name='network_summary')
+    op.drop_index('ix_network_summary_uploaded_id', table_name='network_summary')
+    op.drop_index('ix_metadata_network_id_key', table_name='metadata')
+    op.drop_index('ix_metadata_key_value', table_name='metadata')
+    op.create_index('ix_metadata_key', 'metadata', ['key'], unique=False)
+    op.drop_index('ix_tags_tag_network', table_name='tags')
+    op.drop_index(op.f('ix_network_user_id'), table_name='network')
+    op.drop_index(op.f('ix_network_uploaded'), table_name='network')
@@ -0,0 +1,39 @@
+"""analyser versions
+
+Revision ID: 3f2a9c1d7e04
+Revises: 5bdda0f91f0f
+Create Date: 2026-10-19 09:12:31.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e04'
+down_revision = '5bdda0f91f0f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('analysis',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('network_id', sa.String(length=64), nullable=False),
+    sa.Column('analyser', sa.String(length=32), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('analysed', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['network_id'], ['network.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('network_id', 'analyser')
+    )
+    op.create_index(op.f('ix_analysis_network_id'), 'analysis', ['network_id'], unique=False)
+    with op.batch_alter_table('metadata') as batch_op:
+        batch_op.add_column(sa.Column('analyser', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('metadata') as batch_op:
+        batch_op.drop_column('analyser')
+    op.drop_index(op.f('ix_analysis_network_id'), table_name='analysis')
+    op.drop_table('analysis')
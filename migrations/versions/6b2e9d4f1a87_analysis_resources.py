@@ -0,0 +1,30 @@
+"""analysis resources
+
+Revision ID: 6b2e9d4f1a87
+Revises: 2d7f8b1c6e35
+Create Date: 2026-10-19 19:12:53.830526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2e9d4f1a87'
+down_revision = '2d7f8b1c6e35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('analysis') as batch_op:
+        batch_op.add_column(sa.Column('wall_time', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('cpu_time', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('peak_rss', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('analysis') as batch_op:
+        batch_op.drop_column('peak_rss')
+        batch_op.drop_column('cpu_time')
+        batch_op.drop_column('wall_time')
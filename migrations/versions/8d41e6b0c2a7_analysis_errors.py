@@ -0,0 +1,26 @@
+"""analysis errors
+
+Revision ID: 8d41e6b0c2a7
+Revises: 3f2a9c1d7e04
+Create Date: 2026-10-19 11:40:07.913226
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b0c2a7'
+down_revision = '3f2a9c1d7e04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('network') as batch_op:
+        batch_op.add_column(sa.Column('analysis_error', sa.String(length=1024), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('network') as batch_op:
+        batch_op.drop_column('analysis_error')
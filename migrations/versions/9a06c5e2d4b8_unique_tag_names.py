@@ -0,0 +1,43 @@
+"""unique tag names
+
+Revision ID: 9a06c5e2d4b8
+Revises: e71b3d5a9f20
+Create Date: 2026-10-19 17:31:08.662410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a06c5e2d4b8'
+down_revision = 'e71b3d5a9f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # merge any duplicate tags into the one with the lowest id
+    tag = sa.table('tag', sa.column('id'), sa.column('name'))
+    tagged = sa.table('tags', sa.column('network'), sa.column('tag'))
+    conn = op.get_bind()
+    keep = dict()
+    for (id, name) in conn.execute(sa.select(tag.c.id, tag.c.name).order_by(tag.c.id)):
+        if name not in keep:
+            keep[name] = id
+            continue
+        k = keep[name]
+
+        # re-tag networks with the duplicate, unless they also have the original
+        already = sa.select(tagged.c.network).where(tagged.c.tag == k)
+        conn.execute(tagged.delete().where(tagged.c.tag == id, tagged.c.network.in_(already)))
+        conn.execute(tagged.update().where(tagged.c.tag == id).values(tag=k))
+        conn.execute(tag.delete().where(tag.c.id == id))
+
+    op.drop_index('ix_tag_name', table_name='tag')
+    op.create_index('ix_tag_name', 'tag', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_tag_name', table_name='tag')
+    op.create_index('ix_tag_name', 'tag', ['name'], unique=False)
@@ -0,0 +1,77 @@
+"""network summaries
+
+Revision ID: c4e8a2f7b913
+Revises: 8d41e6b0c2a7
+Create Date: 2026-10-19 15:40:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f7b913'
+down_revision = '8d41e6b0c2a7'
+branch_labels = None
+depends_on = None
+
+
+# core metadata with their own columns
+CORE = {'N': int, 'M': int, 'kmin': int, 'kmax': int, 'kmean': float}
+
+
+def upgrade():
+    summary = op.create_table('network_summary',
+    sa.Column('id', sa.String(length=64), nullable=False),
+    sa.Column('title', sa.String(length=256), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('owner_email', sa.String(length=120), nullable=True),
+    sa.Column('uploaded', sa.DateTime(), nullable=True),
+    sa.Column('analysis_error', sa.String(length=1024), nullable=True),
+    sa.Column('tags', sa.Text(), nullable=True),
+    sa.Column('N', sa.Integer(), nullable=True),
+    sa.Column('M', sa.Integer(), nullable=True),
+    sa.Column('kmin', sa.Integer(), nullable=True),
+    sa.Column('kmax', sa.Integer(), nullable=True),
+    sa.Column('kmean', sa.Float(), nullable=True),
+    sa.Column('meta', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['id'], ['network.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # summarise the existing networks
+    network = sa.table('network', sa.column('id'), sa.column('title'), sa.column('description'),
+                       sa.column('user_id'), sa.column('uploaded', sa.DateTime), sa.column('analysis_error'))
+    user = sa.table('user', sa.column('id'), sa.column('email'))
+    tagged = sa.table('tags', sa.column('network'), sa.column('tag'))
+    tag = sa.table('tag', sa.column('id'), sa.column('name'))
+    metadata = sa.table('metadata', sa.column('network_id'), sa.column('key'), sa.column('value'))
+    conn = op.get_bind()
+    tags = dict()
+    q = sa.select(tagged.c.network, tag.c.name).select_from(tagged.join(tag, tagged.c.tag == tag.c.id))
+    for (id, name) in conn.execute(q):
+        tags.setdefault(id, []).append(name)
+    meta = dict()
+    q = sa.select(metadata.c.network_id, metadata.c.key, metadata.c.value)
+    for (id, k, v) in conn.execute(q):
+        meta.setdefault(id, dict())[k] = v
+    rows = []
+    q = sa.select(network.c.id, network.c.title, network.c.description, user.c.email,
+                  network.c.uploaded, network.c.analysis_error).select_from(network.join(user, network.c.user_id == user.c.id))
+    for (id, title, description, email, uploaded, error) in conn.execute(q):
+        m = meta.get(id, dict())
+        row = dict(id=id, title=title, description=description,
+                   owner_email=email, uploaded=uploaded, analysis_error=error,
+                   tags='|' + ''.join([f'{t}|' for t in tags.get(id, [])]),
+                   meta=m)
+        for (k, t) in CORE.items():
+            try:
+                row[k] = t(float(m[k])) if k in m else None
+            except ValueError:
+                row[k] = None
+        rows.append(row)
+    op.bulk_insert(summary, rows)
+
+
+def downgrade():
+    op.drop_table('network_summary')
@@ -0,0 +1,47 @@
+"""full-text search
+
+Revision ID: e71b3d5a9f20
+Revises: c4e8a2f7b913
+Create Date: 2026-10-19 16:52:37.104381
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e71b3d5a9f20'
+down_revision = 'c4e8a2f7b913'
+branch_labels = None
+depends_on = None
+
+
+TSVECTOR = "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE network_text USING fts5(id UNINDEXED, title, description)')
+        op.execute('''CREATE TRIGGER network_text_insert AFTER INSERT ON network_summary BEGIN
+                        INSERT INTO network_text (id, title, description) VALUES (new.id, new.title, new.description);
+                      END''')
+        op.execute('''CREATE TRIGGER network_text_update AFTER UPDATE OF title, description ON network_summary BEGIN
+                        UPDATE network_text SET title = new.title, description = new.description WHERE id = old.id;
+                      END''')
+        op.execute('''CREATE TRIGGER network_text_delete AFTER DELETE ON network_summary BEGIN
+                        DELETE FROM network_text WHERE id = old.id;
+                      END''')
+        op.execute('INSERT INTO network_text (id, title, description) SELECT id, title, description FROM network_summary')
+    elif dialect == 'postgresql':
+        op.execute(f'CREATE INDEX ix_network_summary_text ON network_summary USING gin ({TSVECTOR})')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TRIGGER network_text_delete')
+        op.execute('DROP TRIGGER network_text_update')
+        op.execute('DROP TRIGGER network_text_insert')
+        op.execute('DROP TABLE network_text')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX ix_network_summary_text')
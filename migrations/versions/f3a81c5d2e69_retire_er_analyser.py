@@ -0,0 +1,53 @@
+"""retire er analyser
+
+Revision ID: f3a81c5d2e69
+Revises: 6b2e9d4f1a87
+Create Date: 2026-10-19 21:14:52.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a81c5d2e69'
+down_revision = '6b2e9d4f1a87'
+branch_labels = None
+depends_on = None
+
+
+# sd: the ER analyser is now one candidate within the degree
+# distribution classifier, and no longer runs on its own
+RETIRED = 'er'
+
+
+def upgrade():
+    metadata = sa.table('metadata', sa.column('network_id'), sa.column('analyser'),
+                        sa.column('key'), sa.column('value'))
+    analysis = sa.table('analysis', sa.column('analyser'))
+    summary = sa.table('network_summary', sa.column('id'), sa.column('meta', sa.JSON))
+    conn = op.get_bind()
+
+    # remove the retired analyser's values from the networks' summaries
+    retired = dict()
+    for (id, k, v) in conn.execute(sa.select(metadata.c.network_id, metadata.c.key, metadata.c.value)
+                                   .where(metadata.c.analyser == RETIRED)):
+        retired.setdefault(id, []).append((k, v))
+    for (id, kvs) in retired.items():
+        meta = conn.execute(sa.select(summary.c.meta).where(summary.c.id == id)).scalar()
+        if meta is None:
+            continue
+        for (k, v) in kvs:
+            if meta.get(k) == v:
+                del meta[k]
+        conn.execute(summary.update().where(summary.c.id == id).values(meta=meta))
+
+    # remove its metadata and runs
+    conn.execute(metadata.delete().where(metadata.c.analyser == RETIRED))
+    conn.execute(analysis.delete().where(analysis.c.analyser == RETIRED))
+
+
+def downgrade():
+    # the deleted results can't be restored, but re-analysing with
+    # the ER analyser will regenerate them
+    pass
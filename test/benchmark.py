@@ -0,0 +1,350 @@
+# Benchmarks for ingest, analysis, search and download
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+
+# sd: this isn't part of the test suite: it's run directly, usually
+# by "make benchmark", and writes its results as JSON so that runs
+# against different releases can be compared
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import threading
+import statistics
+from datetime import datetime
+from tempfile import mkdtemp
+from shutil import rmtree
+import requests
+from networkx import fast_gnp_random_graph
+from werkzeug.serving import make_server
+from epydemicarchive import create, Config, db
+from epydemicarchive.api.v1 import __version__ as api_version
+from epydemicarchive.api.v1.client import Archive
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import Network, NetworkSummary, Metadata, Analysis
+from helpers import upload
+
+
+#: Words used to make up network titles and descriptions.
+WORDS = ['social', 'contact', 'random', 'epidemic', 'network', 'school',
+         'hospital', 'village', 'survey', 'synthetic', 'mobility', 'sexual',
+         'household', 'workplace', 'email', 'citation', 'transport', 'trade']
+
+#: Tags applied to networks.
+TAGS = ['er', 'synthetic', 'benchmark', 'social', 'contact', 'large',
+        'small', 'sparse', 'dense', 'weighted']
+
+
+def summarise(ts):
+    '''Summarise a sample of measurements.
+
+    :param ts: the measurements
+    :returns: a dict of summary statistics'''
+    ts = sorted(ts)
+    n = len(ts)
+    return dict(n=n,
+                mean=statistics.mean(ts),
+                median=statistics.median(ts),
+                p95=ts[min(n - 1, int(0.95 * n))],
+                max=ts[-1])
+
+
+def timed(f, *args, **kwargs):
+    '''Time a function call.
+
+    :param f: the function
+    :param args: positional arguments
+    :param kwargs: keyword arguments
+    :returns: a pair of the elapsed time in seconds and the function's result'''
+    start = time.perf_counter()
+    rc = f(*args, **kwargs)
+    return (time.perf_counter() - start, rc)
+
+
+def graph(N, kmean):
+    '''Create an ER network.
+
+    :param N: the number of nodes
+    :param kmean: the mean degree
+    :returns: the network'''
+    return fast_gnp_random_graph(N, min(1.0, kmean / N))
+
+
+def text(n):
+    '''Create some random text.
+
+    :param n: the number of words
+    :returns: the text'''
+    return ' '.join(random.choices(WORDS, k=n))
+
+
+class Benchmark:
+    '''An archive set up for benchmarking.
+
+    The archive runs in a server thread, with its database and
+    networks held in a temporary directory (unless given a database
+    to use) and accessed through the API client like any other.
+
+    :param args: the command-line arguments'''
+
+    def __init__(self, args):
+        self._args = args
+        self._dir = mkdtemp()
+        self._submitted = dict()           # size -> list of UUIDs
+
+        # create the app
+        # sd: sqlite is used by default, as it's the database with
+        # the least configuration, tuned for concurrency because
+        # the server is threaded
+        Config.SQLALCHEMY_DATABASE_URI = args.database or 'sqlite:///{d}'.format(d=os.path.join(self._dir, 'benchmark.db'))
+        Config.DATABASE_PROFILE = 'concurrent'
+        Config.ARCHIVE_DIR = os.path.join(self._dir, 'archive')
+        self._app = create(Config)
+
+        # create the tables and a user
+        with self._app.app_context():
+            db.create_all()
+            u = User.create_user('benchmark@test.com', 'xxx')
+            db.session.commit()
+            self._email = u.email
+            self._api_key = u.api_key
+
+        # start the server
+        self._server = make_server('localhost', 0, self._app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self._uri = 'http://localhost:{p}'.format(p=self._server.server_port)
+        self._archive = Archive(self._uri, self._api_key)
+
+    def close(self):
+        '''Stop the server and discard the archive.'''
+        self._server.shutdown()
+        self._thread.join()
+        if self._args.database is not None:
+            with self._app.app_context():
+                db.drop_all()
+        rmtree(self._dir, ignore_errors=True)
+
+    def networks(self):
+        '''Return the number of networks in the archive.
+
+        :returns: the number of networks'''
+        with self._app.app_context():
+            return Network.query.count()
+
+    def submit(self):
+        '''Measure the time taken to submit networks of different sizes
+        through the API, including their analysis.
+
+        :returns: a list of results for each size'''
+        args = self._args
+        res = []
+        for N in args.sizes:
+            ts = []
+            edges = 0
+            uuids = []
+            for _ in range(args.repeats):
+                g = graph(N, args.kmean)
+                edges += g.number_of_edges()
+                (t, uuid) = timed(self._archive.submit, g,
+                                  title=text(4), desc=text(20), tags=random.sample(TAGS, 3))
+                ts.append(t)
+                uuids.append(uuid)
+            self._submitted[N] = uuids
+            elapsed = sum(ts)
+            res.append(dict(N=N,
+                            time=summarise(ts),
+                            networks_per_second=len(ts) / elapsed,
+                            edges_per_second=edges / elapsed))
+            print(f'Submit N={N}: {statistics.median(ts):.3f}s per network', file=sys.stderr)
+        return res
+
+    def analysis(self):
+        '''Extract the resources used by each analyser, and in loading
+        networks, for the networks submitted at each size.
+
+        :returns: a list of results for each analyser and size'''
+        res = []
+        with self._app.app_context():
+            for (N, uuids) in self._submitted.items():
+                runs = dict()
+                for a in Analysis.query.filter(Analysis.network_id.in_(uuids), Analysis.wall_time.isnot(None)):
+                    if a.analyser not in runs:
+                        runs[a.analyser] = []
+                    runs[a.analyser].append(a)
+                for (name, rs) in sorted(runs.items()):
+                    rss = [a.peak_rss for a in rs if a.peak_rss is not None]
+                    res.append(dict(analyser=name,
+                                    N=N,
+                                    wall_time=summarise([a.wall_time for a in rs]),
+                                    cpu_time=summarise([a.cpu_time for a in rs]),
+                                    peak_rss=max(rss) if len(rss) > 0 else None))
+        return res
+
+    def populate(self, size):
+        '''Grow the archive to the given number of networks. The networks
+        are added directly rather than through the API, and given core
+        metadata without being analysed, as only their number matters.
+
+        :param size: the number of networks'''
+        args = self._args
+        with self._app.app_context():
+            u = User.query.filter_by(email=self._email).first()
+            existing = Network.query.count()
+            for i in range(existing, size):
+                N = random.choice(args.bulk_sizes)
+                g = graph(N, args.kmean)
+                n = upload(u, g, text(4), text(20), random.sample(TAGS, random.randint(1, 4)))
+                n.available = True
+                M = g.number_of_edges()
+                for (k, v) in [('N', N), ('M', M), ('kmean', 2 * M / N)]:
+                    Metadata(network=n, analyser='benchmark', key=k, value=str(v))
+                NetworkSummary.refresh(n)
+
+                # commit in batches
+                if (i + 1) % 100 == 0:
+                    db.session.commit()
+            db.session.commit()
+
+    def queries(self):
+        '''Return a set of queries, chosen at random so that
+        repeated queries don't just hit caches.
+
+        :returns: a dict from query name to query'''
+        lo = random.choice(self._args.bulk_sizes) // 2
+        return {
+            'tag': dict(tags=[random.choice(TAGS)]),
+            'metadata': dict(metadata=[dict(key='N', operator='between', low=lo, high=lo * 4)]),
+            'text': dict(text=' '.join(random.sample(WORDS, 2))),
+            'combined': dict(tags=[random.choice(TAGS)],
+                             metadata=[dict(key='kmean', operator='greaterthan', value=random.random() * self._args.kmean)],
+                             text=random.choice(WORDS)),
+        }
+
+    def search(self):
+        '''Measure the latency of searches against archives of
+        different sizes, for finding networks and for computing
+        the facets of queries.
+
+        :returns: a list of results for each archive size and query'''
+        args = self._args
+        res = []
+        for size in args.archive_sizes:
+            self.populate(size)
+            networks = self.networks()
+            ts = dict()
+            for _ in range(args.queries):
+                for (name, q) in self.queries().items():
+                    (t, _) = timed(self._archive.find, **q)
+                    ts.setdefault(('find', name), []).append(t)
+
+                    (t, _) = timed(self._archive.facets, **q)
+                    ts.setdefault(('facets', name), []).append(t)
+            for ((kind, name), qts) in sorted(ts.items()):
+                res.append(dict(networks=networks,
+                                endpoint=kind,
+                                query=name,
+                                latency=summarise(qts)))
+            finds = [t for ((kind, _), qts) in ts.items() if kind == 'find' for t in qts]
+            print(f'Search over {networks} networks: {statistics.median(finds) * 1000:.1f}ms median find', file=sys.stderr)
+        return res
+
+    def download(self):
+        '''Measure the throughput of downloading the raw networks
+        submitted at each size.
+
+        :returns: a list of results for each size'''
+        headers = {'Authorization': f'Bearer {self._api_key}'}
+        res = []
+        for (N, uuids) in self._submitted.items():
+            ts = []
+            size = 0
+            for uuid in uuids:
+                start = time.perf_counter()
+                r = requests.get(self._archive.endpoint('/network/raw', uuid),
+                                 headers=headers, stream=True)
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=Archive.CHUNKSIZE):
+                    size += len(chunk)
+                ts.append(time.perf_counter() - start)
+            elapsed = sum(ts)
+            res.append(dict(N=N,
+                            time=summarise(ts),
+                            bytes=size,
+                            bytes_per_second=size / elapsed))
+            print(f'Download N={N}: {size / elapsed / (1024 * 1024):.1f}MB/s', file=sys.stderr)
+        return res
+
+
+def sizes(s):
+    '''Parse a comma-separated list of sizes.
+
+    :param s: the string
+    :returns: a list of integers'''
+    return [int(v) for v in s.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the archive.')
+    parser.add_argument('--output', help='file to write the results to (defaults to standard output)')
+    parser.add_argument('--release', help='release being benchmarked, recorded in the results')
+    parser.add_argument('--database', help='database URI to use (defaults to a temporary SQLite database)')
+    parser.add_argument('--sizes', type=sizes, default=[100, 1000, 10000],
+                        help='sizes of network to submit and download (default: %(default)s)')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='number of networks to submit at each size (default: %(default)s)')
+    parser.add_argument('--kmean', type=float, default=5.0,
+                        help='mean degree of networks (default: %(default)s)')
+    parser.add_argument('--archive-sizes', type=sizes, default=[1000, 2000, 5000],
+                        help='numbers of networks to search through (default: %(default)s)')
+    parser.add_argument('--bulk-sizes', type=sizes, default=[50, 100, 200, 500],
+                        help='sizes of networks used to grow the archive (default: %(default)s)')
+    parser.add_argument('--queries', type=int, default=20,
+                        help='number of times to repeat each search (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='random seed, for repeatable archives')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    results = dict(release=args.release,
+                   api_version=api_version,
+                   timestamp=datetime.utcnow().isoformat(),
+                   platform=dict(python=platform.python_version(),
+                                 system=platform.system(),
+                                 machine=platform.machine(),
+                                 cpus=os.cpu_count()),
+                   parameters=vars(args))
+    bm = Benchmark(args)
+    try:
+        results['submit'] = bm.submit()
+        results['analysis'] = bm.analysis()
+        results['download'] = bm.download()
+        results['search'] = bm.search()
+    finally:
+        bm.close()
+
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
@@ -0,0 +1,40 @@
+# Helper functions for tests
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import io
+from networkx import write_adjlist
+from werkzeug.datastructures import FileStorage
+from epydemicarchive.archive.models import Network
+
+
+def upload(user, g, title='A network', desc='A test network', tags=['test']):
+    '''Add a network to the archive as though it had been uploaded
+    as an adjacency list. The network isn't committed.
+
+    :param user: the network's owner
+    :param g: the network
+    :param title: (optional) the title
+    :param desc: (optional) the description
+    :param tags: (optional) the tags
+    :returns: the network's archive record'''
+    buf = io.BytesIO()
+    write_adjlist(g, buf)
+    buf.seek(0)
+    return Network.create_network(user, 'network.al', FileStorage(buf, 'network.al'),
+                                  title, desc, tags)
@@ -0,0 +1,307 @@
+# Load-testing harness for a live archive server
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+
+# sd: like the benchmarks this is run directly, usually by "make
+# loadtest", rather than as part of the test suite
+
+import os
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import subprocess
+from tempfile import mkdtemp
+from shutil import rmtree
+from multiprocessing import Pool
+from networkx import fast_gnp_random_graph
+from epydemicarchive.api.v1.client import Archive
+
+
+#: Tags applied to submitted networks, and searched for.
+TAGS = ['er', 'synthetic', 'loadtest', 'social', 'contact', 'sparse']
+
+#: The default mix of operations, as relative weights.
+MIX = dict(search=60, info=20, raw=15, submit=5)
+
+#: Percentiles reported for latencies.
+PERCENTILES = [50, 90, 99]
+
+
+def percentile(ts, p):
+    '''Return a percentile of a sorted sample.
+
+    :param ts: the sorted sample
+    :param p: the percentile
+    :returns: the value'''
+    return ts[min(len(ts) - 1, int(len(ts) * p / 100))]
+
+
+def graph(N, kmean):
+    '''Create an ER network.
+
+    :param N: the number of nodes
+    :param kmean: the mean degree
+    :returns: the network'''
+    return fast_gnp_random_graph(N, min(1.0, kmean / N))
+
+
+def drive(uri, api_key, uuids, mix, size, kmean, start, duration, seed):
+    '''Drive the archive as a single client, issuing a random mix of
+    operations until the time is up.
+
+    :param uri: the archive's URI
+    :param api_key: the API key
+    :param uuids: the UUIDs of networks to ask about
+    :param mix: a dict from operation to relative weight
+    :param size: the size of networks to submit
+    :param kmean: the mean degree of networks to submit
+    :param start: the wall-clock time at which to start
+    :param duration: the time to run for
+    :param seed: the random seed for this client
+    :returns: a list of (operation, latency, ok) triples'''
+    rng = random.Random(seed)
+    archive = Archive(uri, api_key)
+    g = graph(size, kmean)
+
+    ops = {
+        'search': lambda: archive.find(tags=[rng.choice(TAGS)],
+                                       metadata=[dict(key='N', operator='lessthanorequal', value=rng.randint(size // 2, size * 2))]),
+        'info': lambda: archive.info(rng.choice(uuids)),
+        'raw': lambda: archive.raw(rng.choice(uuids)),
+        'submit': lambda: archive.submit(g, title='Load test network', desc='A network', tags=rng.sample(TAGS, 2)),
+    }
+    names = list(mix.keys())
+    weights = [mix[k] for k in names]
+
+    # start with all the other clients
+    time.sleep(max(0, start - time.time()))
+    end = time.perf_counter() + duration
+    res = []
+    while time.perf_counter() < end:
+        op = rng.choices(names, weights)[0]
+        t = time.perf_counter()
+        try:
+            ops[op]()
+            ok = True
+        except Exception:
+            ok = False
+        res.append((op, time.perf_counter() - t, ok))
+    return res
+
+
+class Server:
+    '''A local archive server run by gunicorn, with a database and
+    networks held in a temporary directory (unless given a database
+    to use), and a user to drive it.
+
+    :param workers: the number of gunicorn workers
+    :param database: (optional) the database URI'''
+
+    #: Time allowed for the server to start, in seconds.
+    STARTUP = 30
+
+    def __init__(self, workers, database=None):
+        from epydemicarchive import create, Config, db
+        from epydemicarchive.auth.models import User
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self._dir = mkdtemp()
+        self._database = database
+        env = dict(os.environ,
+                   DATABASE_URI=database or 'sqlite:///{d}'.format(d=os.path.join(self._dir, 'loadtest.db')),
+                   DATABASE_PROFILE='concurrent',
+                   ARCHIVE_DIR=os.path.join(self._dir, 'archive'),
+                   SECRET_KEY=os.urandom(16).hex(),
+                   LOGFILE=os.path.join(self._dir, 'ea.log'))
+
+        # create the tables and a user, configured as the server will be
+        # sd: the environment is only read when the configuration is
+        # first imported, so we set the class attributes directly
+        Config.SQLALCHEMY_DATABASE_URI = env['DATABASE_URI']
+        Config.DATABASE_PROFILE = env['DATABASE_PROFILE']
+        Config.ARCHIVE_DIR = env['ARCHIVE_DIR']
+        app = create(Config)
+        with app.app_context():
+            db.create_all()
+            u = User.create_user('loadtest@test.com', 'xxx')
+            db.session.commit()
+            self.api_key = u.api_key
+            db.engine.dispose()
+
+        # start the server on a free port
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.uri = f'http://127.0.0.1:{port}'
+        self._process = subprocess.Popen([sys.executable, '-m', 'gunicorn',
+                                          '--workers', str(workers),
+                                          '--bind', f'127.0.0.1:{port}',
+                                          'ea:app'],
+                                         cwd=root, env=env,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # wait for it to answer
+        archive = Archive(self.uri, self.api_key)
+        deadline = time.perf_counter() + self.STARTUP
+        while True:
+            try:
+                archive.tags()
+                break
+            except Exception:
+                if self._process.poll() is not None or time.perf_counter() > deadline:
+                    self.close()
+                    raise Exception('Server failed to start')
+                time.sleep(0.5)
+
+    def close(self):
+        '''Stop the server and discard the archive.'''
+        self._process.terminate()
+        self._process.wait()
+        if self._database is not None:
+            from epydemicarchive import create, Config, db
+            with create(Config).app_context():
+                db.drop_all()
+        rmtree(self._dir, ignore_errors=True)
+
+
+def load(uri, api_key, uuids, clients, args):
+    '''Run a number of concurrent clients against the archive.
+
+    :param uri: the archive's URI
+    :param api_key: the API key
+    :param uuids: the UUIDs of networks to ask about
+    :param clients: the number of clients
+    :param args: the command-line arguments
+    :returns: a dict of results'''
+    start = time.time() + 1
+    jobs = [(uri, api_key, uuids, args.mix, args.size, args.kmean, start, args.duration, random.random())
+            for _ in range(clients)]
+    with Pool(clients) as pool:
+        rcs = pool.starmap(drive, jobs)
+    results = [r for rc in rcs for r in rc]
+
+    res = dict(clients=clients, operations=dict())
+    for op in sorted(set([op for (op, _, _) in results] + ['all'])):
+        rs = [r for r in results if op in ['all', r[0]]]
+        ts = sorted([t for (_, t, ok) in rs if ok])
+        s = dict(requests=len(rs),
+                 errors=len([ok for (_, _, ok) in rs if not ok]),
+                 throughput=len(rs) / args.duration)
+        if len(ts) > 0:
+            s.update({f'p{p}': percentile(ts, p) for p in PERCENTILES})
+        res['operations'][op] = s
+    return res
+
+
+def report(res):
+    '''Print a table of results for a number of clients.
+
+    :param res: the results'''
+    print(f'{res["clients"]} clients:')
+    headings = ['operation', 'requests', 'errors', 'req/s'] + [f'p{p} (ms)' for p in PERCENTILES]
+    rows = []
+    for (op, s) in res['operations'].items():
+        rows.append([op, str(s['requests']), str(s['errors']), f'{s["throughput"]:.1f}'] +
+                    [f'{s[f"p{p}"] * 1000:.1f}' if f'p{p}' in s else '' for p in PERCENTILES])
+    widths = [max(len(h), *[len(r[i]) for r in rows]) for (i, h) in enumerate(headings)]
+    print('  '.join([h.ljust(w) for (h, w) in zip(headings, widths)]))
+    for r in rows:
+        print('  '.join([v.ljust(w) for (v, w) in zip(r, widths)]))
+    print()
+
+
+def counts(s):
+    '''Parse a comma-separated list of client counts.
+
+    :param s: the string
+    :returns: a list of integers'''
+    return [int(v) for v in s.split(',')]
+
+
+def mix(s):
+    '''Parse a mix of operations given as a comma-separated
+    list of operation=weight pairs.
+
+    :param s: the string
+    :returns: a dict from operation to weight'''
+    m = dict()
+    for kv in s.split(','):
+        (k, v) = kv.split('=')
+        if k not in MIX:
+            raise argparse.ArgumentTypeError(f'Unknown operation {k}')
+        m[k] = float(v)
+    return m
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test an archive server.')
+    parser.add_argument('--server', help='URI of a running server to test (defaults to starting one locally)')
+    parser.add_argument('--api-key', help='API key for a running server')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of gunicorn workers for a local server (default: %(default)s)')
+    parser.add_argument('--database', help='database URI for a local server (defaults to a temporary SQLite database)')
+    parser.add_argument('--clients', type=counts, default=[1, 2, 4, 8],
+                        help='numbers of concurrent clients to run with (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='time in seconds to run each number of clients for (default: %(default)s)')
+    parser.add_argument('--mix', type=mix, default=MIX,
+                        help='relative weights of operations (default: search=60,info=20,raw=15,submit=5)')
+    parser.add_argument('--networks', type=int, default=50,
+                        help='number of networks to submit before starting (default: %(default)s)')
+    parser.add_argument('--size', type=int, default=1000,
+                        help='size of networks to submit (default: %(default)s)')
+    parser.add_argument('--kmean', type=float, default=5.0,
+                        help='mean degree of networks to submit (default: %(default)s)')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    args = parser.parse_args()
+
+    server = None
+    if args.server is None:
+        server = Server(args.workers, args.database)
+        (uri, api_key) = (server.uri, server.api_key)
+    else:
+        (uri, api_key) = (args.server, args.api_key)
+    try:
+        # populate the archive so there are networks to ask about
+        archive = Archive(uri, api_key)
+        for _ in range(args.networks):
+            archive.submit(graph(args.size, args.kmean),
+                           title='Load test network', desc='A network', tags=random.sample(TAGS, 2))
+        uuids = archive.networks()
+        if len(uuids) == 0:
+            raise Exception('No networks in the archive to load-test with')
+
+        results = []
+        for clients in args.clients:
+            res = load(uri, api_key, uuids, clients, args)
+            report(res)
+            results.append(res)
+    finally:
+        if server is not None:
+            server.close()
+
+    if args.output is not None:
+        with open(args.output, 'w') as fh:
+            json.dump(dict(server=args.server,
+                           workers=None if server is None else args.workers,
+                           parameters=vars(args),
+                           results=results), fh, indent=2)
@@ -0,0 +1,256 @@
+# Tests of running analysers over the archive
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from tempfile import mkdtemp
+from networkx import fast_gnp_random_graph, relabel_nodes
+from epydemicarchive import create, Config, db, analyser
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import Network
+from epydemicarchive.metadata import Analyser, AnalyserChain
+from epydemicarchive.metadata.sampled import SampledAnalyser
+from epydemicarchive.metadata.fingerprint import Fingerprint
+from epydemicarchive.metadata.commands import stale_networks, reanalyse
+from helpers import upload
+
+
+class Counting(Analyser):
+    '''An analyser that records the number of nodes in a network
+    and counts the number of times it's run.
+
+    :param name: the analyser's name
+    :param version: (optional) the analyser's version (defaults to 1)
+    :param structural: (optional) True if the analyser is structural (defaults to False)'''
+
+    def __init__(self, name, version=1, structural=False):
+        self.NAME = name
+        self.VERSION = version
+        self.STRUCTURAL = structural
+        self.runs = 0
+
+    def do(self, n, g):
+        self.runs += 1
+        return {f'{self.NAME}-nodes': g.order()}
+
+
+class Failing(Analyser):
+    '''An analyser that always fails.'''
+
+    NAME = 'failing'
+
+    def do(self, n, g):
+        raise ValueError('analysis failed')
+
+
+class Sampling(SampledAnalyser):
+    '''An analyser that records a random number.'''
+
+    NAME = 'sampling'
+
+    def do(self, n, g):
+        return {'random': self._rng.random()}
+
+
+class ArchiveTestCase(unittest.TestCase):
+    '''Base class for tests against an archive with an empty
+    chain of analysers, run in-process or in a sandbox.'''
+
+    SANDBOX = False     #: True to run analysers in a sandbox.
+
+    def setUp(self):
+        '''Create an empty archive with a user.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        Config.ANALYSIS_SANDBOX = self.SANDBOX
+        self.app = create(Config)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+        analyser.init_app(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def network(self, g, analyse=True):
+        '''Add a network to the archive.
+
+        :param g: the network
+        :param analyse: (optional) analyse the network (defaults to True)
+        :returns: the network's UUID'''
+        n = upload(self.user, g)
+        if analyse:
+            analyser.analyse(n)
+        db.session.commit()
+        return n.id
+
+
+class TestAnalysis(ArchiveTestCase):
+    '''Test running chains of analysers over networks, both when
+    they're submitted and to bring their analyses up to date.'''
+
+    def setUp(self):
+        '''Create an archive with a chain of test analysers.'''
+        super().setUp()
+        self.a = Counting('a')
+        self.b = Counting('b')
+        analyser.register_analyser(self.a)
+        analyser.register_analyser(self.b)
+
+    def testOutdated(self):
+        '''Test we find the analysers that haven't run, or ran at an earlier version.'''
+        id = self.network(fast_gnp_random_graph(50, 0.1))
+        n = Network.from_uuid(id)
+        self.assertCountEqual(analyser.outdated(n), [])
+
+        self.b.VERSION = 2
+        self.assertCountEqual(analyser.outdated(n), [self.b])
+
+        c = Counting('c')
+        analyser.register_analyser(c)
+        self.assertCountEqual(analyser.outdated(n), [self.b, c])
+
+    def testStale(self):
+        '''Test we find networks with outdated analyses.'''
+        ids = [self.network(fast_gnp_random_graph(50, 0.1)) for _ in range(3)]
+        self.assertCountEqual(stale_networks(), [])
+
+        unanalysed = self.network(fast_gnp_random_graph(50, 0.1), analyse=False)
+        self.assertCountEqual(stale_networks(), [unanalysed])
+
+        self.a.VERSION = 2
+        self.assertCountEqual(stale_networks(), ids + [unanalysed])
+
+    def testStalePaged(self):
+        '''Test we can page through the stale networks.'''
+        ids = sorted([self.network(fast_gnp_random_graph(50, 0.1), analyse=False) for _ in range(5)])
+        self.assertEqual(stale_networks(limit=2), ids[:2])
+        self.assertEqual(stale_networks(after=ids[1], limit=2), ids[2:4])
+        self.assertEqual(stale_networks(after=ids[3]), ids[4:])
+
+    def testStaleEmptyChain(self):
+        '''Test no network is stale when there are no analysers.'''
+        self.network(fast_gnp_random_graph(50, 0.1), analyse=False)
+        analyser.init_app(self.app)
+        self.assertCountEqual(stale_networks(), [])
+
+    def testReanalyse(self):
+        '''Test we run only the outdated analysers.'''
+        ids = [self.network(fast_gnp_random_graph(50, 0.1)) for _ in range(3)]
+        self.assertEqual((self.a.runs, self.b.runs), (3, 3))
+
+        self.b.VERSION = 2
+        rc = self.app.test_cli_runner().invoke(reanalyse, ['--workers', '1', '--batch', '2'])
+        self.assertEqual(rc.exit_code, 0, rc.output)
+        self.assertIn('3 networks analysed, 0 failed', rc.output)
+        self.assertEqual((self.a.runs, self.b.runs), (3, 6))
+        for id in ids:
+            n = Network.from_uuid(id)
+            self.assertEqual({r.analyser: r.version for r in n.analyses}['b'], 2)
+        self.assertCountEqual(stale_networks(), [])
+
+    def reusing(self):
+        '''Set up a chain that fingerprints networks and then runs a
+        structural and a non-structural analyser.
+
+        :returns: the structural and non-structural analysers'''
+        analyser.init_app(self.app)
+        s = Counting('s', structural=True)
+        ns = Counting('ns')
+        for a in [Fingerprint(), s, ns]:
+            analyser.register_analyser(a)
+        return (s, ns)
+
+    def testReuse(self):
+        '''Test a relabelled copy of a network re-uses the stored results.'''
+        (s, ns) = self.reusing()
+        g = fast_gnp_random_graph(50, 0.1)
+        id = self.network(g)
+        copy = self.network(relabel_nodes(g, {v: v + 1000 for v in g}))
+        self.assertEqual((s.runs, ns.runs), (1, 2))
+
+        n = Network.from_uuid(copy)
+        self.assertEqual(n['s-nodes'], '50')
+        run = next(r for r in n.analyses if r.analyser == 's')
+        self.assertEqual(run.version, 1)
+        self.assertIsNone(run.wall_time)
+        self.assertNotEqual(Network.from_uuid(id)['fingerprint'], None)
+        self.assertEqual(n['fingerprint'], Network.from_uuid(id)['fingerprint'])
+
+    def testReuseCurrent(self):
+        '''Test results are only re-used from a network with current runs.'''
+        (s, ns) = self.reusing()
+        g = fast_gnp_random_graph(50, 0.1)
+        self.network(g)
+
+        # an updated analyser can't re-use the first network's results
+        s.VERSION = 2
+        self.network(relabel_nodes(g, {v: v + 1000 for v in g}))
+        self.assertEqual(s.runs, 2)
+
+        # but can re-use those of the second, even though the first matches too
+        self.network(relabel_nodes(g, {v: v + 2000 for v in g}))
+        self.assertEqual(s.runs, 2)
+
+    def testNoReuse(self):
+        '''Test results aren't re-used between different networks.'''
+        (s, ns) = self.reusing()
+        self.network(fast_gnp_random_graph(50, 0.1))
+        self.network(fast_gnp_random_graph(60, 0.1))
+        self.assertEqual(s.runs, 2)
+
+
+class TestSandboxedAnalysis(ArchiveTestCase):
+    '''Test running analysers in a sandbox.'''
+
+    SANDBOX = True
+
+    def testFailure(self):
+        '''Test a failing analyser is reported, keeping earlier results.'''
+        for a in [Counting('a'), Failing()]:
+            analyser.register_analyser(a)
+        id = self.network(fast_gnp_random_graph(50, 0.1))
+        n = Network.from_uuid(id)
+        self.assertIn('ValueError: analysis failed', n.analysis_error)
+        self.assertEqual(n['a-nodes'], '50')
+        self.assertCountEqual([r.analyser for r in n.analyses], ['a', AnalyserChain.LOAD])
+
+    def testExpired(self):
+        '''Test we can analyse a network whose record has expired.'''
+        analyser.register_analyser(Counting('a'))
+        id = self.network(fast_gnp_random_graph(50, 0.1), analyse=False)
+        n = Network.from_uuid(id)
+        db.session.expire(n)
+        self.assertTrue(analyser.analyse(n))
+        db.session.commit()
+        self.assertEqual(Network.from_uuid(id)['a-nodes'], '50')
+
+    def testReseed(self):
+        '''Test sampled analysers don't repeat their random numbers between runs.'''
+        analyser.register_analyser(Sampling())
+        ids = [self.network(fast_gnp_random_graph(50, 0.1)) for _ in range(3)]
+        rs = set([Network.from_uuid(id)['random'] for id in ids])
+        self.assertEqual(len(rs), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
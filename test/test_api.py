@@ -17,33 +17,15 @@
 # You should have received a copy of the GNU General Public License
 # along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
 
-import os
-from tempfile import NamedTemporaryFile, mkdtemp
+import requests
+from tempfile import mkdtemp
 from unittest import makeSuite, TextTestRunner
-from networkx import fast_gnp_random_graph, write_adjlist
+from networkx import fast_gnp_random_graph
 from flask_unittest import LiveTestCase, LiveTestSuite
 from epydemicarchive import create, Config, db
 from epydemicarchive.api.v1.client import Archive
 from epydemicarchive.auth.models import User
-from epydemicarchive.archive.models import Network
-
-
-class MockFileUpload:
-    '''A mock-up of the Flask file upload object, requiring a save() method.'''
-
-    CHUNKSIZE = 4096
-
-    def __init__(self, filename):
-        self._fn = filename
-
-    def save(self, filename):
-        with open(filename, 'wb') as wh:
-            with open(self._fn, 'rb') as rh:
-                while True:
-                    chunk = rh.read(self.CHUNKSIZE)
-                    if len(chunk) == 0:
-                        break
-                    wh.write(chunk)
+from helpers import upload
 
 
 class TestAPI(LiveTestCase):
@@ -80,23 +62,82 @@ class TestAPI(LiveTestCase):
         self.assertCountEqual(info['tags'], ['test', 'er'])
         self.assertCountEqual(info['metadata'], {})   # no analyser chain to fill in metadata
 
+    def testFacets(self):
+        '''Test we can count the networks matching a query.'''
+        fs = self._archive.facets(tags=['test'])
+        self.assertEqual(fs['count'], 1)
+        self.assertEqual(fs['tags'], {'test': 1, 'er': 1})
+        fs = self._archive.facets(tags=['nonexistent'])
+        self.assertEqual(fs['count'], 0)
+        self.assertEqual(fs['tags'], {})
+        fs = self._archive.facets(text='test network')
+        self.assertEqual(fs['count'], 1)
+        fs = self._archive.facets(text='nonexistent', tags=['test'])
+        self.assertEqual(fs['count'], 0)
+
+    def testFind(self):
+        '''Test we can find networks by their titles and descriptions.'''
+        res = self._archive.find(text='test network')
+        self.assertEqual(res['total'], 1)
+        self.assertEqual(res['networks'][0]['uuid'], self.uuid)
+        res = self._archive.find(text='nonexistent')
+        self.assertEqual(res['total'], 0)
+        self.assertEqual(res['networks'], [])
+
+    def testFindPageSize(self):
+        '''Test we can't ask for pages larger than the maximum.'''
+        res = self._archive.find(per_page=10 ** 9)
+        self.assertEqual(res['per_page'], self.app.config['SEARCH_MAX_PAGE_SIZE'])
+        res = self._archive.find(per_page=1)
+        self.assertEqual(res['per_page'], 1)
+        self.assertEqual(len(res['networks']), 1)
+
+    def assertSameNetwork(self, g, h):
+        '''Assert that two networks are the same, with nodes identified by
+        their labels as strings.
+
+        :param g: the expected network
+        :param h: the network retrieved from the archive'''
+        self.assertCountEqual([str(v) for v in g.nodes()], h.nodes())
+        self.assertCountEqual([frozenset((str(u), str(v))) for (u, v) in g.edges()],
+                              [frozenset(e) for e in h.edges()])
+
     def testRaw(self):
-        '''Test we can get the same network back.'''
-        gprime = self._archive.raw(self.uuid)
-        self.assertEqual(self.g.order(), gprime.order())
-        # need more checks
+        '''Test we can get the same network back, whatever compression
+        it's stored with.'''
+        for c in ['zst', 'gz']:
+            compression = self.app.config['STORAGE_COMPRESSION']
+            self.app.config['STORAGE_COMPRESSION'] = c
+            try:
+                uuid = self._archive.submit(self.g, title=f'A {c} network', tags=['er'])
+            finally:
+                self.app.config['STORAGE_COMPRESSION'] = compression
+            self.assertSameNetwork(self.g, self._archive.raw(uuid))
 
     def testSubmit(self):
         '''Test we can submit and retrieve a network.'''
         h = fast_gnp_random_graph(500, 0.02)
         uuid = self._archive.submit(h, title='Another network', tags=['er'])
-        hprime = self._archive.raw(uuid)
-        self.assertEqual(h.order(), hprime.order())
+        self.assertSameNetwork(h, self._archive.raw(uuid))
         info = self._archive.info(uuid)
         self.assertEqual(info['title'], 'Another network')
         self.assertEqual(info['description'], '')
         self.assertCountEqual(info['tags'], ['er'])
 
+    def testSubmitMalformed(self):
+        '''Test we're told about networks that can't be read or stored.'''
+        networks = self._archive.networks()
+        for (filename, data) in [('network.gml', b'graph [ node [ id 1 ] edge [ source 1 '),
+                                 ('network.mtx', b'%%MatrixMarket matrix coordinate pattern general\n10000000000 10000000000 1\n1 2\n'),
+                                 ('network.txt', b'1 2\n')]:
+            r = requests.post(self._archive.endpoint('/network/submit'),
+                              headers=self._archive._headers,
+                              data=dict(filename=filename, tags='test'),
+                              files=dict(raw=(filename, data)))
+            self.assertEqual(r.status_code, 400)
+            self.assertIn('message', r.json())
+        self.assertCountEqual(self._archive.networks(), networks)
+
 
 if __name__ == '__main__':
     # configure for transient in-memory database and archive
@@ -105,6 +146,7 @@ if __name__ == '__main__':
     Config.HOST = 'localhost'
     Config.PORT = 5050
     app = create(Config)
+    TestAPI.app = app
 
     # set up a simple test database
     with app.app_context():
@@ -118,28 +160,9 @@ if __name__ == '__main__':
         db.session.add(u)
 
         # add a network
-        filename = None
-        try:
-            # create a temporary file to take the graph
-            with NamedTemporaryFile(suffix='.al', delete=False) as tf:
-                filename = tf.name
-
-            # create the network
-            TestAPI.g = fast_gnp_random_graph(200, 0.01)
-            write_adjlist(TestAPI.g, filename)
-
-            # create the network
-            n = Network.create_network(u,
-                                       filename,
-                                       MockFileUpload(filename),
-                                       'A test network',
-                                       'A network',
-                                       ['test', 'er'])
-            TestAPI.uuid = n.id
-            db.session.add(n)
-        finally:
-            if filename is not None:
-                os.remove(filename)
+        TestAPI.g = fast_gnp_random_graph(200, 0.01)
+        n = upload(u, TestAPI.g, 'A test network', 'A network', ['test', 'er'])
+        TestAPI.uuid = n.id
 
         # commit the database
         db.session.commit()
@@ -0,0 +1,152 @@
+# Tests of the cache of network variants
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import time
+import unittest
+from threading import Thread
+from tempfile import mkdtemp
+from networkx import fast_gnp_random_graph
+from epydemicarchive import create, Config, db
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.cache import VariantCache
+from epydemicarchive.archive import formats
+from helpers import upload
+
+
+class TestVariantCache(unittest.TestCase):
+    '''Test generating, evicting, and invalidating variants.'''
+
+    def setUp(self):
+        '''Create an archive holding a network, and an empty cache.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        self.app = create(Config)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+
+        self.g = fast_gnp_random_graph(100, 0.05, seed=1)
+        self.n = upload(user, self.g)
+        db.session.commit()
+
+        self.dir = os.path.join(Config.ARCHIVE_DIR, 'variants')
+        self.cache = VariantCache(self.dir, 1024 * 1024)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def entry(self, name, size, age):
+        '''Create a cache entry of a given size and age.
+
+        :param name: the entry's filename within the cache
+        :param size: the size in bytes
+        :param age: the time since it was last used in seconds
+        :returns: the entry's filename'''
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'wb') as fh:
+            fh.write(b'x' * size)
+        t = time.time() - age
+        os.utime(filename, (t, t))
+        return filename
+
+    def testVariant(self):
+        '''Test we generate a variant once and then re-use it.'''
+        filename = self.cache.variant(self.n, 'graphml.gz')
+        self.assertEqual(filename, self.cache.filename(self.n, 'graphml.gz'))
+        self.assertCountEqual([str(v) for v in self.g.nodes()],
+                              formats.load(filename, 'graphml.gz').nodes())
+        ino = os.stat(filename).st_ino
+        self.assertEqual(self.cache.variant(self.n, 'graphml.gz'), filename)
+        self.assertEqual(os.stat(filename).st_ino, ino)
+        self.assertEqual(os.listdir(self.dir), [os.path.basename(filename)])
+
+    def testConcurrentVariants(self):
+        '''Test that threads generating the same variant at once
+        don't interfere.'''
+        errors = []
+
+        def generate():
+            try:
+                self.cache.variant(self.n, 'el')
+            except Exception as e:
+                errors.append(e)
+
+        # sd: each thread needs the app context to read the network
+        def run():
+            with self.app.app_context():
+                generate()
+
+        ts = [Thread(target=run) for _ in range(8)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.dir), [f'{self.n.id}.el'])
+        self.assertEqual(formats.load(self.cache.filename(self.n, 'el'), 'el').number_of_edges(),
+                         self.g.number_of_edges())
+
+    def testEvict(self):
+        '''Test we evict the least-recently-used entries first.'''
+        os.makedirs(self.dir)
+        cache = VariantCache(self.dir, 250)
+        old = self.entry('a.el', 100, 300)
+        middle = self.entry('b.el', 100, 200)
+        new = self.entry('c.el', 100, 100)
+        cache.evict()
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(middle))
+        self.assertTrue(os.path.exists(new))
+
+    def testEvictKeep(self):
+        '''Test we never evict the entry being kept, or partial entries.'''
+        os.makedirs(self.dir)
+        cache = VariantCache(self.dir, 150)
+        old = self.entry('a.el', 100, 300)
+        middle = self.entry('b.el', 100, 200)
+        partial = self.entry('tmp1234.tmp', 100, 400)
+        cache.evict(keep=old)
+        self.assertTrue(os.path.exists(old))
+        self.assertFalse(os.path.exists(middle))
+        self.assertTrue(os.path.exists(partial))
+
+    def testEvictOnVariant(self):
+        '''Test that generating a variant evicts older entries to make room.'''
+        os.makedirs(self.dir)
+        old = self.entry('a.el', 1024 * 1024, 100)
+        filename = self.cache.variant(self.n, 'el')
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(filename))
+
+    def testInvalidate(self):
+        '''Test we remove all the variants of a network.'''
+        for ext in ['el', 'graphml']:
+            self.cache.variant(self.n, ext)
+        other = self.entry('other.el', 10, 0)
+        self.cache.invalidate(self.n.id)
+        self.assertEqual(os.listdir(self.dir), [os.path.basename(other)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Test the client's import footprint
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+
+class TestClientImport(unittest.TestCase):
+    '''Check that importing the client is fast, by not importing the
+    server or any of the heavy libraries used by only some methods.
+    Imports are measured in a fresh interpreter, since they're cached.'''
+
+    CLIENT = 'epydemicarchive.api.v1.client'                  #: The client package.
+    HEAVY = ['flask', 'sqlalchemy', 'numpy', 'scipy', 'networkx',
+             'requests', 'requests_toolbelt']                  #: Modules the client shouldn't import.
+    BUDGET = 0.1                                               #: Maximum import time in seconds.
+
+    def python(self, *args):
+        '''Run a Python interpreter from the root of the source tree.
+
+        :param args: the interpreter's arguments
+        :returns: the completed process'''
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run([sys.executable, *args], cwd=root,
+                              capture_output=True, text=True, check=True)
+
+    def testModules(self):
+        '''Test the client doesn't import any heavy modules.'''
+        rc = self.python('-c', f'import sys, json, {self.CLIENT}; print(json.dumps(list(sys.modules.keys())))')
+        modules = set(json.loads(rc.stdout))
+        self.assertCountEqual([m for m in self.HEAVY if m in modules], [])
+
+    def testImportTime(self):
+        '''Test the client imports within the time budget.'''
+        rc = self.python('-c', f'import time; t = time.perf_counter(); import {self.CLIENT}; print(time.perf_counter() - t)')
+        t = float(rc.stdout)
+        self.assertLess(t, self.BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# Tests of degree distribution classification
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from numpy import arange
+from networkx import fast_gnp_random_graph, random_regular_graph, barabasi_albert_graph, empty_graph
+from epydemicarchive.metadata.classifier import DegreeDistributionClassifier
+from epydemicarchive.metadata.regular import Regular
+from epydemicarchive.metadata.er import ER
+from epydemicarchive.metadata.geometric import Geometric
+from epydemicarchive.metadata.exponential import Exponential
+from epydemicarchive.metadata.powerlaw import PowerLawCutoff
+
+
+class TestDegreeDistribution(unittest.TestCase):
+    '''Test the classification of networks with known degree distributions.
+    The tests are statistical, and so use fixed seeds.'''
+
+    def setUp(self):
+        '''Create a classifier with the same candidates as the archive uses.'''
+        self.classifier = DegreeDistributionClassifier(['epydemicarchive.metadata.regular:Regular',
+                                                        'epydemicarchive.metadata.er:ER',
+                                                        'epydemicarchive.metadata.geometric:Geometric',
+                                                        'epydemicarchive.metadata.exponential:Exponential',
+                                                        'epydemicarchive.metadata.powerlaw:PowerLawCutoff'])
+
+    def classify(self, g):
+        '''Classify a network.
+
+        :param g: the network
+        :returns: the name of the distribution, or None'''
+        return self.classifier.do(None, g).get('degree-distribution')
+
+    def testRegular(self):
+        '''Test we classify regular networks.'''
+        for k in [2, 4, 10]:
+            self.assertEqual(self.classify(random_regular_graph(k, 1000, seed=1)), 'regular')
+
+    def testER(self):
+        '''Test we classify ER networks.'''
+        for kmean in [2, 5, 10]:
+            self.assertEqual(self.classify(fast_gnp_random_graph(2000, kmean / 2000, seed=1)), 'ER')
+
+    def testBA(self):
+        '''Test we classify BA networks, which have no nodes with degree less than m.'''
+        for m in [2, 3, 5]:
+            self.assertEqual(self.classify(barabasi_albert_graph(5000, m, seed=1)), 'powerlaw-cutoff')
+
+    def testPowerLawFit(self):
+        '''Test the fitted exponent of a BA network, which should be about 3
+        (and rather less when fitted with a cutoff).'''
+        g = barabasi_albert_graph(5000, 3, seed=1)
+        pl = PowerLawCutoff()
+        hist = pl.histogram(g)
+        (alpha, lam) = pl.fit(arange(len(hist)), hist, 3)
+        self.assertGreater(alpha, 2)
+        self.assertLess(alpha, 3.5)
+
+    def testEmpty(self):
+        '''Test a network with no nodes isn't classified, and one with no
+        edges is (trivially) regular.'''
+        self.assertIsNone(self.classify(empty_graph(0)))
+        self.assertEqual(self.classify(empty_graph(100)), 'regular')
+        self.assertEqual(PowerLawCutoff().do(None, empty_graph(100)), dict())
+
+    def testCandidates(self):
+        '''Test each candidate can also be run as an analyser in its own right.'''
+        g = fast_gnp_random_graph(2000, 5 / 2000, seed=1)
+        self.assertEqual(ER().do(None, g), {'degree-distribution': 'ER'})
+        self.assertEqual(Regular().do(None, g), dict())
+        self.assertEqual(Geometric().do(None, g), dict())
+        self.assertEqual(Exponential().do(None, g), dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
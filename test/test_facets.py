@@ -0,0 +1,184 @@
+# Tests of search facets
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from threading import Thread
+from tempfile import mkdtemp
+from networkx import empty_graph
+from epydemicarchive import create, Config, db
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import NetworkSummary, Metadata
+from epydemicarchive.archive.queries import QueryNetworks
+from epydemicarchive.archive.facets import Facets, FacetCache
+from helpers import upload
+
+
+class FacetsTestCase(unittest.TestCase):
+    '''Base class for tests against an archive of networks with
+    given core metadata.'''
+
+    def setUp(self):
+        '''Create an empty archive with a user.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        self.app = create(Config)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def network(self, tags=['test'], **kvs):
+        '''Add a network with the given metadata.
+
+        :param tags: (optional) the network's tags
+        :param kvs: the metadata'''
+        n = upload(self.user, empty_graph(1), tags=tags)
+        for (k, v) in kvs.items():
+            db.session.add(Metadata(network=n, analyser='test', key=k, value=str(v)))
+        NetworkSummary.refresh(n)
+        db.session.commit()
+
+
+class TestFacets(FacetsTestCase):
+    '''Test computing facets.'''
+
+    def histogram(self, k, tags=[]):
+        '''Return the histogram of a metadata key.
+
+        :param k: the key
+        :param tags: (optional) tags to query for
+        :returns: a list of (low, high, count) triples'''
+        fs = Facets(QueryNetworks(tags, [])).compute()
+        return [(b['low'], b['high'], b['count']) for b in fs['metadata'][k]]
+
+    def testTags(self):
+        '''Test we count the networks carrying each tag.'''
+        self.network(tags=['a', 'b'])
+        self.network(tags=['a'])
+        self.network(tags=['c'])
+        fs = Facets(QueryNetworks(['a'], [])).compute()
+        self.assertEqual(fs['count'], 2)
+        self.assertEqual(fs['tags'], {'a': 2, 'b': 1})
+
+    def testFloatEdges(self):
+        '''Test floats just either side of a bin's edges fall into the
+        right bins, and the largest into the last bin.'''
+        for v in [0.0, 0.999, 1.0, 1.001, 4.5, 8.999, 9.0, 9.999, 10.0]:
+            self.network(kmean=v)
+        self.assertEqual(self.histogram('kmean'), [(0.0, 1.0, 2),
+                                                   (1.0, 2.0, 2),
+                                                   (4.0, 5.0, 1),
+                                                   (8.0, 9.0, 1),
+                                                   (9.0, 10.0, 3)])
+
+    def testFloor(self):
+        '''Test bins are found by truncation rather than by rounding
+        on databases whose casts round.'''
+        from sqlalchemy.dialects import postgresql
+        e = Facets(QueryNetworks([], [])).bin(NetworkSummary.kmean, 0.0, 1.0, 'postgresql')
+        self.assertIn('floor(', str(e.compile(dialect=postgresql.dialect())))
+
+    def testIntEdges(self):
+        '''Test integers fall into bins including both their bounds.'''
+        for v in [0, 1, 2, 3, 19, 20]:
+            self.network(N=v)
+        self.assertEqual(self.histogram('N'), [(0, 2, 3),
+                                               (3, 5, 1),
+                                               (18, 20, 2)])
+
+    def testSingleValue(self):
+        '''Test a histogram of a single value has a single bin.'''
+        for _ in range(3):
+            self.network(kmean=2.5, N=10)
+        self.assertEqual(self.histogram('kmean'), [(2.5, 2.5, 3)])
+        self.assertEqual(self.histogram('N'), [(10, 10, 3)])
+
+    def testMissing(self):
+        '''Test networks without a value aren't counted in its histogram.'''
+        self.network(N=10)
+        self.network()
+        self.assertEqual(self.histogram('N'), [(10, 10, 1)])
+        self.assertNotIn('kmean', Facets(QueryNetworks([], [])).compute()['metadata'])
+
+
+class TestFacetCache(FacetsTestCase):
+    '''Test caching facets.'''
+
+    def testCached(self):
+        '''Test facets are cached until a summary changes.'''
+        cache = FacetCache(10, 60)
+        self.network(N=10)
+        qn = QueryNetworks(['test'], [])
+        fs = cache.facets(qn)
+        self.assertEqual(fs['count'], 1)
+        self.assertIs(cache.facets(QueryNetworks(['test'], [])), fs)
+        self.network(N=20)
+        self.assertEqual(cache.facets(qn)['count'], 2)
+
+    def testExpiry(self):
+        '''Test entries expire.'''
+        cache = FacetCache(10, 0)
+        qn = QueryNetworks([], [])
+        self.assertIsNot(cache.facets(qn), cache.facets(qn))
+
+    def testSize(self):
+        '''Test the least-recently-used entries are evicted.'''
+        cache = FacetCache(2, 60)
+        (a, b, c) = [QueryNetworks([t], []) for t in ['a', 'b', 'c']]
+        fa = cache.facets(a)
+        cache.facets(b)
+        cache.facets(a)
+        cache.facets(c)
+        self.assertIs(cache.facets(a), fa)
+        self.assertEqual(len(cache._cache), 2)
+        self.assertNotIn(cache.key(b), cache._cache)
+
+    def testThreads(self):
+        '''Test the cache can be shared between threads.'''
+        for i in range(5):
+            self.network(tags=[f't{i}'], N=i)
+        cache = FacetCache(3, 60)
+        errors = []
+
+        def run(i):
+            try:
+                with self.app.app_context():
+                    for j in range(50):
+                        t = f't{(i + j) % 5}'
+                        self.assertEqual(cache.facets(QueryNetworks([t], []))['tags'], {t: 1})
+            except Exception as e:
+                errors.append(e)
+
+        ts = [Thread(target=run, args=(i, )) for i in range(8)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache._cache), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
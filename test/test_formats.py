@@ -0,0 +1,228 @@
+# Tests of network file formats
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import io
+import os
+import unittest
+from tempfile import mkdtemp
+from shutil import rmtree
+from networkx import Graph, fast_gnp_random_graph, write_adjlist, write_edgelist, write_graphml, write_gml
+from epydemicarchive.archive import formats
+
+
+class TestFormats(unittest.TestCase):
+    '''Test reading networks in the formats accepted for upload, and
+    converting them to the archive's storage format.'''
+
+    def setUp(self):
+        self.dir = mkdtemp()
+        self.g = fast_gnp_random_graph(100, 0.05, seed=1)
+        self.g.add_nodes_from([100, 101])       # isolated nodes
+
+    def tearDown(self):
+        rmtree(self.dir)
+
+    def filename(self, ext):
+        '''Return a filename in the test directory.
+
+        :param ext: the extension
+        :returns: the filename'''
+        return os.path.join(self.dir, f'network.{ext}')
+
+    def assertSameNetwork(self, g, h):
+        '''Assert that two networks are the same, with nodes identified by
+        their labels as strings.
+
+        :param g: the expected network
+        :param h: the network read from a file'''
+        self.assertCountEqual([str(v) for v in g.nodes()], h.nodes())
+        self.assertCountEqual([frozenset((str(u), str(v))) for (u, v) in g.edges()],
+                              [frozenset(e) for e in h.edges()])
+
+    def load(self, text, ext):
+        '''Load a network from the text of a file.
+
+        :param text: the text
+        :param ext: the extension
+        :returns: the network'''
+        return formats.load(io.BytesIO(text.encode('utf-8')), ext)
+
+    def testAdjacencyList(self):
+        '''Test we read adjacency lists.'''
+        fn = self.filename('al')
+        write_adjlist(self.g, fn)
+        self.assertSameNetwork(self.g, formats.load(fn, 'al'))
+
+    def testEdgeList(self):
+        '''Test we read edge lists, ignoring any edge data.'''
+        fn = self.filename('el')
+        g = self.g.copy()
+        g.remove_nodes_from([100, 101])
+        write_edgelist(g, fn, data=True)
+        self.assertSameNetwork(g, formats.load(fn, 'el'))
+
+    def testGraphML(self):
+        '''Test we read GraphML.'''
+        fn = self.filename('graphml')
+        write_graphml(self.g, fn)
+        self.assertSameNetwork(self.g, formats.load(fn, 'graphml'))
+
+    def testGML(self):
+        '''Test we read GML, identifying nodes by their ids.'''
+        fn = self.filename('gml')
+        g = Graph()
+        g.add_nodes_from(self.g.nodes(), label='x')
+        g.add_edges_from(self.g.edges(), weight=1.5)
+        write_gml(g, fn, stringizer=str)
+        self.assertSameNetwork(self.g, formats.load(fn, 'gml'))
+
+    def testMatrixMarket(self):
+        '''Test we read Matrix Market files, including nodes without entries.'''
+        h = self.load('%%MatrixMarket matrix coordinate pattern symmetric\n'
+                      '% a comment\n'
+                      '5 5 3\n'
+                      '2 1\n'
+                      '3 2\n'
+                      '03 1\n', 'mtx')
+        self.assertCountEqual(h.nodes(), ['1', '2', '3', '4', '5'])
+        self.assertCountEqual([frozenset(e) for e in h.edges()],
+                              [frozenset(e) for e in [('1', '2'), ('2', '3'), ('1', '3')]])
+
+    def testCompressed(self):
+        '''Test we read compressed files.'''
+        src = self.filename('al')
+        write_adjlist(self.g, src)
+        with open(src, 'rb') as fh:
+            bs = fh.read()
+        for c in ['gz', 'bz2', 'xz', 'zst']:
+            fn = self.filename(f'al.{c}')
+            with formats.open_compressed(fn, c, 'wb') as fh:
+                fh.write(bs)
+            self.assertSameNetwork(self.g, formats.load(fn, f'al.{c}'))
+
+    def testConvert(self):
+        '''Test we convert files to the storage format.'''
+        src = self.filename('graphml')
+        write_graphml(self.g, src)
+        for c in ['gz', 'zst']:
+            out = self.filename(f'al.{c}')
+            formats.convert(src, 'graphml', out, compression=c)
+            self.assertSameNetwork(self.g, formats.load(out, f'al.{c}'))
+
+    def testWrite(self):
+        '''Test we write every writable format, and read back the same network.'''
+        src = self.filename('al')
+        write_adjlist(self.g, src)
+        for ext in ['al', 'el', 'graphml', 'csr']:
+            self.assertTrue(formats.FORMATS[ext].writable())
+            for c in [None, 'gz', 'zst']:
+                outext = ext if c is None else f'{ext}.{c}'
+                out = self.filename(f'out.{outext}')
+                formats.write(src, 'al', out, outext)
+                self.assertSameNetwork(self.g, formats.load(out, outext))
+
+    def testCSR(self):
+        '''Test we write CSR files that numpy can read directly, with
+        each edge in both directions and self-loops once.'''
+        from numpy import load as load_npz
+        src = self.filename('el')
+        with open(src, 'w') as fh:
+            fh.write('a b\nb c\nc c\nd\n')
+        out = self.filename('csr')
+        formats.write(src, 'el', out, 'csr')
+        with open(out, 'rb') as fh:
+            arrays = load_npz(fh, allow_pickle=False)
+            self.assertEqual(list(arrays['labels']), ['a', 'b', 'c', 'd'])
+            self.assertEqual(list(arrays['indptr']), [0, 1, 3, 5, 5])
+            self.assertEqual(sorted(arrays['indices'][1:3]), [0, 2])
+            self.assertEqual(sorted(arrays['indices'][3:5]), [1, 2])
+        self.assertCountEqual(formats.items(out, 'csr'),
+                              [('a', 'b'), ('b', 'c'), ('c', 'c'), ('d', )])
+
+    def testUnwritable(self):
+        '''Test we don't claim to write formats we only read.'''
+        for ext in ['gml', 'mtx']:
+            self.assertFalse(formats.FORMATS[ext].writable())
+
+    def testExtensions(self):
+        '''Test we recognise the extensions of formats and compressions.'''
+        p = formats.extensions_pattern()
+        self.assertEqual(p.match('a.network.graphml.gz')[1], 'graphml.gz')
+        self.assertEqual(p.match('network.mtx')[1], 'mtx')
+        self.assertIsNone(p.match('network.txt'))
+        self.assertEqual(formats.split_extension('al.zst'), ('al', 'zst'))
+        self.assertEqual(formats.split_extension('gml'), ('gml', None))
+
+    def testUnstorableLabel(self):
+        '''Test we reject labels that can't be stored.'''
+        with self.assertRaises(Exception):
+            self.load('<graphml><graph><node id="a b"/></graph></graphml>', 'graphml')
+
+    def testGraphMLWithoutId(self):
+        '''Test we reject GraphML nodes and edges without ids.'''
+        with self.assertRaisesRegex(Exception, 'without a label'):
+            self.load('<graphml><graph><node/></graph></graphml>', 'graphml')
+        with self.assertRaisesRegex(Exception, 'without a label'):
+            self.load('<graphml><graph><node id="a"/><edge source="a"/></graph></graphml>', 'graphml')
+
+    def testGMLWithoutId(self):
+        '''Test we reject GML nodes without ids.'''
+        with self.assertRaisesRegex(Exception, 'without a label'):
+            self.load('graph [ node [ label "a" ] ]', 'gml')
+
+    def testMalformedGML(self):
+        '''Test we reject truncated GML.'''
+        with self.assertRaises(Exception):
+            self.load('graph [ node [ id 1 ] node [ id "2', 'gml')
+        with self.assertRaisesRegex(Exception, 'Truncated'):
+            self.load('graph [ node [ id 1 ] edge [ source 1 ', 'gml')
+        with self.assertRaisesRegex(Exception, 'Unbalanced'):
+            self.load('graph [ node [ id 1 ] ] ]', 'gml')
+
+    def testMatrixMarketOutOfRange(self):
+        '''Test we reject Matrix Market entries outside the matrix.'''
+        for entry in ['6 1', '0 1', '-1 2']:
+            with self.assertRaisesRegex(Exception, 'outside'):
+                self.load(f'%%MatrixMarket matrix coordinate pattern general\n5 5 1\n{entry}\n', 'mtx')
+
+    def testMatrixMarketTooLarge(self):
+        '''Test we reject Matrix Market files claiming to be too large,
+        before reading their entries.'''
+        with self.assertRaisesRegex(Exception, 'allowed'):
+            self.load('%%MatrixMarket matrix coordinate pattern general\n10000000000 10000000000 1\n1 2\n', 'mtx')
+        formats.set_max_matrix_size(5)
+        try:
+            self.assertEqual(self.load('%%MatrixMarket matrix coordinate pattern general\n5 5 1\n1 2\n', 'mtx').order(), 5)
+            with self.assertRaisesRegex(Exception, 'allowed'):
+                self.load('%%MatrixMarket matrix coordinate pattern general\n6 6 1\n1 2\n', 'mtx')
+        finally:
+            formats.set_max_matrix_size(formats.MAX_MATRIX_SIZE)
+
+    def testMatrixMarketMalformed(self):
+        '''Test we reject malformed Matrix Market files.'''
+        with self.assertRaisesRegex(Exception, 'coordinate'):
+            self.load('%%MatrixMarket matrix array real general\n2 2\n1.0\n', 'mtx')
+        with self.assertRaisesRegex(Exception, 'no size'):
+            self.load('%%MatrixMarket matrix coordinate pattern general\n% nothing\n', 'mtx')
+        with self.assertRaisesRegex(Exception, 'integer'):
+            self.load('%%MatrixMarket matrix coordinate pattern general\n5 5 1\n1 x\n', 'mtx')
+
+
+if __name__ == '__main__':
+    unittest.main()
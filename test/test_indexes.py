@@ -0,0 +1,110 @@
+# Test that the common queries are served by indices
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from tempfile import mkdtemp
+from sqlalchemy import text
+from epydemicarchive import create, Config, db
+from epydemicarchive.archive.models import Network, Metadata
+from epydemicarchive.archive.queries import QueryNetworks
+
+
+class TestIndexes(unittest.TestCase):
+    '''Check the query plans of the queries on the hot paths, to catch
+    changes to the models or queries that lose the use of an index.
+    These use SQLite's query planner against an empty database.'''
+
+    @classmethod
+    def setUpClass(cls):
+        '''Create an empty in-memory database.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        cls.app = create(Config)
+        cls.context = cls.app.app_context()
+        cls.context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.context.pop()
+
+    def plan(self, q):
+        '''Return the query plan for a query.
+
+        :param q: the query
+        :returns: a list of plan steps'''
+        stmt = getattr(q, 'statement', q)
+        sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        return [r[-1] for r in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+    def assertIndexed(self, q):
+        '''Assert that every table a query touches is accessed through an
+        index, and that no sorting is needed.
+
+        :param q: the query'''
+        steps = self.plan(q)
+        for step in steps:
+            if step.startswith(('SCAN', 'SEARCH')):
+                self.assertRegex(step, 'INDEX|PRIMARY KEY', f'Unindexed step in {steps}')
+            self.assertNotIn('TEMP B-TREE FOR ORDER BY', step, f'Unindexed sort in {steps}')
+            self.assertNotIn('TEMP B-TREE FOR RIGHT PART OF ORDER BY', step, f'Unindexed sort in {steps}')
+
+    def testNetwork(self):
+        '''Test we retrieve networks by id.'''
+        self.assertIndexed(Network.query.filter_by(id='x'))
+
+    def testNetworkOwner(self):
+        '''Test we retrieve networks by owner.'''
+        self.assertIndexed(Network.query.filter_by(user_id=1))
+
+    def testMetadata(self):
+        '''Test we retrieve a network's metadata.'''
+        self.assertIndexed(Metadata.query.filter_by(network_id='x'))
+        self.assertIndexed(Metadata.query.filter_by(network_id='x', key='N'))
+
+    def testFingerprint(self):
+        '''Test we find networks by metadata value.'''
+        self.assertIndexed(Network.query.join(Network.metadata).filter(Metadata.key == 'fingerprint',
+                                                                       Metadata.value == 'x',
+                                                                       Network.id != 'x'))
+
+    def testTagged(self):
+        '''Test we find the networks with tags through the tag index.'''
+        qn = QueryNetworks(['er'], [])
+        self.assertIndexed(qn.query())
+        qn = QueryNetworks(['er', 'test'], [])
+        self.assertIndexed(qn.query())
+
+    def testListing(self):
+        '''Test we list networks in order.'''
+        qn = QueryNetworks([], [])
+        self.assertIndexed(qn.ranked().limit(25))
+
+    def testRange(self):
+        '''Test we select networks by core metadata.'''
+        qn = QueryNetworks([], [{'key': 'N', 'operator': 'between', 'low': 10, 'high': 100}])
+        self.assertIndexed(qn.query())
+        qn = QueryNetworks([], [{'key': 'kmean', 'operator': 'greaterthan', 'value': 2.5}])
+        self.assertIndexed(qn.query())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Tests of performance metrics
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from tempfile import mkdtemp
+from epydemicarchive import metrics
+from epydemicarchive.metrics import Counter, Histogram
+
+
+class TestMetrics(unittest.TestCase):
+    '''Test metrics and their Prometheus text exposition.'''
+
+    def testCounter(self):
+        '''Test counters accumulate and are exposed with their help and type.'''
+        c = Counter('test_total', 'A test counter.')
+        self.assertEqual(c.exposition(), ['# HELP test_total A test counter.',
+                                          '# TYPE test_total counter'])
+        c.inc()
+        c.inc(4)
+        self.assertEqual(c.exposition()[2:], ['test_total 5'])
+
+    def testLabels(self):
+        '''Test labelled samples are exposed separately, in order.'''
+        c = Counter('test_total', 'A test counter.', ['format', 'status'])
+        c.inc(10, format='gml', status=200)
+        c.inc(5, format='al', status=200)
+        c.inc(format='gml', status=200)
+        c.inc(format='al')
+        self.assertEqual(c.exposition()[2:], ['test_total{format="al",status=""} 1',
+                                              'test_total{format="al",status="200"} 5',
+                                              'test_total{format="gml",status="200"} 11'])
+
+    def testLabelEscaping(self):
+        '''Test label values are escaped.'''
+        c = Counter('test_total', 'A test counter.', ['path'])
+        c.inc(path='a"b\\c\nd')
+        self.assertEqual(c.exposition()[2:], ['test_total{path="a\\"b\\\\c\\nd"} 1'])
+
+    def testHistogram(self):
+        '''Test histograms expose cumulative buckets, with observations on
+        a bucket's bound counted in that bucket.'''
+        h = Histogram('test_seconds', 'A test histogram.', ['endpoint'], buckets=[1, 2, 5])
+        for v in [0.5, 1, 1.5, 2, 10]:
+            h.observe(v, endpoint='x')
+        self.assertEqual(h.exposition(), ['# HELP test_seconds A test histogram.',
+                                          '# TYPE test_seconds histogram',
+                                          'test_seconds_bucket{endpoint="x",le="1"} 2',
+                                          'test_seconds_bucket{endpoint="x",le="2"} 4',
+                                          'test_seconds_bucket{endpoint="x",le="5"} 4',
+                                          'test_seconds_bucket{endpoint="x",le="+Inf"} 5',
+                                          'test_seconds_sum{endpoint="x"} 15.0',
+                                          'test_seconds_count{endpoint="x"} 5'])
+
+    def testHistogramUnlabelled(self):
+        '''Test unlabelled histograms only label their buckets.'''
+        h = Histogram('test_seconds', 'A test histogram.', buckets=[1])
+        h.observe(3)
+        self.assertEqual(h.exposition()[2:], ['test_seconds_bucket{le="1"} 0',
+                                              'test_seconds_bucket{le="+Inf"} 1',
+                                              'test_seconds_sum 3.0',
+                                              'test_seconds_count 1'])
+
+    def testExposition(self):
+        '''Test the exposition includes all the metrics.'''
+        text = metrics.exposition()
+        self.assertTrue(text.endswith('\n'))
+        for m in metrics.METRICS:
+            self.assertIn(f'# TYPE {m._name} {m.TYPE}\n', text)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    '''Test that requests are measured and the metrics served.'''
+
+    def create(self, enabled):
+        '''Create an application.
+
+        :param enabled: whether metrics are enabled
+        :returns: a test client'''
+        from epydemicarchive import create, Config
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        Config.METRICS_ENABLED = enabled
+        try:
+            return create(Config).test_client()
+        finally:
+            Config.METRICS_ENABLED = True
+
+    def count(self, text, sample):
+        '''Return the value of a sample in an exposition.
+
+        :param text: the exposition
+        :param sample: the sample's name and labels
+        :returns: the value, or 0 if the sample is missing'''
+        for line in text.splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.split()[-1])
+        return 0
+
+    def testRequests(self):
+        '''Test requests are counted by endpoint, method and status.'''
+        client = self.create(True)
+        sample = 'ea_request_duration_seconds_count{endpoint="auth.login",method="GET",status="200"}'
+        before = self.count(client.get('/metrics').get_data(as_text=True), sample)
+        self.assertEqual(client.get('/auth/login').status_code, 200)
+        rc = client.get('/metrics')
+        self.assertEqual(rc.status_code, 200)
+        self.assertTrue(rc.content_type.startswith('text/plain'))
+        self.assertEqual(self.count(rc.get_data(as_text=True), sample), before + 1)
+
+    def testDisabled(self):
+        '''Test there's no endpoint when metrics are disabled.'''
+        client = self.create(False)
+        self.assertEqual(client.get('/metrics').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# Tests of reconciling the store with the database
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import time
+import unittest
+from tempfile import mkdtemp
+from networkx import fast_gnp_random_graph
+from epydemicarchive import create, Config, db, storage
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import Network
+from epydemicarchive.archive.commands import reconcile
+from helpers import upload
+
+
+class TestReconcile(unittest.TestCase):
+    '''Test that reconciliation cleans up orphan and staged files
+    without touching the files of networks.'''
+
+    def setUp(self):
+        '''Create an archive holding some networks.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        self.app = create(Config)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+        self.backend = storage.backend()
+        self.ids = [self.network() for _ in range(3)]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def network(self):
+        '''Add a network to the archive.
+
+        :returns: the network's UUID'''
+        n = upload(self.user, fast_gnp_random_graph(20, 0.2))
+        db.session.commit()
+        return n.id
+
+    def store(self, key, age):
+        '''Store a file that doesn't belong to any network.
+
+        :param key: the file's key
+        :param age: the file's age in seconds
+        :returns: the key'''
+        with self.backend.open_write(key) as fh:
+            fh.write(b'1 2\n')
+        self.age(key, age)
+        return key
+
+    def age(self, key, age):
+        '''Set the age of a stored file.
+
+        :param key: the file's key
+        :param age: the age in seconds'''
+        t = time.time() - age
+        os.utime(self.backend.find(key), (t, t))
+
+    def reconcile(self, *args):
+        '''Run the reconcile command.
+
+        :param args: the command-line arguments
+        :returns: the command's output'''
+        rc = self.app.test_cli_runner().invoke(reconcile, list(args))
+        self.assertEqual(rc.exit_code, 0, rc.output)
+        return rc.output
+
+    def keys(self):
+        '''Return the keys of the networks' files.
+
+        :returns: a list of keys'''
+        return [Network.from_uuid(id).filename for id in self.ids]
+
+    def testNothingToDo(self):
+        '''Test we leave a consistent store alone.'''
+        out = self.reconcile()
+        self.assertIn('0 staged files completed, 0 of 0 orphan files deleted, 0 networks missing files', out)
+        for key in self.keys():
+            self.assertTrue(self.backend.exists(key))
+
+    def testOrphans(self):
+        '''Test we delete old orphan files and keep new ones.'''
+        old = self.store(self.backend.key('old', 'al.zst'), 48 * 60 * 60)
+        new = self.store(self.backend.key('new', 'al.zst'), 0)
+        out = self.reconcile()
+        self.assertIn('1 of 2 orphan files deleted', out)
+        self.assertFalse(self.backend.exists(old))
+        self.assertTrue(self.backend.exists(new))
+        for key in self.keys():
+            self.assertTrue(self.backend.exists(key))
+
+    def testGrace(self):
+        '''Test we respect the grace period given.'''
+        key = self.store(self.backend.key('orphan', 'al.zst'), 120)
+        self.reconcile('--grace', '300')
+        self.assertTrue(self.backend.exists(key))
+        self.reconcile('--grace', '60')
+        self.assertFalse(self.backend.exists(key))
+
+    def testDuplicates(self):
+        '''Test we delete copies of a network's file left under another
+        layout, but not the file itself.'''
+        key = self.keys()[0]
+        name = key.rsplit('/', 1)[-1]
+        copy = self.store(name, 48 * 60 * 60)
+        self.age(key, 48 * 60 * 60)
+        self.reconcile()
+        self.assertFalse(os.path.exists(self.backend.path(copy)))
+        self.assertTrue(os.path.exists(self.backend.path(key)))
+
+    def testStaged(self):
+        '''Test we complete networks whose staged file wasn't moved into place.'''
+        key = self.keys()[0]
+        self.backend.rename(key, f'{key}.staged')
+        self.age(f'{key}.staged', 48 * 60 * 60)
+        out = self.reconcile()
+        self.assertIn('1 staged files completed', out)
+        self.assertTrue(os.path.exists(self.backend.path(key)))
+        self.assertFalse(self.backend.exists(f'{key}.staged'))
+        Network.from_uuid(self.ids[0]).load_network()
+
+    def testMissing(self):
+        '''Test we report networks whose files are missing.'''
+        self.backend.delete(self.keys()[0])
+        out = self.reconcile()
+        self.assertIn('1 networks missing files', out)
+
+    def testDryRun(self):
+        '''Test a dry run changes nothing.'''
+        orphan = self.store(self.backend.key('orphan', 'al.zst'), 48 * 60 * 60)
+        key = self.keys()[0]
+        self.backend.rename(key, f'{key}.staged')
+        out = self.reconcile('--dry-run')
+        self.assertIn('1 staged files completed, 1 of 1 orphan files deleted', out)
+        self.assertTrue(self.backend.exists(orphan))
+        self.assertTrue(self.backend.exists(f'{key}.staged'))
+        self.assertFalse(os.path.exists(self.backend.path(key)))
+
+
+if __name__ == '__main__':
+    unittest.main()
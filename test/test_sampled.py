@@ -0,0 +1,100 @@
+# Tests of sampled analysers
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from networkx import (fast_gnp_random_graph, powerlaw_cluster_graph, barabasi_albert_graph,
+                      average_clustering, average_shortest_path_length,
+                      degree_assortativity_coefficient, empty_graph, compose)
+from epydemicarchive.metadata.clustering import Clustering
+from epydemicarchive.metadata.pathlengths import PathLengths
+from epydemicarchive.metadata.assortativity import Assortativity
+
+
+class TestSampled(unittest.TestCase):
+    '''Test the estimates of sampled analysers against the exact values
+    computed by networkx. Small networks are sampled exhaustively (by
+    asking for no error), and so should give the exact value; larger
+    ones should be within the estimated error. All use fixed seeds.'''
+
+    def assertEstimate(self, rc, key, exact, within=2):
+        '''Assert an estimate lies close to the exact value.
+
+        :param rc: the metadata
+        :param key: the key of the estimate
+        :param exact: the exact value
+        :param within: (optional) the multiple of the estimated error allowed (defaults to 2)'''
+        self.assertIn(key, rc)
+        self.assertLessEqual(abs(rc[key] - exact), within * rc[key + '-error'] + 1e-9)
+
+    def testClusteringExhaustive(self):
+        '''Test sampling every node gives the exact clustering coefficient.'''
+        g = powerlaw_cluster_graph(200, 3, 0.5, seed=1)
+        rc = Clustering(error=0, seed=1).do(None, g)
+        self.assertAlmostEqual(rc['clustering'], average_clustering(g))
+        self.assertAlmostEqual(rc['clustering-error'], 0)
+
+    def testClustering(self):
+        '''Test the estimated clustering coefficient.'''
+        g = powerlaw_cluster_graph(5000, 3, 0.5, seed=1)
+        rc = Clustering(error=0.01, budget=10, seed=1).do(None, g)
+        self.assertLessEqual(rc['clustering-error'], 0.01)
+        self.assertEstimate(rc, 'clustering', average_clustering(g))
+
+    def testPathLengthsExhaustive(self):
+        '''Test searching from every node gives the exact mean path length.'''
+        g = fast_gnp_random_graph(100, 0.1, seed=1)
+        rc = PathLengths(error=0, seed=1).do(None, g)
+        self.assertAlmostEqual(rc['pathlength'], average_shortest_path_length(g))
+
+    def testPathLengths(self):
+        '''Test the estimated mean path length.'''
+        g = fast_gnp_random_graph(2000, 0.005, seed=1)
+        rc = PathLengths(error=0.01, budget=10, seed=1).do(None, g)
+        self.assertLessEqual(rc['pathlength-error'], 0.01 * rc['pathlength'])
+        self.assertEstimate(rc, 'pathlength', average_shortest_path_length(g))
+
+    def testPathLengthsIsolated(self):
+        '''Test isolated nodes, which yield no samples, don't stop sampling.'''
+        g = fast_gnp_random_graph(2000, 0.005, seed=1)
+        exact = average_shortest_path_length(g)
+        g = compose(g, empty_graph(range(2000, 4000)))
+        for seed in range(5):
+            rc = PathLengths(error=0.01, budget=10, seed=seed).do(None, g)
+            self.assertLessEqual(rc['pathlength-error'], 0.01 * rc['pathlength'])
+            self.assertEstimate(rc, 'pathlength', exact)
+
+    def testPathLengthsAllIsolated(self):
+        '''Test a network with no edges has no mean path length.'''
+        rc = PathLengths(seed=1).do(None, empty_graph(500))
+        self.assertEqual(rc, dict())
+
+    def testAssortativity(self):
+        '''Test the estimated degree assortativity.'''
+        g = barabasi_albert_graph(5000, 3, seed=1)
+        rc = Assortativity(error=0.01, budget=10, seed=1).do(None, g)
+        self.assertLessEqual(rc['assortativity-error'], 0.01)
+        self.assertEstimate(rc, 'assortativity', degree_assortativity_coefficient(g))
+
+    def testAssortativityNoEdges(self):
+        '''Test a network with no edges has no assortativity.'''
+        self.assertEqual(Assortativity(seed=1).do(None, empty_graph(10)), dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
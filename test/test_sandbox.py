@@ -0,0 +1,96 @@
+# Tests of sandboxed analysis processes
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import signal
+import unittest
+from epydemicarchive.metadata.sandbox import Sandbox
+
+
+class TestSandbox(unittest.TestCase):
+    '''Test that functions run in a sandbox return their results, and that
+    failures and resource exhaustion are reported to the caller rather
+    than affecting it.'''
+
+    def testResult(self):
+        '''Test we get the function's result back.'''
+        self.assertEqual(Sandbox().run(lambda call: 42, dict()), 42)
+
+    def testSeparateProcess(self):
+        '''Test the function runs in another process.'''
+        self.assertNotEqual(Sandbox().run(lambda call: os.getpid(), dict()), os.getpid())
+
+    def testServices(self):
+        '''Test the function can call services in the caller, whose
+        results survive a later failure.'''
+        recorded = []
+
+        def f(call):
+            call('record', 1)
+            self.assertEqual(call('double', 2), 4)
+            call('record', 2)
+            raise ValueError('failed')
+
+        with self.assertRaises(Exception) as ex:
+            Sandbox().run(f, dict(record=recorded.append, double=lambda x: 2 * x))
+        self.assertIn('ValueError: failed', str(ex.exception))
+        self.assertEqual(recorded, [1, 2])
+
+    def testCrash(self):
+        '''Test we catch a process that dies without reporting back.'''
+        def f(call):
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        with self.assertRaises(Exception) as ex:
+            Sandbox().run(f, dict())
+        self.assertIn(f'killed by signal {int(signal.SIGKILL)}', str(ex.exception))
+
+    def testMemoryLimit(self):
+        '''Test we catch a process exceeding its memory limit.'''
+        def f(call):
+            return len(bytearray(512 * 1024 * 1024))
+
+        with self.assertRaises(Exception) as ex:
+            Sandbox(memory=256 * 1024 * 1024).run(f, dict())
+        self.assertIn('memory limit', str(ex.exception))
+
+    def testCPULimit(self):
+        '''Test we catch a process exceeding its CPU time limit.'''
+        def f(call):
+            while True:
+                pass
+
+        with self.assertRaises(Exception) as ex:
+            Sandbox(cpu=1).run(f, dict())
+        self.assertIn('CPU time limit of 1s', str(ex.exception))
+
+    def testInitialise(self):
+        '''Test the initialisation function is run in the sandbox, and
+        doesn't affect the caller.'''
+        state = dict(forked=False)
+
+        def initialise():
+            state['forked'] = True
+
+        self.assertTrue(Sandbox(initialise=initialise).run(lambda call: state['forked'], dict()))
+        self.assertFalse(state['forked'])
+
+
+if __name__ == '__main__':
+    unittest.main()
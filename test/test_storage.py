@@ -0,0 +1,270 @@
+# Tests of the storage backends
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import os
+import unittest
+from tempfile import mkdtemp
+from networkx import fast_gnp_random_graph
+from epydemicarchive import create, Config, db, storage
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import Network
+from epydemicarchive.storage import LocalStorage
+from helpers import upload
+
+# moto is optional, and the S3 tests are skipped without it
+try:
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+BUCKET = 'epydemicarchive-test'     #: The bucket used for testing S3.
+
+
+def start_aws():
+    '''Start imitating AWS, with fake credentials if there are none
+    (which boto3 needs even though no requests reach AWS).
+
+    :returns: the imitation, to be stopped when done'''
+    for (k, v) in [('AWS_ACCESS_KEY_ID', 'testing'), ('AWS_SECRET_ACCESS_KEY', 'testing'),
+                   ('AWS_DEFAULT_REGION', 'us-east-1')]:
+        os.environ.setdefault(k, v)
+    mock = mock_aws()
+    mock.start()
+    return mock
+
+
+class StorageTests:
+    '''Tests run against each backend, which is held in self.backend.'''
+
+    def put(self, key, bs):
+        '''Store a file.
+
+        :param key: the key
+        :param bs: the contents'''
+        with self.backend.open_write(key) as fh:
+            fh.write(bs)
+
+    def get(self, key):
+        '''Read a stored file.
+
+        :param key: the key
+        :returns: the contents'''
+        with self.backend.open_read(key) as fh:
+            return fh.read()
+
+    def testPutOpen(self):
+        '''Test we read back what we store.'''
+        key = self.backend.key('1234', 'al.gz')
+        self.assertFalse(self.backend.exists(key))
+        bs = os.urandom(100000)
+        self.put(key, bs)
+        self.assertTrue(self.backend.exists(key))
+        self.assertEqual(self.backend.size(key), len(bs))
+        self.assertEqual(self.get(key), bs)
+
+    def testPeek(self):
+        '''Test we can peek at a file without consuming it.'''
+        key = self.backend.key('1234', 'al')
+        self.put(key, b'1 2\n2 3\n')
+        with self.backend.open_read(key) as fh:
+            self.assertTrue(fh.peek(3).startswith(b'1 2'))
+            self.assertEqual(fh.read(), b'1 2\n2 3\n')
+
+    def testReplace(self):
+        '''Test writing a key replaces the file.'''
+        key = self.backend.key('1234', 'al')
+        self.put(key, b'old')
+        self.put(key, b'new')
+        self.assertEqual(self.get(key), b'new')
+
+    def testAbandon(self):
+        '''Test a write that fails leaves nothing stored.'''
+        key = self.backend.key('1234', 'al')
+        self.put(key, b'old')
+        with self.assertRaises(ValueError):
+            with self.backend.open_write(key) as fh:
+                fh.write(b'partial')
+                raise ValueError('failed')
+        self.assertEqual(self.get(key), b'old')
+        with self.assertRaises(ValueError):
+            with self.backend.open_write(self.backend.key('5678', 'al')) as fh:
+                raise ValueError('failed')
+        self.assertCountEqual(self.backend.keys(), [key])
+
+    def testDelete(self):
+        '''Test we delete files, and deleting missing files does nothing.'''
+        key = self.backend.key('1234', 'al')
+        self.put(key, b'1 2\n')
+        self.backend.delete(key)
+        self.assertFalse(self.backend.exists(key))
+        self.backend.delete(key)
+        with self.assertRaises(FileNotFoundError):
+            self.backend.size(key)
+        with self.assertRaises(FileNotFoundError):
+            self.backend.modified(key)
+
+    def testRename(self):
+        '''Test we rename files.'''
+        key = self.backend.key('1234', 'al.staged')
+        newkey = self.backend.key('1234', 'al')
+        self.put(key, b'1 2\n')
+        self.backend.rename(key, newkey)
+        self.assertFalse(self.backend.exists(key))
+        self.assertEqual(self.get(newkey), b'1 2\n')
+
+    def testKeys(self):
+        '''Test we list all the stored files.'''
+        keys = [self.backend.key(id, 'al') for id in ['1234', '5678', 'abcd']]
+        for key in keys:
+            self.put(key, b'1 2\n')
+        self.assertCountEqual(self.backend.keys(), keys)
+
+
+class TestLocalStorage(StorageTests, unittest.TestCase):
+    '''Test storage in a local directory.'''
+
+    def setUp(self):
+        self.backend = LocalStorage(mkdtemp())
+
+    def testLayout(self):
+        '''Test files stored under earlier layouts are found under their new keys.'''
+        key = self.backend.key('1234', 'al')
+        self.put('1234.al', b'1 2\n')
+        self.assertNotEqual(self.backend.relocate('1234.al'), '1234.al')
+        self.assertEqual(self.backend.relocate('1234.al'), key)
+        self.assertTrue(self.backend.exists(key))
+        self.assertEqual(self.get(key), b'1 2\n')
+        self.assertEqual(self.backend.local_path(key), self.backend.path('1234.al'))
+
+
+@unittest.skipIf(mock_aws is None, 'S3 storage tests need moto')
+class TestS3Storage(StorageTests, unittest.TestCase):
+    '''Test storage in an (imitation) S3 bucket.'''
+
+    def setUp(self):
+        from epydemicarchive.storage.s3 import S3Storage
+        self.mock = start_aws()
+        self.backend = S3Storage(BUCKET, prefix='networks/')
+        self.backend.client().create_bucket(Bucket=BUCKET)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def testPrefix(self):
+        '''Test files are stored under the prefix.'''
+        self.put(self.backend.key('1234', 'al'), b'1 2\n')
+        rc = self.backend.client().list_objects_v2(Bucket=BUCKET)
+        self.assertEqual([o['Key'] for o in rc['Contents']], ['networks/1234.al'])
+
+    def testURL(self):
+        '''Test we give clients URLs for files.'''
+        key = self.backend.key('1234', 'al')
+        self.assertIn(f'networks/{key}', self.backend.url(key))
+
+
+class StagedTests:
+    '''Tests that the files of networks are only kept if the networks
+    are committed, run against the backend set in self.config.'''
+
+    def setUp(self):
+        '''Create an empty archive with a user.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        Config.STORAGE_BACKEND = self.BACKEND
+        Config.S3_BUCKET = BUCKET
+        try:
+            self.app = create(Config)
+        finally:
+            Config.STORAGE_BACKEND = 'local'
+            Config.S3_BUCKET = None
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def network(self):
+        '''Create a network, without committing it.
+
+        :returns: the network'''
+        return upload(self.user, fast_gnp_random_graph(20, 0.2))
+
+    def testCommit(self):
+        '''Test a committed network's file is moved into place.'''
+        n = self.network()
+        (key, staged) = (n.filename, n.staged)
+        self.assertTrue(storage.exists(staged))
+        self.assertFalse(storage.exists(key))
+        db.session.commit()
+        self.assertIsNone(n.staged)
+        self.assertTrue(storage.exists(key))
+        self.assertFalse(storage.exists(staged))
+        self.assertEqual(n.load_network().order(), 20)
+
+    def testRollback(self):
+        '''Test a network that's rolled back leaves no file.'''
+        n = self.network()
+        (key, staged) = (n.filename, n.staged)
+        db.session.rollback()
+        self.assertFalse(storage.exists(key))
+        self.assertFalse(storage.exists(staged))
+        self.assertCountEqual(storage.keys(), [])
+
+    def testDelete(self):
+        '''Test a network's file is only deleted when its deletion commits.'''
+        n = self.network()
+        db.session.commit()
+        key = n.filename
+        Network.delete_network(n)
+        db.session.rollback()
+        self.assertTrue(storage.exists(key))
+        Network.delete_network(Network.from_uuid(n.id))
+        db.session.commit()
+        self.assertFalse(storage.exists(key))
+
+
+class TestLocalStaged(StagedTests, unittest.TestCase):
+    '''Test staging networks' files in local storage.'''
+
+    BACKEND = 'local'
+
+
+@unittest.skipIf(mock_aws is None, 'S3 storage tests need moto')
+class TestS3Staged(StagedTests, unittest.TestCase):
+    '''Test staging networks' files in S3.'''
+
+    BACKEND = 's3'
+
+    def setUp(self):
+        self.mock = start_aws()
+        super().setUp()
+        storage.client().create_bucket(Bucket=BUCKET)
+
+    def tearDown(self):
+        super().tearDown()
+        self.mock.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
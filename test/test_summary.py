@@ -0,0 +1,125 @@
+# Tests of network summaries
+#
+# Copyright (C) 2021 Simon Dobson
+#
+# This file is part of epydemicarchive, a server for complex network archives.
+#
+# epydemicerchive is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# epydemicarchive is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with epydemicarchive. If not, see <http://www.gnu.org/licenses/gpl.html>.
+
+import unittest
+from tempfile import mkdtemp
+from networkx import fast_gnp_random_graph
+from epydemicarchive import create, Config, db
+from epydemicarchive.auth.models import User
+from epydemicarchive.archive.models import Network, NetworkSummary, Metadata
+from helpers import upload
+
+
+class TestNetworkSummary(unittest.TestCase):
+    '''Test that summaries follow the networks they summarise.'''
+
+    def setUp(self):
+        '''Create an archive holding a network.'''
+        Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        Config.ARCHIVE_DIR = mkdtemp()
+        self.app = create(Config)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        user = User.create_user('test@test.com', 'xxx')
+        db.session.commit()
+
+        self.n = upload(user, fast_gnp_random_graph(20, 0.2), tags=['test', 'small'])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def metadata(self, kvs):
+        '''Add metadata to the network.
+
+        :param kvs: a dict of keys and values'''
+        for (k, v) in kvs.items():
+            db.session.add(Metadata(network=self.n, analyser='test', key=k, value=v))
+
+    def testCreated(self):
+        '''Test a new network is summarised.'''
+        s = NetworkSummary.query.get(self.n.id)
+        self.assertIsNotNone(s)
+        self.assertEqual(s.title, 'A network')
+        self.assertEqual(s.description, 'A test network')
+        self.assertEqual(s.owner_email, 'test@test.com')
+        self.assertEqual(s.uploaded, self.n.uploaded)
+        self.assertIsNone(s.analysis_error)
+        self.assertCountEqual(s.tagnames(), ['test', 'small'])
+        self.assertEqual(s.metadata_dict(), {})
+        for k in NetworkSummary.CORE:
+            self.assertIsNone(getattr(s, k))
+
+    def testTagString(self):
+        '''Test tags are delimited at both ends, so any can be matched by a substring.'''
+        self.assertEqual(NetworkSummary.tagstring(['a', 'b']), '|a|b|')
+        self.assertEqual(NetworkSummary.tagstring([]), '|')
+        self.assertIn('|small|', NetworkSummary.query.get(self.n.id).tags)
+
+    def testRefresh(self):
+        '''Test refreshing picks up edits and metadata in the same row.'''
+        self.n.title = 'A new title'
+        self.metadata({'N': '20', 'M': '38', 'kmean': '3.8', 'degree-distribution': 'ER'})
+        NetworkSummary.refresh(self.n)
+        db.session.commit()
+        self.assertEqual(NetworkSummary.query.count(), 1)
+        s = NetworkSummary.query.get(self.n.id)
+        self.assertEqual(s.title, 'A new title')
+        self.assertEqual(s.metadata_dict(), {'N': '20', 'M': '38', 'kmean': '3.8',
+                                             'degree-distribution': 'ER'})
+        self.assertEqual(s.N, 20)
+        self.assertEqual(s.M, 38)
+        self.assertEqual(s.kmean, 3.8)
+        self.assertIsNone(s.kmin)
+
+    def testCoreValues(self):
+        '''Test core metadata is converted to the columns' types, with
+        values that can't be converted left out.'''
+        self.metadata({'N': '20.0', 'kmin': 'many', 'kmax': '7'})
+        s = NetworkSummary.refresh(self.n)
+        db.session.commit()
+        self.assertEqual(s.N, 20)
+        self.assertIsInstance(s.N, int)
+        self.assertIsNone(s.kmin)
+        self.assertEqual(s.kmax, 7)
+        self.assertEqual(s.metadata_dict()['kmin'], 'many')
+
+    def testGeneration(self):
+        '''Test the generation only changes when a refresh is committed.'''
+        g = NetworkSummary.generation
+        NetworkSummary.refresh(self.n)
+        db.session.rollback()
+        self.assertEqual(NetworkSummary.generation, g)
+        NetworkSummary.refresh(self.n)
+        db.session.commit()
+        self.assertGreater(NetworkSummary.generation, g)
+
+    def testDeleted(self):
+        '''Test deleting a network deletes its summary.'''
+        id = self.n.id
+        Network.delete_network(self.n)
+        db.session.commit()
+        self.assertIsNone(NetworkSummary.query.get(id))
+
+
+if __name__ == '__main__':
+    unittest.main()